@@ -1,5 +1,5 @@
 ﻿from django.contrib import admin
-from .models import AnalysisResult, PortfolioValueHistory
+from .models import AnalysisResult, AnalysisRollup, LatestAnalysis, PortfolioValueHistory, PortfolioValueRollup
 
 
 @admin.register(AnalysisResult)
@@ -17,3 +17,24 @@ class PortfolioValueHistoryAdmin(admin.ModelAdmin):
     search_fields = ['portfolio__name']
     ordering = ['-record_date']
 
+
+@admin.register(LatestAnalysis)
+class LatestAnalysisAdmin(admin.ModelAdmin):
+    list_display = ['portfolio', 'analysis_date', 'updated_at']
+    search_fields = ['portfolio__name']
+
+
+@admin.register(PortfolioValueRollup)
+class PortfolioValueRollupAdmin(admin.ModelAdmin):
+    list_display = ['portfolio', 'granularity', 'period_start', 'period_end', 'close_value', 'samples']
+    list_filter = ['granularity']
+    search_fields = ['portfolio__name']
+    ordering = ['-period_start']
+
+
+@admin.register(AnalysisRollup)
+class AnalysisRollupAdmin(admin.ModelAdmin):
+    list_display = ['portfolio', 'granularity', 'period_start', 'period_end', 'health_score', 'samples']
+    list_filter = ['granularity']
+    search_fields = ['portfolio__name']
+    ordering = ['-period_start']
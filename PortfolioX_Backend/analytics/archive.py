@@ -0,0 +1,275 @@
+"""Columnar archive of AnalysisResult history.
+
+One directory per month (month=YYYY-MM) with an .npy file per column, rows
+sorted by (portfolio_id, analysis_date) so one portfolio's rows are a
+zero-copy slice of a memory-mapped file. Scalar metrics are float64 (NaN for
+NULL) and the integer scores int64. The JSON blobs are flattened into their
+own columns:
+
+    sector:<name>            sector weight, %
+    concentration:<key>      top_1_weight, top_5_weight, num_holdings
+    top<N>:symbol, :weight   N-th largest holding
+    recommendations:<type>   number of recommendations of that type
+
+Column files are named by position (c0.v3.npy, ...) with the names kept in
+manifest.json, so sector names need no escaping. Only finished days are
+exported (the analyzer only ever writes today's row), so archived days never
+change: readers take days up to manifest['through'] from here and anything
+later from the database.
+"""
+import json
+import os
+from datetime import date, timedelta
+from itertools import groupby
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import DecimalField, IntegerField
+
+from analytics.models import AnalysisResult
+from core.partitioning import month_start
+
+SCALAR_FIELDS = [
+    f.name for f in AnalysisResult._meta.concrete_fields
+    if isinstance(f, (DecimalField, IntegerField)) and not f.primary_key
+]
+INT_FIELDS = {
+    f.name for f in AnalysisResult._meta.concrete_fields
+    if isinstance(f, IntegerField) and not f.primary_key and not f.null
+}
+JSON_FIELDS = ['sector_allocation', 'concentration_data', 'top_holdings', 'recommendations']
+
+
+def flatten(row):
+    """One AnalysisResult .values() row -> {column: value} with the JSON blobs spread out"""
+    flat = {'portfolio_id': row['portfolio_id'], 'analysis_date': row['analysis_date']}
+    for name in SCALAR_FIELDS:
+        flat[name] = row[name]
+    for sector, weight in (row['sector_allocation'] or {}).items():
+        flat[f'sector:{sector}'] = weight
+    for key, value in (row['concentration_data'] or {}).items():
+        flat[f'concentration:{key}'] = value
+    for i, holding in enumerate(row['top_holdings'] or [], 1):
+        flat[f'top{i}:symbol'] = holding.get('symbol')
+        flat[f'top{i}:weight'] = holding.get('weight')
+    for rec in row['recommendations'] or []:
+        key = f"recommendations:{rec.get('type', 'other')}"
+        flat[key] = flat.get(key, 0) + 1
+    return flat
+
+
+def column_array(name, values):
+    """Pack one column; missing values become NaN, '' or 0 depending on its type"""
+    values = list(values)
+    if name == 'analysis_date':
+        return np.array(values, dtype='datetime64[D]')
+    if name.endswith(':symbol'):
+        return np.array([v or '' for v in values], dtype=str)
+    if name == 'portfolio_id' or name in INT_FIELDS or name.startswith('recommendations:'):
+        return np.array([v or 0 for v in values], dtype=np.int64)
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def to_python(array):
+    """Array -> list of JSON-ready Python values (NaN -> None, datetime64 -> date)"""
+    if array.dtype.kind == 'M':
+        return array.astype(object).tolist()
+    values = array.tolist()
+    if array.dtype.kind == 'f':
+        return [None if v != v else v for v in values]
+    return values
+
+
+class AnalysisArchive:
+
+    # Loaded month arrays per (directory, month, version)
+    _loaded = {}
+
+    def __init__(self, path=None):
+        self.path = Path(path or settings.ANALYSIS_ARCHIVE_DIR)
+
+    # ------------------------------------------------------------------ read
+
+    def through(self):
+        """Last archived day, or None if nothing has been exported"""
+        manifest = self._read_manifest()
+        if not manifest or not manifest['through']:
+            return None
+        return date.fromisoformat(manifest['through'])
+
+    def read(self, portfolio_id=None, start=None, end=None, columns=None):
+        """{column: array} for the archived rows in range, oldest month first.
+
+        Columns a month doesn't have (a sector that wasn't held yet, say) come
+        back filled with NaN/''/0. Without `columns` every archived column is returned.
+        """
+        manifest = self._read_manifest()
+        if not manifest:
+            return {}
+        months = sorted(
+            m for m in manifest['months']
+            if (not start or m >= f'{start:%Y-%m}') and (not end or m <= f'{end:%Y-%m}')
+        )
+        if columns is None:
+            columns = list(dict.fromkeys(c for m in months for c in manifest['months'][m]['columns']))
+        columns = list(dict.fromkeys(['portfolio_id', 'analysis_date', *columns]))
+
+        parts = []
+        for month in months:
+            arrays = self._load_month(month, manifest['months'][month])
+            rows = self._row_slice(arrays, portfolio_id, start, end)
+            count = len(arrays['portfolio_id'][rows])
+            if not count:
+                continue
+            parts.append({
+                name: arrays[name][rows] if name in arrays else column_array(name, [None] * count)
+                for name in columns
+            })
+
+        if not parts:
+            return {name: column_array(name, []) for name in columns}
+        return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+    def records(self, portfolio_id, start=None, end=None, columns=None):
+        """Archived rows of one portfolio as a list of dicts, oldest first"""
+        arrays = self.read(portfolio_id, start, end, columns)
+        if not arrays:
+            return []
+        names = [name for name in arrays if name != 'portfolio_id']
+        return [dict(zip(names, row)) for row in zip(*(to_python(arrays[name]) for name in names))]
+
+    def to_dataframe(self, **kwargs):
+        """The archive (or a slice of it, same arguments as read) as a pandas DataFrame for reporting"""
+        import pandas as pd
+        return pd.DataFrame(self.read(**kwargs))
+
+    @staticmethod
+    def _row_slice(arrays, portfolio_id, start, end):
+        dates = arrays['analysis_date']
+        if portfolio_id is None:
+            mask = np.ones(len(dates), dtype=bool)
+            if start:
+                mask &= dates >= np.datetime64(start, 'D')
+            if end:
+                mask &= dates <= np.datetime64(end, 'D')
+            return mask
+
+        # Rows are sorted by portfolio, then date
+        ids = arrays['portfolio_id']
+        lo = np.searchsorted(ids, portfolio_id)
+        hi = np.searchsorted(ids, portfolio_id, side='right')
+        if start:
+            lo += np.searchsorted(dates[lo:hi], np.datetime64(start, 'D'))
+        if end:
+            hi = lo + np.searchsorted(dates[lo:hi], np.datetime64(end, 'D'), side='right')
+        return slice(lo, hi)
+
+    def _load_month(self, month, info):
+        key = (self.path, month, info['version'])
+        cached = self._loaded.get(key)
+        if cached is not None:
+            return cached
+        directory = self.path / f'month={month}'
+        arrays = {
+            name: np.load(directory / f'c{i}.v{info["version"]}.npy', mmap_mode='r')
+            for i, name in enumerate(info['columns'])
+        }
+        for stale in [k for k in self._loaded if k[:2] == key[:2]]:
+            del self._loaded[stale]
+        self._loaded[key] = arrays
+        return arrays
+
+    def _read_manifest(self):
+        try:
+            with open(self.path / 'manifest.json') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # ----------------------------------------------------------------- write
+
+    def export(self, since=None, through=None):
+        """Archive analysis rows from `since` (default: the day after the last export)
+        up to `through` (default: yesterday). Returns the number of rows exported.
+
+        Months touched are rewritten as new versions. Archived rows of those
+        months are carried over unless the database has a row for the same
+        portfolio and day, so re-exporting a range never loses days the
+        database has since compacted away.
+        """
+        manifest = self._read_manifest() or {'through': None, 'months': {}}
+        through = through or date.today() - timedelta(days=1)
+        if since is None and manifest['through']:
+            since = date.fromisoformat(manifest['through']) + timedelta(days=1)
+        if since and since > through:
+            return 0
+
+        rows = AnalysisResult.objects.filter(analysis_date__lte=through)
+        if since:
+            rows = rows.filter(analysis_date__gte=since)
+        rows = rows.order_by('analysis_date').values('portfolio_id', 'analysis_date', *SCALAR_FIELDS, *JSON_FIELDS)
+
+        exported = 0
+        for month, group in groupby(rows.iterator(chunk_size=2000), key=lambda r: month_start(r['analysis_date'])):
+            flat = [flatten(row) for row in group]
+            key = f'{month:%Y-%m}'
+            carried = self._carry_over(key, manifest['months'].get(key), flat)
+            manifest['months'][key] = self._write_month(key, manifest['months'].get(key), flat, carried)
+            exported += len(flat)
+
+        if manifest['through'] is None or through > date.fromisoformat(manifest['through']):
+            manifest['through'] = str(through)
+        self._write_manifest(manifest)
+        return exported
+
+    def _carry_over(self, key, info, flat):
+        """Archived rows of a month that `flat` doesn't replace, as {column: array}"""
+        if not info:
+            return None
+        arrays = self._load_month(key, info)
+        replaced = self._row_keys(
+            column_array('portfolio_id', (row['portfolio_id'] for row in flat)),
+            column_array('analysis_date', (row['analysis_date'] for row in flat)),
+        )
+        keep = ~np.isin(self._row_keys(arrays['portfolio_id'], arrays['analysis_date']), replaced)
+        return {name: np.asarray(array[keep]) for name, array in arrays.items()}
+
+    @staticmethod
+    def _row_keys(portfolio_ids, dates):
+        # (portfolio, day) packed into one int64; day numbers stay below 10**6 for millennia
+        return np.asarray(portfolio_ids, dtype=np.int64) * 10**6 + np.asarray(dates).astype(np.int64)
+
+    def _write_month(self, key, info, flat, carried):
+        columns = list(dict.fromkeys(['portfolio_id', 'analysis_date', *SCALAR_FIELDS, *(c for row in flat for c in row)]))
+        if carried:
+            columns += [c for c in carried if c not in columns]
+        arrays = {name: column_array(name, (row.get(name) for row in flat)) for name in columns}
+        if carried:
+            count = len(carried['portfolio_id'])
+            arrays = {
+                name: np.concatenate([
+                    carried[name] if name in carried else column_array(name, [None] * count),
+                    array,
+                ])
+                for name, array in arrays.items()
+            }
+        order = np.lexsort((arrays['analysis_date'], arrays['portfolio_id']))
+
+        version = info['version'] + 1 if info else 1
+        directory = self.path / f'month={key}'
+        directory.mkdir(parents=True, exist_ok=True)
+        for i, name in enumerate(columns):
+            np.save(directory / f'c{i}.v{version}.npy', arrays[name][order])
+        # Keep the previous version for readers that loaded it a moment ago
+        for f in directory.glob('c*.v*.npy'):
+            if int(f.suffixes[-2][2:]) < version - 1:
+                f.unlink(missing_ok=True)
+        return {'version': version, 'columns': columns, 'rows': len(order)}
+
+    def _write_manifest(self, manifest):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / 'manifest.json.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.path / 'manifest.json')
@@ -0,0 +1,73 @@
+"""Async versions of the analytics read endpoints, served under ASGI.
+
+Same URLs, budgets, caching and payloads as analytics.views; analytics.urls
+picks these when settings.ASYNC_VIEWS is on (config.asgi turns it on). Each
+one runs the sync view's body (ownership check, queries, NumPy services) in a
+single sync_to_async call, so only the response cache lookup and the wait
+are async. While a request waits on the database, the worker's event loop
+keeps serving other requests.
+"""
+from adrf.decorators import api_view
+from asgiref.sync import sync_to_async
+from rest_framework.decorators import permission_classes
+from rest_framework.permissions import IsAuthenticated
+
+from analytics.views import (
+    READ_BUDGETS, _analysis_response, _chart_response, _dashboard_response, _performance_response,
+    _recommendations_response, _trends_response,
+)
+from core.querybudget import query_budget
+from core.response_cache import cached_response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['analysis'])
+async def get_portfolio_analysis(request, portfolio_id):
+    """Get latest analysis for a portfolio"""
+    return await sync_to_async(_analysis_response)(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['performance'])
+async def get_portfolio_performance(request, portfolio_id):
+    """Get historical performance data"""
+    return await sync_to_async(_performance_response)(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['chart'])
+async def get_portfolio_chart(request, portfolio_id):
+    """Portfolio value and benchmark close downsampled to ?points= (default 200)"""
+    return await sync_to_async(_chart_response)(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['trends'])
+async def get_portfolio_trends(request, portfolio_id):
+    """Metric trends from the analysis archive as parallel arrays"""
+    return await sync_to_async(_trends_response)(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['recommendations'])
+async def get_recommendations(request, portfolio_id):
+    """Get recommendations for a portfolio"""
+    return await sync_to_async(_recommendations_response)(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(READ_BUDGETS['dashboard'])
+async def get_dashboard(request):
+    """Summary of every active portfolio of the user in one response (two queries)"""
+    return await sync_to_async(_dashboard_response)(request)
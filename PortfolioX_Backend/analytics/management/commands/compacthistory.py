@@ -0,0 +1,29 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from analytics.services.history import HistoryCompactor, retention_cutoffs
+
+
+class Command(BaseCommand):
+    help = "Roll daily value/analysis history older than the retention window into weekly and monthly rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', type=str, metavar='YYYY-MM-DD', help='Compute retention cutoffs as of this date')
+        parser.add_argument('--dry-run', action='store_true', help='Only print the cutoffs that would be used')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['as_of']:
+            try:
+                today = datetime.strptime(options['as_of'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--as-of must be YYYY-MM-DD")
+
+        daily_cutoff, weekly_cutoff = retention_cutoffs(today)
+        self.stdout.write(f"Daily rows before {daily_cutoff} -> weekly rollups")
+        self.stdout.write(f"Weekly rollups before {weekly_cutoff} -> monthly rollups")
+        if options['dry_run']:
+            return
+
+        stats = HistoryCompactor.compact_all(today)
+        for key, count in stats.items():
+            self.stdout.write(f"  {key}: {count}")
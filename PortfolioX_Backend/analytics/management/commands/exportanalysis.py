@@ -0,0 +1,35 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from analytics.archive import AnalysisArchive
+
+
+class Command(BaseCommand):
+    help = "Export finished days of AnalysisResult history to the columnar archive, or dump it for reporting"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, metavar='YYYY-MM-DD', help='Re-export from this day instead of the last exported one')
+        parser.add_argument('--through', type=str, metavar='YYYY-MM-DD', help='Export up to this day (default: yesterday)')
+        parser.add_argument('--csv', type=str, metavar='PATH', help='Write the whole archive to a CSV file instead of exporting')
+
+    def handle(self, *args, **options):
+        archive = AnalysisArchive()
+
+        if options['csv']:
+            frame = archive.to_dataframe()
+            frame.to_csv(options['csv'], index=False)
+            self.stdout.write(f"Wrote {len(frame)} rows, {len(frame.columns)} columns to {options['csv']}")
+            return
+
+        since = self._parse_date(options['since'], '--since')
+        through = self._parse_date(options['through'], '--through')
+        exported = archive.export(since=since, through=through)
+        self.stdout.write(f"Exported {exported} analysis rows; archive now runs through {archive.through()}")
+
+    @staticmethod
+    def _parse_date(value, flag):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"{flag} must be YYYY-MM-DD")
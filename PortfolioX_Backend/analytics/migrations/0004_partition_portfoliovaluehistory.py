@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.db import migrations
+
+from core.partitioning import convert_to_partitioned
+
+
+def partition_value_history(apps, schema_editor):
+    convert_to_partitioned(schema_editor, apps.get_model('analytics', 'PortfolioValueHistory'), 'record_date')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_analysisresult_benchmark_return_1d_and_more'),
+    ]
+
+    operations = [
+        # Reversing leaves the table partitioned; it behaves the same as a plain table
+        migrations.RunPython(partition_value_history, migrations.RunPython.noop),
+    ]
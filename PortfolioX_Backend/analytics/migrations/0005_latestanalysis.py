@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_partition_portfoliovaluehistory'),
+        ('portfolios', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestAnalysis',
+            fields=[
+                ('portfolio', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_analysis', serialize=False, to='portfolios.portfolio')),
+                ('analysis_date', models.DateField()),
+                ('payload', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='analytics.analysisresult')),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_latestanalysis'),
+        ('portfolios', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('week', 'Weekly'), ('month', 'Monthly')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('health_score', models.IntegerField()),
+                ('diversification_score', models.IntegerField()),
+                ('sharpe_ratio', models.DecimalField(decimal_places=3, max_digits=6, null=True)),
+                ('return_ytd', models.DecimalField(decimal_places=2, max_digits=8, null=True)),
+                ('samples', models.IntegerField()),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='portfolios.portfolio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['portfolio', 'granularity', 'period_end'], name='idx_analysis_rollup')],
+                'unique_together': {('portfolio', 'granularity', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PortfolioValueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('week', 'Weekly'), ('month', 'Monthly')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('open_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('close_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('high_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('low_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('invested_value', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('samples', models.IntegerField()),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='portfolios.portfolio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['portfolio', 'granularity', 'period_end'], name='idx_pf_value_rollup')],
+                'unique_together': {('portfolio', 'granularity', 'period_start')},
+            },
+        ),
+    ]
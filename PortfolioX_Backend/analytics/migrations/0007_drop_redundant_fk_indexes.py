@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_history_rollups'),
+        ('portfolios', '0003_holding_idx_holdings_pf_value'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analysisresult',
+            name='portfolio',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='portfolios.portfolio'),
+        ),
+        migrations.AlterField(
+            model_name='portfoliovaluehistory',
+            name='portfolio',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='portfolios.portfolio'),
+        ),
+    ]
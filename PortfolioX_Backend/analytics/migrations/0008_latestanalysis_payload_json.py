@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+from core.renderers import dumps
+
+# Payload numbers stored as null when the metric was 0: (section or None, key, AnalysisResult field)
+NUMBERS = [
+    (None, 'risk_score', 'risk_score'),
+    (None, 'sharpe_ratio', 'sharpe_ratio'),
+    ('returns', '1d', 'return_1d'),
+    ('returns', '1w', 'return_1w'),
+    ('returns', '1m', 'return_1m'),
+    ('returns', '3m', 'return_3m'),
+    ('returns', '6m', 'return_6m'),
+    ('returns', '1y', 'return_1y'),
+    ('returns', 'ytd', 'return_ytd'),
+    ('benchmark_comparison', 'alpha', 'alpha'),
+    ('benchmark_comparison', 'beta', 'beta'),
+    ('benchmark_comparison', 'benchmark_return_ytd', 'benchmark_return_ytd'),
+    ('risk_metrics', 'volatility_30d', 'volatility_30d'),
+    ('risk_metrics', 'max_drawdown', 'max_drawdown'),
+    ('risk_metrics', 'var_95', 'var_95'),
+]
+
+
+def encode_payloads(apps, schema_editor):
+    LatestAnalysis = apps.get_model('analytics', 'LatestAnalysis')
+    for latest in LatestAnalysis.objects.select_related('analysis').iterator(chunk_size=500):
+        payload = latest.payload
+        for section, key, field in NUMBERS:
+            value = getattr(latest.analysis, field)
+            target = payload.get(section, {}) if section else payload
+            if key in target:
+                target[key] = float(value) if value is not None else None
+        latest.payload_json = dumps(payload)
+        latest.save(update_fields=['payload', 'payload_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='latestanalysis',
+            name='payload_json',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(encode_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+from core.renderers import dumps
+
+
+def encode_missing_payloads(apps, schema_editor):
+    # Every row written since 0008 has both; encode any that only has the JSON column
+    LatestAnalysis = apps.get_model('analytics', 'LatestAnalysis')
+    for latest in LatestAnalysis.objects.filter(payload_json__isnull=True).iterator(chunk_size=500):
+        latest.payload_json = dumps(latest.payload)
+        latest.save(update_fields=['payload_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_latestanalysis_payload_json'),
+    ]
+
+    operations = [
+        migrations.RunPython(encode_missing_payloads, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='latestanalysis',
+            name='payload_json',
+            field=models.BinaryField(default=b'{}'),
+        ),
+        migrations.RemoveField(
+            model_name='latestanalysis',
+            name='payload',
+        ),
+    ]
@@ -1,8 +1,17 @@
-﻿from django.db import models
+﻿import orjson
+from django.db import models
+from django.utils.functional import cached_property
+from core.renderers import PreRendered, dumps
 from portfolios.models import Portfolio
 
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
 class AnalysisResult(models.Model):
-    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    # No separate FK index: the (portfolio, analysis_date) unique index serves portfolio lookups in date order
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, db_index=False)
     analysis_date = models.DateField()
     
     # CORE SCORES
@@ -54,10 +63,96 @@ class AnalysisResult(models.Model):
     
     def __str__(self):
         return f"{self.portfolio.name} - {self.analysis_date}"
+    
+    def to_payload(self):
+        """API representation (without portfolio id/name), JSON-ready"""
+        return {
+            'analysis_date': str(self.analysis_date),
+            'health_score': self.health_score,
+            'diversification_score': self.diversification_score,
+            'risk_score': _number(self.risk_score),
+            'sharpe_ratio': _number(self.sharpe_ratio),
+            'returns': {
+                '1d': _number(self.return_1d),
+                '1w': _number(self.return_1w),
+                '1m': _number(self.return_1m),
+                '3m': _number(self.return_3m),
+                '6m': _number(self.return_6m),
+                '1y': _number(self.return_1y),
+                'ytd': _number(self.return_ytd),
+            },
+            'benchmark_comparison': {
+                'alpha': _number(self.alpha),
+                'beta': _number(self.beta),
+                'benchmark_return_ytd': _number(self.benchmark_return_ytd),
+            },
+            'risk_metrics': {
+                'volatility_30d': _number(self.volatility_30d),
+                'max_drawdown': _number(self.max_drawdown),
+                'var_95': _number(self.var_95),
+            },
+            'sector_allocation': self.sector_allocation,
+            'top_holdings': self.top_holdings,
+            'concentration_data': self.concentration_data,
+            'recommendations': self.recommendations,
+        }
+
+
+class LatestAnalysis(models.Model):
+    """Each portfolio's newest AnalysisResult with its API payload pre-built"""
+    portfolio = models.OneToOneField(Portfolio, on_delete=models.CASCADE, primary_key=True, related_name='latest_analysis')
+    analysis = models.ForeignKey(AnalysisResult, on_delete=models.CASCADE, related_name='+')
+    analysis_date = models.DateField()
+    # The payload encoded once at save time; the analysis endpoint sends these bytes as they are
+    payload_json = models.BinaryField(default=b'{}', editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @cached_property
+    def payload(self):
+        """The stored payload as a dict"""
+        return orjson.loads(self.payload_json)
+    
+    @classmethod
+    def refresh(cls, analysis):
+        """Point the portfolio at `analysis` unless a newer analysis is already current"""
+        payload_json = dumps(analysis.to_payload())
+        latest, created = cls.objects.get_or_create(
+            portfolio_id=analysis.portfolio_id,
+            defaults={'analysis': analysis, 'analysis_date': analysis.analysis_date, 'payload_json': payload_json}
+        )
+        if not created and latest.analysis_date <= analysis.analysis_date:
+            latest.analysis = analysis
+            latest.analysis_date = analysis.analysis_date
+            latest.payload_json = payload_json
+            latest.__dict__.pop('payload', None)
+            latest.save()
+        return latest
+    
+    def response_body(self):
+        """The analysis endpoint's JSON body: portfolio id and name spliced ahead of the stored payload"""
+        head = dumps({'portfolio_id': self.portfolio_id, 'portfolio_name': self.portfolio.name})
+        body = bytes(self.payload_json)
+        if body == b'{}':
+            return PreRendered(head)
+        return PreRendered(head[:-1] + b',' + body[1:])
+    
+    @classmethod
+    def get_for_portfolio(cls, portfolio_id):
+        """Current pointer, built from AnalysisResult on first use for older portfolios"""
+        latest = cls.objects.filter(portfolio_id=portfolio_id).first()
+        if latest is None:
+            analysis = AnalysisResult.objects.filter(
+                portfolio_id=portfolio_id
+            ).order_by('-analysis_date').first()
+            if analysis:
+                latest = cls.refresh(analysis)
+        return latest
 
 
 class PortfolioValueHistory(models.Model):
-    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    """Monthly range-partitioned on record_date under PostgreSQL (see core.partitioning)"""
+    # No separate FK index: the (portfolio, record_date) unique index serves portfolio lookups in date order
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, db_index=False)
     record_date = models.DateField()
     total_value = models.DecimalField(max_digits=14, decimal_places=2)
     invested_value = models.DecimalField(max_digits=14, decimal_places=2, null=True)
@@ -72,3 +167,50 @@ class PortfolioValueHistory(models.Model):
     
     def __str__(self):
         return f"{self.portfolio.name} - {self.record_date}: Rs{self.total_value}"
+
+
+class PortfolioValueRollup(models.Model):
+    """Weekly/monthly compaction of PortfolioValueHistory rows older than the daily window"""
+    GRANULARITY_CHOICES = [('week', 'Weekly'), ('month', 'Monthly')]
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()  # last record_date folded into this period
+    open_value = models.DecimalField(max_digits=14, decimal_places=2)
+    close_value = models.DecimalField(max_digits=14, decimal_places=2)
+    high_value = models.DecimalField(max_digits=14, decimal_places=2)
+    low_value = models.DecimalField(max_digits=14, decimal_places=2)
+    invested_value = models.DecimalField(max_digits=14, decimal_places=2, null=True)
+    samples = models.IntegerField()
+    
+    class Meta:
+        unique_together = ['portfolio', 'granularity', 'period_start']
+        indexes = [
+            models.Index(fields=['portfolio', 'granularity', 'period_end'], name='idx_pf_value_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.granularity} {self.period_start}: Rs{self.close_value}"
+
+
+class AnalysisRollup(models.Model):
+    """Period-end snapshot of AnalysisResult for compacted weeks/months"""
+    GRANULARITY_CHOICES = PortfolioValueRollup.GRANULARITY_CHOICES
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    period_end = models.DateField()  # analysis_date of the snapshot
+    health_score = models.IntegerField()
+    diversification_score = models.IntegerField()
+    sharpe_ratio = models.DecimalField(max_digits=6, decimal_places=3, null=True)
+    return_ytd = models.DecimalField(max_digits=8, decimal_places=2, null=True)
+    samples = models.IntegerField()
+    
+    class Meta:
+        unique_together = ['portfolio', 'granularity', 'period_start']
+        indexes = [
+            models.Index(fields=['portfolio', 'granularity', 'period_end'], name='idx_analysis_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.portfolio.name} - {self.granularity} {self.period_start}"
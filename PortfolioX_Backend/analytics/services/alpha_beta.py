@@ -1,7 +1,8 @@
 ﻿import numpy as np
 from datetime import datetime, timedelta
 from analytics.models import PortfolioValueHistory
-from market.models import BenchmarkPriceHistory
+from core.fixedpoint import DAILY_RETURN_SCALE, history_arrays
+from .returns_calculator import ReturnsCalculator
 from . import RISK_FREE_RATE
 
 
@@ -14,33 +15,30 @@ class AlphaBetaCalculator:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=days)
             
-            pf_history = PortfolioValueHistory.objects.filter(
-                portfolio_id=portfolio_id,
-                record_date__gte=start_date
-            ).order_by('record_date')
+            pf_history = history_arrays(
+                PortfolioValueHistory.objects.filter(
+                    portfolio_id=portfolio_id,
+                    record_date__gte=start_date
+                ).order_by('record_date'),
+                date_field='record_date',
+                returns=('daily_return', DAILY_RETURN_SCALE),
+            )
             
-            bm_history = BenchmarkPriceHistory.objects.filter(
-                benchmark_id=benchmark_id,
-                trade_date__gte=start_date
-            ).order_by('trade_date')
+            bm_dates, bm_closes = ReturnsCalculator.benchmark_closes(benchmark_id, start_date)
             
-            if pf_history.count() < 30 or bm_history.count() < 30:
+            if len(pf_history['dates']) < 30 or len(bm_closes) < 30:
                 return None, None
             
             pf_returns = []
             bm_returns = []
             
-            pf_dict = {h.record_date: float(h.daily_return or 0) for h in pf_history if h.daily_return}
+            pf_usable = ~np.isnan(pf_history['returns']) & (pf_history['returns'] != 0)
+            pf_dict = dict(zip(pf_history['dates'][pf_usable].tolist(), pf_history['returns'][pf_usable].tolist()))
             
-            bm_values = list(bm_history.values('trade_date', 'close_value'))
-            bm_dict = {}
-            for i in range(1, len(bm_values)):
-                date = bm_values[i]['trade_date']
-                close = float(bm_values[i]['close_value'])
-                prev_close = float(bm_values[i-1]['close_value'])
-                if prev_close and prev_close != 0:
-                    daily_ret = ((close - prev_close) / prev_close) * 100
-                    bm_dict[date] = daily_ret
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bm_daily = (bm_closes[1:] - bm_closes[:-1]) / bm_closes[:-1] * 100
+            usable = np.isfinite(bm_daily)
+            bm_dict = dict(zip(bm_dates[1:][usable].tolist(), bm_daily[usable].tolist()))
             
             common_dates = set(pf_dict.keys()) & set(bm_dict.keys())
             
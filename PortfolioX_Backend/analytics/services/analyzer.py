@@ -1,6 +1,9 @@
 ﻿from datetime import datetime
 from portfolios.models import Portfolio
-from analytics.models import AnalysisResult
+from analytics.models import AnalysisResult, LatestAnalysis
+from core import events
+from core.querybudget import QueryBudgetExceeded, query_budget
+from core.response_cache import invalidate_portfolio
 from .returns_calculator import ReturnsCalculator
 from .risk_metrics import RiskMetrics
 from .diversification import DiversificationScorer
@@ -12,29 +15,52 @@ from .recommender import RecommendationEngine
 class PortfolioAnalyzer:
     """Main orchestrator for portfolio analysis"""
     
+    # Max queries per step; returns/benchmark are one query per period (benchmark
+    # closes come from the price store when it is built), the rest are fixed
+    STEP_BUDGETS = {
+        'returns': 8,
+        'benchmark_returns': 8,
+        'risk_metrics': 4,
+        'diversification': 6,
+        'alpha_beta': 2,
+        'health_score': 0,
+        'recommendations': 0,
+        'save': 8,
+    }
+    
+    @staticmethod
+    def _step(name):
+        return query_budget(PortfolioAnalyzer.STEP_BUDGETS[name], f'analyzer.{name}')
+    
     @staticmethod
+    @query_budget(sum(STEP_BUDGETS.values()) + 1)
     def analyze_portfolio(portfolio_id):
         """Run complete portfolio analysis"""
         try:
             portfolio = Portfolio.objects.get(id=portfolio_id)
             
             # 1. Calculate returns
-            returns_data = ReturnsCalculator.calculate_portfolio_returns(portfolio_id)
+            with PortfolioAnalyzer._step('returns'):
+                returns_data = ReturnsCalculator.calculate_portfolio_returns(portfolio_id)
             
             # 2. Calculate benchmark returns
-            benchmark_returns = ReturnsCalculator.calculate_benchmark_returns(portfolio.benchmark_id)
+            with PortfolioAnalyzer._step('benchmark_returns'):
+                benchmark_returns = ReturnsCalculator.calculate_benchmark_returns(portfolio.benchmark_id)
             
             # 3. Calculate risk metrics
-            risk_data = RiskMetrics.calculate_all_metrics(portfolio_id)
+            with PortfolioAnalyzer._step('risk_metrics'):
+                risk_data = RiskMetrics.calculate_all_metrics(portfolio_id)
             
             # 4. Calculate diversification
-            div_score = DiversificationScorer.calculate_score(portfolio_id)
-            sector_allocation = DiversificationScorer.get_sector_allocation(portfolio_id)
-            top_holdings = DiversificationScorer.get_top_holdings(portfolio_id)
-            concentration = DiversificationScorer.get_concentration_data(portfolio_id)
+            with PortfolioAnalyzer._step('diversification'):
+                div_score = DiversificationScorer.calculate_score(portfolio_id)
+                sector_allocation = DiversificationScorer.get_sector_allocation(portfolio_id)
+                top_holdings = DiversificationScorer.get_top_holdings(portfolio_id)
+                concentration = DiversificationScorer.get_concentration_data(portfolio_id)
             
             # 5. Calculate alpha and beta
-            alpha, beta = AlphaBetaCalculator.calculate(portfolio_id, portfolio.benchmark_id)
+            with PortfolioAnalyzer._step('alpha_beta'):
+                alpha, beta = AlphaBetaCalculator.calculate(portfolio_id, portfolio.benchmark_id)
             
             # 6. Combine all data
             analysis_data = {
@@ -50,22 +76,36 @@ class PortfolioAnalyzer:
             }
             
             # 7. Calculate health score
-            health_score = HealthCalculator.calculate_health_score(portfolio_id, analysis_data)
+            with PortfolioAnalyzer._step('health_score'):
+                health_score = HealthCalculator.calculate_health_score(portfolio_id, analysis_data)
             analysis_data['health_score'] = health_score
             
             # 8. Generate recommendations
-            recommendations = RecommendationEngine.generate_recommendations(portfolio_id, analysis_data)
+            with PortfolioAnalyzer._step('recommendations'):
+                recommendations = RecommendationEngine.generate_recommendations(portfolio_id, analysis_data)
             analysis_data['recommendations'] = recommendations
             
             # 9. Save to database
-            analysis_result = AnalysisResult.objects.update_or_create(
-                portfolio_id=portfolio_id,
-                analysis_date=datetime.now().date(),
-                defaults=analysis_data
-            )
+            with PortfolioAnalyzer._step('save'):
+                analysis_result, _ = AnalysisResult.objects.update_or_create(
+                    portfolio_id=portfolio_id,
+                    analysis_date=datetime.now().date(),
+                    defaults=analysis_data
+                )
+                LatestAnalysis.refresh(analysis_result)
+            invalidate_portfolio(portfolio_id)
+            events.publish(portfolio.user_id, 'analysis.completed', {
+                'portfolio_id': portfolio_id,
+                'analysis_date': analysis_result.analysis_date,
+                'health_score': health_score,
+                'diversification_score': div_score,
+            })
             
             return analysis_data
         
+        except QueryBudgetExceeded:
+            # A budget overrun is a bug for tests to see, not a failed analysis
+            raise
         except Exception as e:
             print(f"Error analyzing portfolio {portfolio_id}: {e}")
             return None
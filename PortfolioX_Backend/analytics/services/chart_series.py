@@ -0,0 +1,90 @@
+"""Downsampled chart series for portfolio value against its benchmark.
+
+A chart is a few hundred pixels wide, so however long the history is the
+series is reduced to at most `points` points with Largest-Triangle-Three-
+Buckets, which keeps the peaks and troughs a line chart needs. The benchmark
+close is aligned to the portfolio's dates (the last close on or before each
+date) and sampled at the same points, so every series shares one dates array.
+"""
+import numpy as np
+
+from analytics.services.history import HistoryReader
+from analytics.services.returns_calculator import ReturnsCalculator
+
+DEFAULT_POINTS = 200
+MIN_POINTS = 10
+MAX_POINTS = 1000
+
+
+def lttb(x, y, threshold):
+    """Indices of `threshold` points of (x, y) chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every point in between is the
+    one of its bucket forming the largest triangle with the previously kept
+    point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 2 buckets between the first and last point
+    bounds = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(int) + 1
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        if i + 2 < len(bounds):
+            next_x, next_y = x[hi:bounds[i + 2]].mean(), y[hi:bounds[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+class ChartSeriesBuilder:
+
+    @staticmethod
+    def clamp_points(value):
+        try:
+            return max(MIN_POINTS, min(int(value), MAX_POINTS))
+        except (TypeError, ValueError):
+            return DEFAULT_POINTS
+
+    @staticmethod
+    def build(portfolio_id, benchmark_id, start_date, points=DEFAULT_POINTS):
+        """{'source_points', 'dates', 'total_value', 'invested_value', 'benchmark_close'}
+        as parallel arrays of at most `points` entries, oldest first.
+
+        benchmark_close is None before the benchmark's first close and when the
+        portfolio has no benchmark.
+        """
+        rows = HistoryReader.value_series(portfolio_id, start_date)
+        dates = np.array([r['date'] for r in rows], dtype='datetime64[D]')
+        total = np.array([float(r['total_value']) for r in rows])
+        invested = np.array([float(r['invested_value'] or 0) for r in rows])
+
+        days = dates.astype(np.int64)
+        keep = lttb(days, total, points)
+        dates, total, invested = dates[keep], total[keep], invested[keep]
+
+        benchmark = np.full(len(dates), np.nan)
+        if benchmark_id and len(dates):
+            bm_dates, bm_closes = ReturnsCalculator.benchmark_closes(benchmark_id, start_date)
+            if len(bm_dates):
+                at = np.searchsorted(bm_dates, dates, side='right') - 1
+                known = at >= 0
+                benchmark[known] = bm_closes[at[known]]
+
+        return {
+            'source_points': len(rows),
+            'dates': np.datetime_as_string(dates).tolist(),
+            'total_value': np.round(total, 2).tolist(),
+            'invested_value': np.round(invested, 2).tolist(),
+            'benchmark_close': [None if np.isnan(v) else v for v in np.round(benchmark, 2).tolist()],
+        }
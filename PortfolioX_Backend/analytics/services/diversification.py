@@ -1,5 +1,5 @@
 ﻿import numpy as np
-from portfolios.models import Holding
+from portfolios.models import Holding, SectorExposure
 from market.models import Stock
 
 
@@ -8,9 +8,9 @@ class DiversificationScorer:
     @staticmethod
     def calculate_score(portfolio_id):
         """Calculate diversification score (0-100)"""
-        holdings = Holding.objects.filter(portfolio_id=portfolio_id).select_related('stock', 'stock__sector')
+        holdings = list(Holding.objects.filter(portfolio_id=portfolio_id))
         
-        if holdings.count() == 0:
+        if not holdings:
             return 0
         
         total_value = sum(float(h.current_value or 0) for h in holdings)
@@ -19,8 +19,8 @@ class DiversificationScorer:
             return 0
         
         stock_score = DiversificationScorer._stock_concentration_score(holdings, total_value)
-        sector_score = DiversificationScorer._sector_diversification_score(holdings, total_value)
-        count_score = DiversificationScorer._holdings_count_score(holdings.count())
+        sector_score = DiversificationScorer._sector_diversification_score(SectorExposure.allocation(portfolio_id))
+        count_score = DiversificationScorer._holdings_count_score(len(holdings))
         
         final_score = (stock_score * 0.4) + (sector_score * 0.4) + (count_score * 0.2)
         
@@ -51,15 +51,8 @@ class DiversificationScorer:
             return 100
     
     @staticmethod
-    def _sector_diversification_score(holdings, total_value):
-        """Score based on sector allocation"""
-        sector_weights = {}
-        
-        for h in holdings:
-            sector_name = h.stock.sector.name if h.stock.sector else 'Unknown'
-            weight = (float(h.current_value or 0) / total_value) * 100
-            sector_weights[sector_name] = sector_weights.get(sector_name, 0) + weight
-        
+    def _sector_diversification_score(sector_weights):
+        """Score based on sector allocation ({sector: weight %})"""
         if not sector_weights:
             return 0
         
@@ -105,20 +98,7 @@ class DiversificationScorer:
     @staticmethod
     def get_sector_allocation(portfolio_id):
         """Get sector allocation as JSON"""
-        holdings = Holding.objects.filter(portfolio_id=portfolio_id).select_related('stock', 'stock__sector')
-        
-        total_value = sum(float(h.current_value or 0) for h in holdings)
-        
-        if total_value == 0:
-            return {}
-        
-        sector_allocation = {}
-        for h in holdings:
-            sector_name = h.stock.sector.name if h.stock.sector else 'Unknown'
-            weight = (float(h.current_value or 0) / total_value) * 100
-            sector_allocation[sector_name] = round(sector_allocation.get(sector_name, 0) + weight, 2)
-        
-        return sector_allocation
+        return SectorExposure.allocation(portfolio_id)
     
     @staticmethod
     def get_top_holdings(portfolio_id, limit=5):
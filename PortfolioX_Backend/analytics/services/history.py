@@ -0,0 +1,347 @@
+"""Tiered retention for portfolio value and analysis history.
+
+Daily rows are kept for HISTORY_DAILY_RETENTION_DAYS. Older days are folded
+into weekly rollups (weeks start on Monday), and weekly rollups older than
+HISTORY_WEEKLY_RETENTION_DAYS are folded into monthly ones. Cutoffs are
+aligned to week/month starts so a rollup only ever covers whole periods.
+
+HistoryReader stitches the tiers back into one date-ordered series: monthly
+rollups, then weekly, then daily rows, each tier only covering dates before
+the first row of the finer tier. Analysis history that has been exported to
+the columnar archive (analytics.archive) is read from there rather than from
+the database.
+"""
+from datetime import date, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+
+from analytics.archive import JSON_FIELDS, SCALAR_FIELDS, AnalysisArchive, column_array, flatten, to_python
+from analytics.models import (AnalysisResult, AnalysisRollup, LatestAnalysis, PortfolioValueHistory,
+                              PortfolioValueRollup)
+from core.partitioning import month_start
+from core.response_cache import invalidate_portfolio
+
+ANALYSIS_FIELDS = ['health_score', 'diversification_score', 'sharpe_ratio', 'return_ytd']
+
+
+def week_start(d):
+    return d - timedelta(days=d.weekday())
+
+
+def retention_cutoffs(today=None):
+    """(daily cutoff, weekly cutoff): rows before each are compacted to the next tier"""
+    today = today or date.today()
+    daily = week_start(today - timedelta(days=settings.HISTORY_DAILY_RETENTION_DAYS))
+    weekly = month_start(today - timedelta(days=settings.HISTORY_WEEKLY_RETENTION_DAYS))
+    return daily, min(weekly, daily)
+
+
+class HistoryCompactor:
+
+    @staticmethod
+    def compact_all(today=None):
+        """Compact every portfolio's history; returns row counts per tier"""
+        daily_cutoff, weekly_cutoff = retention_cutoffs(today)
+        stats = {'value_days': 0, 'value_weeks': 0, 'analysis_days': 0, 'analysis_weeks': 0}
+
+        portfolio_ids = set(
+            PortfolioValueHistory.objects.filter(record_date__lt=daily_cutoff)
+            .values_list('portfolio_id', flat=True).distinct()
+        ) | set(
+            AnalysisResult.objects.filter(analysis_date__lt=daily_cutoff)
+            .values_list('portfolio_id', flat=True).distinct()
+        ) | set(
+            PortfolioValueRollup.objects.filter(granularity='week', period_start__lt=weekly_cutoff)
+            .values_list('portfolio_id', flat=True).distinct()
+        ) | set(
+            AnalysisRollup.objects.filter(granularity='week', period_start__lt=weekly_cutoff)
+            .values_list('portfolio_id', flat=True).distinct()
+        )
+
+        for portfolio_id in sorted(portfolio_ids):
+            try:
+                with transaction.atomic():
+                    stats['value_days'] += HistoryCompactor.compact_values(portfolio_id, daily_cutoff)
+                    stats['value_weeks'] += HistoryCompactor.compact_value_weeks(portfolio_id, weekly_cutoff)
+                    stats['analysis_days'] += HistoryCompactor.compact_analyses(portfolio_id, daily_cutoff)
+                    stats['analysis_weeks'] += HistoryCompactor.compact_analysis_weeks(portfolio_id, weekly_cutoff)
+                    invalidate_portfolio(portfolio_id)
+            except Exception as e:
+                print(f"Failed to compact history for portfolio {portfolio_id}: {e}")
+
+        return stats
+
+    @staticmethod
+    def compact_values(portfolio_id, cutoff):
+        """Fold daily value rows before cutoff into weekly rollups and delete them"""
+        daily = PortfolioValueHistory.objects.filter(portfolio_id=portfolio_id, record_date__lt=cutoff)
+        rows = list(daily.order_by('record_date').values('record_date', 'total_value', 'invested_value'))
+        if not rows:
+            return 0
+
+        rollups = [
+            HistoryCompactor._value_rollup(portfolio_id, 'week', start, [
+                {'start': r['record_date'], 'end': r['record_date'], 'open': r['total_value'],
+                 'close': r['total_value'], 'high': r['total_value'], 'low': r['total_value'],
+                 'invested': r['invested_value'], 'samples': 1}
+                for r in group
+            ])
+            for start, group in groupby(rows, key=lambda r: week_start(r['record_date']))
+        ]
+        HistoryCompactor._save_value_rollups(portfolio_id, 'week', rollups)
+        daily.delete()
+        return len(rows)
+
+    @staticmethod
+    def compact_value_weeks(portfolio_id, cutoff):
+        """Fold weekly value rollups starting before cutoff into monthly rollups"""
+        weekly = PortfolioValueRollup.objects.filter(
+            portfolio_id=portfolio_id, granularity='week', period_start__lt=cutoff
+        )
+        rows = list(weekly.order_by('period_start'))
+        if not rows:
+            return 0
+
+        rollups = [
+            HistoryCompactor._value_rollup(portfolio_id, 'month', start, [
+                {'start': r.period_start, 'end': r.period_end, 'open': r.open_value,
+                 'close': r.close_value, 'high': r.high_value, 'low': r.low_value,
+                 'invested': r.invested_value, 'samples': r.samples}
+                for r in group
+            ])
+            for start, group in groupby(rows, key=lambda r: month_start(r.period_start))
+        ]
+        HistoryCompactor._save_value_rollups(portfolio_id, 'month', rollups)
+        weekly.delete()
+        return len(rows)
+
+    @staticmethod
+    def compact_analyses(portfolio_id, cutoff):
+        """Keep the last analysis of each week before cutoff as a weekly snapshot.
+
+        The analysis LatestAnalysis points at stays a daily row (deleting it would
+        cascade to the pointer) until a newer analysis replaces it.
+        """
+        daily = AnalysisResult.objects.filter(portfolio_id=portfolio_id, analysis_date__lt=cutoff).exclude(
+            pk__in=LatestAnalysis.objects.filter(portfolio_id=portfolio_id).values('analysis_id')
+        )
+        rows = list(daily.order_by('analysis_date').values('analysis_date', *ANALYSIS_FIELDS))
+        if not rows:
+            return 0
+
+        snapshots = [
+            HistoryCompactor._analysis_rollup(portfolio_id, 'week', start, [
+                dict(r, end=r['analysis_date'], samples=1) for r in group
+            ])
+            for start, group in groupby(rows, key=lambda r: week_start(r['analysis_date']))
+        ]
+        HistoryCompactor._save_analysis_rollups(portfolio_id, 'week', snapshots)
+        daily.delete()
+        return len(rows)
+
+    @staticmethod
+    def compact_analysis_weeks(portfolio_id, cutoff):
+        """Fold weekly analysis snapshots starting before cutoff into monthly ones"""
+        weekly = AnalysisRollup.objects.filter(
+            portfolio_id=portfolio_id, granularity='week', period_start__lt=cutoff
+        )
+        rows = list(weekly.order_by('period_start').values('period_start', 'period_end', 'samples', *ANALYSIS_FIELDS))
+        if not rows:
+            return 0
+
+        snapshots = [
+            HistoryCompactor._analysis_rollup(portfolio_id, 'month', start, [
+                dict(r, end=r['period_end']) for r in group
+            ])
+            for start, group in groupby(rows, key=lambda r: month_start(r['period_start']))
+        ]
+        HistoryCompactor._save_analysis_rollups(portfolio_id, 'month', snapshots)
+        weekly.delete()
+        return len(rows)
+
+    @staticmethod
+    def _value_rollup(portfolio_id, granularity, period_start, parts):
+        return PortfolioValueRollup(
+            portfolio_id=portfolio_id,
+            granularity=granularity,
+            period_start=period_start,
+            period_end=parts[-1]['end'],
+            open_value=parts[0]['open'],
+            close_value=parts[-1]['close'],
+            high_value=max(p['high'] for p in parts),
+            low_value=min(p['low'] for p in parts),
+            invested_value=parts[-1]['invested'],
+            samples=sum(p['samples'] for p in parts),
+        )
+
+    @staticmethod
+    def _analysis_rollup(portfolio_id, granularity, period_start, parts):
+        last = parts[-1]
+        return AnalysisRollup(
+            portfolio_id=portfolio_id,
+            granularity=granularity,
+            period_start=period_start,
+            period_end=last['end'],
+            samples=sum(p['samples'] for p in parts),
+            **{field: last[field] for field in ANALYSIS_FIELDS},
+        )
+
+    @staticmethod
+    def _save_value_rollups(portfolio_id, granularity, rollups):
+        """Upsert rollups, merging with any already stored for the same period"""
+        existing = {
+            r.period_start: r for r in PortfolioValueRollup.objects.filter(
+                portfolio_id=portfolio_id, granularity=granularity,
+                period_start__in=[r.period_start for r in rollups]
+            )
+        }
+        for rollup in rollups:
+            old = existing.get(rollup.period_start)
+            if old is None:
+                continue
+            # A re-run can only add later dates to a period (earlier ones were already compacted)
+            first, last = (old, rollup) if old.period_end <= rollup.period_end else (rollup, old)
+            rollup.open_value = first.open_value
+            rollup.close_value = last.close_value
+            rollup.invested_value = last.invested_value
+            rollup.period_end = last.period_end
+            rollup.high_value = max(old.high_value, rollup.high_value)
+            rollup.low_value = min(old.low_value, rollup.low_value)
+            rollup.samples += old.samples
+
+        PortfolioValueRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['portfolio', 'granularity', 'period_start'],
+            update_fields=['period_end', 'open_value', 'close_value', 'high_value', 'low_value',
+                           'invested_value', 'samples'],
+        )
+
+    @staticmethod
+    def _save_analysis_rollups(portfolio_id, granularity, snapshots):
+        existing = {
+            r.period_start: r for r in AnalysisRollup.objects.filter(
+                portfolio_id=portfolio_id, granularity=granularity,
+                period_start__in=[s.period_start for s in snapshots]
+            )
+        }
+        for snapshot in snapshots:
+            old = existing.get(snapshot.period_start)
+            if old is None:
+                continue
+            snapshot.samples += old.samples
+            if old.period_end > snapshot.period_end:
+                snapshot.period_end = old.period_end
+                for field in ANALYSIS_FIELDS:
+                    setattr(snapshot, field, getattr(old, field))
+
+        AnalysisRollup.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=['portfolio', 'granularity', 'period_start'],
+            update_fields=['period_end', 'samples', *ANALYSIS_FIELDS],
+        )
+
+
+class HistoryReader:
+
+    @staticmethod
+    def value_series(portfolio_id, start_date, end_date=None):
+        """[{'date', 'total_value', 'invested_value'}] across all tiers, oldest first.
+
+        Rollups contribute their period-end (close) value dated at period_end.
+        """
+        daily = PortfolioValueHistory.objects.filter(portfolio_id=portfolio_id, record_date__gte=start_date)
+        if end_date:
+            daily = daily.filter(record_date__lte=end_date)
+        rows = [
+            {'date': r['record_date'], 'total_value': r['total_value'], 'invested_value': r['invested_value']}
+            for r in daily.order_by('record_date').values('record_date', 'total_value', 'invested_value')
+        ]
+        if not HistoryReader._needs_rollups(start_date):
+            return rows
+
+        def rollup_rows(granularity, before):
+            rollups = PortfolioValueRollup.objects.filter(
+                portfolio_id=portfolio_id, granularity=granularity, period_end__gte=start_date
+            )
+            if before:
+                rollups = rollups.filter(period_end__lt=before)
+            if end_date:
+                rollups = rollups.filter(period_end__lte=end_date)
+            return [
+                {'date': r['period_end'], 'total_value': r['close_value'], 'invested_value': r['invested_value']}
+                for r in rollups.order_by('period_end').values('period_end', 'close_value', 'invested_value')
+            ]
+
+        return HistoryReader._stitch(rows, rollup_rows, 'date')
+
+    @staticmethod
+    def analysis_series(portfolio_id, start_date):
+        """[{'analysis_date', 'return_ytd', 'health_score', 'diversification_score', 'sharpe_ratio'}]
+        across all tiers, oldest first; rollups contribute their period-end snapshot.
+        """
+        fields = ['return_ytd', 'health_score', 'diversification_score', 'sharpe_ratio']
+        archive = AnalysisArchive()
+        through = archive.through()
+        rows = archive.records(portfolio_id, start_date, columns=fields) if through else []
+        recent = AnalysisResult.objects.filter(portfolio_id=portfolio_id, analysis_date__gte=start_date)
+        if through:
+            recent = recent.filter(analysis_date__gt=through)
+        rows += list(recent.order_by('analysis_date').values('analysis_date', *fields))
+        if not HistoryReader._needs_rollups(start_date):
+            return rows
+
+        def rollup_rows(granularity, before):
+            rollups = AnalysisRollup.objects.filter(
+                portfolio_id=portfolio_id, granularity=granularity, period_end__gte=start_date
+            )
+            if before:
+                rollups = rollups.filter(period_end__lt=before)
+            return [
+                {'analysis_date': r.pop('period_end'), **r}
+                for r in rollups.order_by('period_end').values('period_end', *fields)
+            ]
+
+        return HistoryReader._stitch(rows, rollup_rows, 'analysis_date')
+
+    @staticmethod
+    def analysis_trends(portfolio_id, start_date, metrics):
+        """{'dates': [...], metric: [...]} parallel arrays for archive columns
+        (flattened metric names such as 'sector:Technology' work too).
+
+        Archived days come from the archive; days after it from the database.
+        """
+        archive = AnalysisArchive()
+        through = archive.through()
+        arrays = archive.read(portfolio_id, start_date, columns=metrics) if through else {}
+        recent = AnalysisResult.objects.filter(portfolio_id=portfolio_id, analysis_date__gte=start_date)
+        if through:
+            recent = recent.filter(analysis_date__gt=through)
+        flat = [
+            flatten(row) for row in recent.order_by('analysis_date')
+            .values('portfolio_id', 'analysis_date', *SCALAR_FIELDS, *JSON_FIELDS)
+        ]
+
+        trends = {}
+        for name in ['analysis_date', *metrics]:
+            values = to_python(arrays[name]) if arrays else []
+            trends[name] = values + to_python(column_array(name, (row.get(name) for row in flat)))
+        trends['dates'] = trends.pop('analysis_date')
+        return trends
+
+    @staticmethod
+    def _needs_rollups(start_date):
+        # Everything from the daily cutoff on is still stored daily
+        return start_date < retention_cutoffs()[0]
+
+    @staticmethod
+    def _stitch(daily, rollup_rows, date_key):
+        """Prepend weekly then monthly rows that end before the first row of the finer tier"""
+        before = daily[0][date_key] if daily else None
+        weekly = rollup_rows('week', before)
+        before = weekly[0][date_key] if weekly else before
+        monthly = rollup_rows('month', before)
+        return monthly + weekly + daily
@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 from portfolios.models import Portfolio, Holding
 from market.models import StockPriceHistory, BenchmarkPriceHistory
 from analytics.models import PortfolioValueHistory
+from market.price_store import PriceStore
+from core.fixedpoint import PAISE, fixed_point_array, history_arrays
 
 
 class ReturnsCalculator:
@@ -42,11 +44,13 @@ class ReturnsCalculator:
                 record_date__lte=end_date
             ).order_by('record_date')
             
-            if history.count() < 2:
+            values = fixed_point_array(history, 'total_value', PAISE)
+            
+            if len(values) < 2:
                 return None
             
-            start_value = float(history.first().total_value)
-            end_value = float(history.last().total_value)
+            start_value = float(values[0])
+            end_value = float(values[-1])
             
             if start_value == 0:
                 return None
@@ -71,11 +75,13 @@ class ReturnsCalculator:
                 record_date__lte=end_date
             ).order_by('record_date')
             
-            if history.count() < 2:
+            values = fixed_point_array(history, 'total_value', PAISE)
+            
+            if len(values) < 2:
                 return None
             
-            start_value = float(history.first().total_value)
-            end_value = float(history.last().total_value)
+            start_value = float(values[0])
+            end_value = float(values[-1])
             
             if start_value == 0:
                 return None
@@ -114,17 +120,13 @@ class ReturnsCalculator:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=days)
             
-            history = BenchmarkPriceHistory.objects.filter(
-                benchmark_id=benchmark_id,
-                trade_date__gte=start_date,
-                trade_date__lte=end_date
-            ).order_by('trade_date')
+            _, closes = ReturnsCalculator.benchmark_closes(benchmark_id, start_date, end_date)
             
-            if history.count() < 2:
+            if len(closes) < 2:
                 return None
             
-            start_value = float(history.first().close_value)
-            end_value = float(history.last().close_value)
+            start_value = float(closes[0])
+            end_value = float(closes[-1])
             
             if start_value == 0:
                 return None
@@ -142,17 +144,13 @@ class ReturnsCalculator:
             end_date = datetime.now().date()
             start_date = datetime(end_date.year, 1, 1).date()
             
-            history = BenchmarkPriceHistory.objects.filter(
-                benchmark_id=benchmark_id,
-                trade_date__gte=start_date,
-                trade_date__lte=end_date
-            ).order_by('trade_date')
+            _, closes = ReturnsCalculator.benchmark_closes(benchmark_id, start_date, end_date)
             
-            if history.count() < 2:
+            if len(closes) < 2:
                 return None
             
-            start_value = float(history.first().close_value)
-            end_value = float(history.last().close_value)
+            start_value = float(closes[0])
+            end_value = float(closes[-1])
             
             if start_value == 0:
                 return None
@@ -163,6 +161,24 @@ class ReturnsCalculator:
         except Exception:
             return None
     
+    @staticmethod
+    def benchmark_closes(benchmark_id, start_date, end_date=None):
+        """Benchmark (dates, closes) in the window, from the price store when it has the index"""
+        stored = PriceStore.benchmarks().series(id=benchmark_id, start=start_date, end=end_date)
+        if stored is not None:
+            dates, closes = stored
+            observed = ~np.isnan(closes)
+            return dates[observed], closes[observed]
+        
+        history = BenchmarkPriceHistory.objects.filter(
+            benchmark_id=benchmark_id,
+            trade_date__gte=start_date
+        )
+        if end_date:
+            history = history.filter(trade_date__lte=end_date)
+        history = history_arrays(history.order_by('trade_date'), date_field='trade_date', closes=('close_value', PAISE))
+        return history['dates'], history['closes']
+    
     @staticmethod
     def update_daily_returns(portfolio_id):
         """Calculate and update daily returns for portfolio value history"""
@@ -2,6 +2,7 @@
 import numpy as np
 from datetime import datetime, timedelta
 from analytics.models import PortfolioValueHistory
+from core.fixedpoint import PAISE, DAILY_RETURN_SCALE, fixed_point_array, history_arrays
 from . import RISK_FREE_RATE
 
 
@@ -27,9 +28,10 @@ class RiskMetrics:
             history = PortfolioValueHistory.objects.filter(
                 portfolio_id=portfolio_id,
                 record_date__gte=start_date
-            ).order_by('record_date').values_list('daily_return', flat=True)
+            ).order_by('record_date')
             
-            returns = [float(r) for r in history if r is not None]
+            returns = fixed_point_array(history, 'daily_return', DAILY_RETURN_SCALE)
+            returns = returns[~np.isnan(returns)]
             
             if len(returns) < 10:
                 return None
@@ -50,14 +52,13 @@ class RiskMetrics:
             history = PortfolioValueHistory.objects.filter(
                 portfolio_id=portfolio_id,
                 record_date__gte=start_date
-            ).order_by('record_date').values_list('total_value', flat=True)
+            ).order_by('record_date')
             
-            values = [float(v) for v in history]
+            cumulative = fixed_point_array(history, 'total_value', PAISE)
             
-            if len(values) < 10:
+            if len(cumulative) < 10:
                 return None
             
-            cumulative = np.array(values)
             running_max = np.maximum.accumulate(cumulative)
             drawdown = (cumulative - running_max) / running_max * 100
             max_dd = drawdown.min()
@@ -74,18 +75,22 @@ class RiskMetrics:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=90)
             
-            history = PortfolioValueHistory.objects.filter(
-                portfolio_id=portfolio_id,
-                record_date__gte=start_date
-            ).order_by('record_date')
+            history = history_arrays(
+                PortfolioValueHistory.objects.filter(
+                    portfolio_id=portfolio_id,
+                    record_date__gte=start_date
+                ).order_by('record_date'),
+                values=('total_value', PAISE),
+                returns=('daily_return', DAILY_RETURN_SCALE),
+            )
             
-            returns = [float(h.daily_return) for h in history if h.daily_return is not None]
+            returns = history['returns'][~np.isnan(history['returns'])]
             
             if len(returns) < 30:
                 return None
             
             var = np.percentile(returns, (1 - confidence) * 100)
-            current_value = float(history.last().total_value)
+            current_value = float(history['values'][-1])
             var_amount = var * current_value / 100
             
             return round(var_amount, 2)
@@ -100,23 +105,28 @@ class RiskMetrics:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=365)
             
-            history = PortfolioValueHistory.objects.filter(
-                portfolio_id=portfolio_id,
-                record_date__gte=start_date
-            ).order_by('record_date')
-            
-            if history.count() < 2:
+            history = history_arrays(
+                PortfolioValueHistory.objects.filter(
+                    portfolio_id=portfolio_id,
+                    record_date__gte=start_date
+                ).order_by('record_date'),
+                values=('total_value', PAISE),
+                returns=('daily_return', DAILY_RETURN_SCALE),
+            )
+            values = history['values']
+            
+            if len(values) < 2:
                 return None
             
-            start_value = float(history.first().total_value)
-            end_value = float(history.last().total_value)
+            start_value = float(values[0])
+            end_value = float(values[-1])
             
             if start_value == 0:
                 return None
             
             annual_return = ((end_value - start_value) / start_value)
             
-            returns = [float(h.daily_return) / 100 for h in history if h.daily_return is not None]
+            returns = history['returns'][~np.isnan(history['returns'])] / 100
             
             if len(returns) < 30:
                 return None
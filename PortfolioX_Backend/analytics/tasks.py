@@ -3,7 +3,12 @@ from portfolios.models import Portfolio
 from analytics.services.analyzer import PortfolioAnalyzer
 from analytics.services.returns_calculator import ReturnsCalculator
 from analytics.services.alert_generator import AlertGenerator
-from analytics.models import AnalysisResult, PortfolioValueHistory
+from analytics.services.history import HistoryCompactor
+from analytics.archive import AnalysisArchive
+from analytics.models import LatestAnalysis, PortfolioValueHistory
+from core import events
+from core.db_router import primary_lsn, use_primary, wait_for_replicas
+from core.response_cache import invalidate_portfolio
 from datetime import datetime, timedelta
 
 
@@ -77,27 +82,50 @@ def update_portfolio_values():
         )
         
         ReturnsCalculator.update_daily_returns(portfolio.id)
+        # portfolio.save() already invalidated, but before today's value row existed
+        invalidate_portfolio(portfolio.id)
+        events.publish(portfolio.user_id, 'portfolio.values_updated', {
+            'portfolio_id': portfolio.id,
+            'record_date': datetime.now().date(),
+            'current_value': portfolio.current_value,
+            'total_invested': portfolio.total_invested,
+            'total_gain_loss': portfolio.total_gain_loss,
+            'total_gain_pct': portfolio.total_gain_pct,
+        })
+
+
+@shared_task
+def rebuild_sector_exposure():
+    """Recompute per-portfolio sector exposure from holdings, correcting any drift"""
+    from portfolios.models import SectorExposure
+    return {'rows': SectorExposure.rebuild()}
 
 
 @shared_task
 def generate_alerts_for_portfolio(portfolio_id):
     """Generate alerts based on latest analysis"""
     try:
-        analysis = AnalysisResult.objects.filter(
-            portfolio_id=portfolio_id
-        ).order_by('-analysis_date').first()
+        latest = LatestAnalysis.get_for_portfolio(portfolio_id)
         
-        if not analysis:
+        if not latest:
             return {'status': 'no_analysis'}
         
-        portfolio = Portfolio.objects.get(id=portfolio_id)
-        recommendations = analysis.recommendations
+        portfolio = latest.portfolio
+        recommendations = latest.payload['recommendations']
         
         alerts = AlertGenerator.generate_alerts(
             user_id=portfolio.user_id,
             portfolio_id=portfolio_id,
             recommendations=recommendations
         )
+        if alerts:
+            events.publish(portfolio.user_id, 'alerts.created', {
+                'portfolio_id': portfolio_id,
+                'alerts': [
+                    {'id': a.id, 'alert_type': a.alert_type, 'priority': a.priority, 'title': a.title}
+                    for a in alerts
+                ],
+            })
         
         return {
             'status': 'success',
@@ -108,13 +136,30 @@ def generate_alerts_for_portfolio(portfolio_id):
         return {'status': 'failed', 'error': str(e)}
 
 
+@shared_task
+def compact_history():
+    """Roll daily value/analysis history past the retention window into weekly and monthly tiers"""
+    return HistoryCompactor.compact_all()
+
+
+@shared_task
+def export_analysis_archive():
+    """Append finished days of analysis history to the columnar archive"""
+    return {'exported': AnalysisArchive().export()}
+
+
 @shared_task
 def daily_batch_job():
     """Main daily batch job - runs everything in sequence"""
     results = {}
     
     results['update_values'] = update_portfolio_values()
-    results['analysis'] = run_daily_analysis()
+    # Analysis scans history on a replica; it has to see the values just written
+    if wait_for_replicas(primary_lsn()):
+        results['analysis'] = run_daily_analysis()
+    else:
+        with use_primary():
+            results['analysis'] = run_daily_analysis()
     
     portfolios = Portfolio.objects.filter(is_active=True)
     alerts_count = 0
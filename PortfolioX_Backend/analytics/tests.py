@@ -1,3 +1,367 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from analytics import async_views
+from analytics.models import AnalysisResult, LatestAnalysis, PortfolioValueHistory
+from analytics.services.analyzer import PortfolioAnalyzer
+from analytics.services.chart_series import ChartSeriesBuilder, lttb
+from analytics.tasks import update_portfolio_values
+from core.models import Alert
+from core.testing import (
+    assert_max_queries, assert_within_budget, local_event_broker, local_response_cache, strict_query_budgets,
+)
+from market.models import BenchmarkIndex, BenchmarkPriceHistory, Sector, Stock, StockPriceHistory
+from market.utils import upsert_benchmark_history
+from portfolios.models import Holding, Portfolio
+from users.models import User
+
+DAYS = 120
+
+
+def trading_days(days=DAYS):
+    today = date.today()
+    return [today - timedelta(days=d) for d in range(days - 1, -1, -1)]
+
+
+class AnalyticsDataTestCase(TestCase):
+    """Three portfolios of one user with holdings, value history, analyses and alerts"""
+
+    @classmethod
+    def setUpClass(cls):
+        # Only the database: no archive or price store left on disk by a development server
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.enterClassContext(override_settings(
+            ANALYSIS_ARCHIVE_DIR=os.path.join(directory.name, 'archive'),
+            PRICE_STORE_DIR=os.path.join(directory.name, 'price_store'),
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'pw')
+        sectors = [Sector.objects.create(name=f'Sector {i}') for i in range(3)]
+        benchmark = BenchmarkIndex.objects.create(symbol='^BUDGET', name='Budget index')
+        stocks = [
+            Stock.objects.create(symbol=f'BUD{i}.NS', name=f'Budget {i}', sector=sectors[i % 3],
+                                 current_price=Decimal(100 + i))
+            for i in range(6)
+        ]
+        days = trading_days()
+        BenchmarkPriceHistory.objects.bulk_create([
+            BenchmarkPriceHistory(benchmark=benchmark, trade_date=d, close_value=Decimal(20000 + i))
+            for i, d in enumerate(days)
+        ])
+        StockPriceHistory.objects.bulk_create([
+            StockPriceHistory(stock=stock, trade_date=d, close_price=stock.current_price + i)
+            for stock in stocks for i, d in enumerate(days)
+        ])
+
+        cls.portfolios = []
+        for n in range(3):
+            portfolio = Portfolio.objects.create(user=cls.user, name=f'Budget {n}', benchmark=benchmark)
+            for stock in stocks:
+                Holding.objects.create(portfolio=portfolio, stock=stock, quantity=Decimal(10),
+                                       avg_buy_price=stock.current_price)
+            PortfolioValueHistory.objects.bulk_create([
+                PortfolioValueHistory(portfolio=portfolio, record_date=d, total_value=Decimal(100000 + 50 * i + 400 * (i % 3)),
+                                      invested_value=Decimal(100000), daily_return=Decimal((-1) ** i * 0.4).quantize(Decimal('0.0001')))
+                for i, d in enumerate(days)
+            ])
+            for d in days[-5:]:
+                LatestAnalysis.refresh(AnalysisResult.objects.create(
+                    portfolio=portfolio, analysis_date=d, health_score=70, diversification_score=60,
+                    return_ytd=Decimal('4.20'), sector_allocation={'Sector 0': 50.0, 'Sector 1': 50.0},
+                    recommendations=[{'type': 'low_diversification', 'priority': 'medium', 'title': 't', 'message': 'm'}],
+                ))
+            Alert.objects.bulk_create([
+                Alert(user=cls.user, portfolio=portfolio, alert_type='concentration_risk', title='t', message='m')
+                for _ in range(5)
+            ])
+            cls.portfolios.append(portfolio)
+        cls.portfolio = cls.portfolios[0]
+
+
+class ReadEndpointBudgets:
+    """Budget and payload checks for the read endpoints; subclasses say how to call them"""
+
+    RECOMMENDATIONS = [{'type': 'low_diversification', 'priority': 'medium', 'title': 't', 'message': 'm'}]
+
+    def test_dashboard(self):
+        data = self.get('dashboard/')
+        self.assertEqual(data['portfolio_count'], 3)
+        self.assertEqual([p['name'] for p in data['portfolios']], ['Budget 0', 'Budget 1', 'Budget 2'])
+        first = data['portfolios'][0]
+        self.assertEqual(first['analysis']['analysis_date'], str(date.today()))
+        self.assertEqual(first['analysis']['health_score'], 70)
+        self.assertEqual(first['analysis']['returns']['ytd'], 4.2)
+        # Newest three unread alerts of each portfolio
+        newest = Alert.objects.filter(portfolio=self.portfolio).order_by('-created_at', '-id')[:3]
+        self.assertEqual([a['id'] for a in first['alerts']], [a.id for a in newest])
+        self.assertEqual(len(self.get('dashboard/?alerts=0')['portfolios'][0]['alerts']), 0)
+
+    def test_analysis(self):
+        data = self.get(f'{self.portfolio.id}/analysis/')
+        self.assertEqual(data['portfolio_id'], self.portfolio.id)
+        self.assertEqual(data['portfolio_name'], 'Budget 0')
+        self.assertEqual(data['analysis_date'], str(date.today()))
+        self.assertEqual((data['health_score'], data['diversification_score']), (70, 60))
+        self.assertEqual(data['sector_allocation'], {'Sector 0': 50.0, 'Sector 1': 50.0})
+        self.assertEqual(data['recommendations'], self.RECOMMENDATIONS)
+
+    def test_performance(self):
+        data = self.get(f'{self.portfolio.id}/performance/?period=all')
+        self.assertEqual(data['period'], 'all')
+        self.assertEqual([row['analysis_date'] for row in data['data']], [str(d) for d in trading_days()[-5:]])
+        self.assertEqual({row['health_score'] for row in data['data']}, {70})
+
+    def test_chart(self):
+        data = self.get(f'{self.portfolio.id}/chart/?period=all')
+        days = trading_days()
+        self.assertEqual(data['benchmark'], '^BUDGET')
+        self.assertEqual(data['dates'], [str(d) for d in days])
+        self.assertEqual(data['total_value'][0], 100000.0)
+        self.assertEqual(data['total_value'][-1], 100000.0 + 50 * (DAYS - 1) + 400 * ((DAYS - 1) % 3))
+        self.assertEqual(data['benchmark_close'][-1], 20000.0 + DAYS - 1)
+
+        downsampled = self.get(f'{self.portfolio.id}/chart/?period=all&points=20')
+        self.assertEqual(downsampled['source_points'], DAYS)
+        self.assertEqual(len(downsampled['dates']), 20)
+        self.assertEqual(len(downsampled['benchmark_close']), 20)
+        self.assertEqual((downsampled['dates'][0], downsampled['dates'][-1]), (str(days[0]), str(days[-1])))
+
+    def test_trends(self):
+        data = self.get(f'{self.portfolio.id}/trends/')
+        self.assertEqual(data['period'], '1y')
+        self.assertEqual(data['dates'], [str(d) for d in trading_days()[-5:]])
+        self.assertEqual(data['series'], {
+            'health_score': [70] * 5, 'diversification_score': [60] * 5, 'return_ytd': [4.2] * 5,
+        })
+
+    def test_recommendations(self):
+        data = self.get(f'{self.portfolio.id}/recommendations/')
+        self.assertEqual(data['analysis_date'], str(date.today()))
+        self.assertEqual(data['recommendations'], self.RECOMMENDATIONS)
+
+
+@strict_query_budgets
+@local_response_cache()
+class AnalyticsQueryBudgetTests(ReadEndpointBudgets, AnalyticsDataTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path):
+        response = self.client.get(f'/analytics/api/{path}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_cached_response_skips_the_view(self):
+        path = f'/analytics/api/{self.portfolio.id}/chart/?period=all'
+        self.client.get(path)
+        with assert_max_queries(0, 'cached chart'):
+            self.assertEqual(self.client.get(path)['X-Cache'], 'HIT')
+
+    def test_run_analysis(self):
+        response = self.client.post(f'/analytics/api/{self.portfolio.id}/analyze/')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_analyzer(self):
+        self.assertIsNotNone(assert_within_budget(PortfolioAnalyzer.analyze_portfolio, self.portfolio.id))
+
+
+@strict_query_budgets
+@local_response_cache()
+class AsyncAnalyticsQueryBudgetTests(ReadEndpointBudgets, AnalyticsDataTestCase):
+    """The async versions served under ASGI, called directly (analytics.urls picks them at import)"""
+
+    VIEWS = {
+        'dashboard': async_views.get_dashboard,
+        'analysis': async_views.get_portfolio_analysis,
+        'performance': async_views.get_portfolio_performance,
+        'chart': async_views.get_portfolio_chart,
+        'trends': async_views.get_portfolio_trends,
+        'recommendations': async_views.get_recommendations,
+    }
+
+    def get(self, path):
+        *portfolio_id, name = path.split('?')[0].strip('/').split('/')
+        request = APIRequestFactory().get(f'/analytics/api/{path}')
+        force_authenticate(request, self.user)
+        kwargs = {'portfolio_id': int(portfolio_id[0])} if portfolio_id else {}
+        response = async_to_sync(self.VIEWS[name])(request, **kwargs)
+        self.assertEqual(response.status_code, 200, response.rendered_content)
+        return json.loads(response.rendered_content)
+
+    def test_same_payloads_as_the_sync_views(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for path in ('dashboard/', f'{self.portfolio.id}/analysis/', f'{self.portfolio.id}/performance/?period=all',
+                     f'{self.portfolio.id}/chart/?period=3m&points=20', f'{self.portfolio.id}/trends/?metrics=health_score',
+                     f'{self.portfolio.id}/recommendations/'):
+            caches['default'].clear()
+            expected = client.get(f'/analytics/api/{path}').json()
+            caches['default'].clear()
+            self.assertEqual(self.get(path), expected, path)
+
+    def test_other_users_portfolio_is_not_found(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        for name, view in self.VIEWS.items():
+            if name == 'dashboard':
+                continue
+            request = APIRequestFactory().get('/')
+            force_authenticate(request, other)
+            self.assertEqual(async_to_sync(view)(request, portfolio_id=self.portfolio.id).status_code, 404, name)
+
+
+@local_response_cache()
+@local_event_broker()
+class ResponseCacheInvalidationTests(AnalyticsDataTestCase):
+    """Changes that reach a portfolio's data without a request retire its cached responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.path = f'/analytics/api/{self.portfolio.id}/chart/?period=all'
+        self.client.get(self.path)
+        self.assertEqual(self.client.get(self.path)['X-Cache'], 'HIT')
+
+    def test_holding_deleted_through_queryset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Holding.objects.filter(portfolio=self.portfolio).delete()
+        self.assertEqual(self.client.get(self.path)['X-Cache'], 'MISS')
+
+    def test_portfolio_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Portfolio.objects.filter(id=self.portfolio.id).delete()
+        self.assertEqual(self.client.get(self.path).status_code, 404)
+
+    def test_values_updated(self):
+        # The task records today's row
+        PortfolioValueHistory.objects.filter(record_date=date.today()).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            update_portfolio_values()
+        self.assertEqual(self.client.get(self.path)['X-Cache'], 'MISS')
+
+
+@local_response_cache()
+class ConditionalRequestTests(AnalyticsDataTestCase):
+    """ETag / Last-Modified come from the cached body and never answer for someone else's portfolio"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.path = f'/analytics/api/{self.portfolio.id}/chart/?period=all'
+        first = self.client.get(self.path)
+        self.etag, self.last_modified = first['ETag'], first['Last-Modified']
+
+    def test_unchanged_body_is_not_modified(self):
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(self.client.get(self.path, HTTP_IF_MODIFIED_SINCE=self.last_modified).status_code, 304)
+
+    def test_other_users_portfolio_is_not_found(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', 'other@example.com', 'pw'))
+        self.assertEqual(other.get(self.path, HTTP_IF_NONE_MATCH=self.etag).status_code, 404)
+        self.assertEqual(other.get(self.path, HTTP_IF_MODIFIED_SINCE=self.last_modified).status_code, 404)
+
+    def test_other_users_portfolio_is_not_found_async(self):
+        request = APIRequestFactory().get(self.path, HTTP_IF_MODIFIED_SINCE=self.last_modified)
+        force_authenticate(request, User.objects.create_user('other', 'other@example.com', 'pw'))
+        response = async_to_sync(async_views.get_portfolio_chart)(request, portfolio_id=self.portfolio.id)
+        self.assertEqual(response.status_code, 404)
+
+    def test_benchmark_refresh_changes_the_etag(self):
+        today = pd.Timestamp(date.today())
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_benchmark_history(self.portfolio.benchmark, pd.DataFrame({'Close': [1.0]}, index=[today]))
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], self.etag)
+        self.assertEqual(response.json()['benchmark_close'][-1], 1.0)
+
+
+class LatestAnalysisTests(AnalyticsDataTestCase):
+
+    def test_payload_is_stored_once_and_decoded_on_read(self):
+        latest = LatestAnalysis.objects.get(portfolio=self.portfolio)
+        self.assertEqual(latest.payload, latest.analysis.to_payload())
+        self.assertEqual(latest.payload['analysis_date'], str(date.today()))
+        self.assertEqual(json.loads(bytes(latest.response_body())), {
+            'portfolio_id': self.portfolio.id, 'portfolio_name': self.portfolio.name, **latest.payload,
+        })
+
+    def test_refresh_replaces_the_decoded_payload(self):
+        latest = LatestAnalysis.objects.get(portfolio=self.portfolio)
+        self.assertEqual(latest.payload['health_score'], 70)
+        analysis = latest.analysis
+        analysis.health_score = 40
+        analysis.save()
+        self.assertEqual(LatestAnalysis.refresh(analysis).payload['health_score'], 40)
+        self.assertEqual(LatestAnalysis.objects.get(portfolio=self.portfolio).payload['health_score'], 40)
+
+
+class LTTBTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.x = np.arange(500)
+        self.y = np.cumsum(rng.normal(size=500))
+
+    def test_keeps_threshold_points_including_both_ends(self):
+        for threshold in (3, 10, 77, 499):
+            keep = lttb(self.x, self.y, threshold)
+            self.assertEqual(len(keep), threshold)
+            self.assertEqual((keep[0], keep[-1]), (0, 499))
+            self.assertTrue((np.diff(keep) > 0).all(), threshold)
+
+    def test_short_series_pass_through(self):
+        for threshold in (500, 800, 2, 0):
+            self.assertEqual(lttb(self.x, self.y, threshold).tolist(), list(range(500)))
+
+    def test_keeps_a_spike(self):
+        y = np.zeros(500)
+        y[250] = 10.0
+        self.assertIn(250, lttb(self.x, y, 20))
+
+
+class ChartSeriesTests(AnalyticsDataTestCase):
+
+    def test_benchmark_is_aligned_to_the_sampled_dates(self):
+        days = trading_days()
+        # Index closes missing for the first ten days and every third day after
+        BenchmarkPriceHistory.objects.filter(
+            benchmark=self.portfolio.benchmark, trade_date__in=days[:10] + days[10::3]
+        ).delete()
+        closes = dict(BenchmarkPriceHistory.objects.filter(benchmark=self.portfolio.benchmark).values_list(
+            'trade_date', 'close_value'))
+
+        series = ChartSeriesBuilder.build(self.portfolio.id, self.portfolio.benchmark_id, days[0], points=25)
+        self.assertEqual(series['source_points'], DAYS)
+        self.assertEqual(len(series['dates']), 25)
+        self.assertEqual(len(series['benchmark_close']), 25)
+        for day, close in zip(series['dates'], series['benchmark_close']):
+            stored = [closes[d] for d in days if str(d) <= day and d in closes]
+            self.assertEqual(close, float(stored[-1]) if stored else None, day)
+        self.assertIsNone(series['benchmark_close'][0])
+
+    def test_values_are_the_sampled_days(self):
+        values = dict(PortfolioValueHistory.objects.filter(portfolio=self.portfolio).values_list(
+            'record_date', 'total_value'))
+        series = ChartSeriesBuilder.build(self.portfolio.id, None, trading_days()[0], points=25)
+        self.assertEqual(series['total_value'], [float(values[date.fromisoformat(d)]) for d in series['dates']])
+        self.assertEqual(set(series['benchmark_close']), {None})
@@ -1,11 +1,21 @@
-﻿from django.urls import path
+﻿from django.conf import settings
+from django.urls import path
 from . import views
 
 app_name = 'analytics'
 
+# Under ASGI (settings.ASYNC_VIEWS) the read endpoints are served by their async versions
+if settings.ASYNC_VIEWS:
+    from . import async_views as reads
+else:
+    reads = views
+
 urlpatterns = [
-    path('api/<int:portfolio_id>/analysis/', views.get_portfolio_analysis, name='get_analysis'),
+    path('api/dashboard/', reads.get_dashboard, name='get_dashboard'),
+    path('api/<int:portfolio_id>/analysis/', reads.get_portfolio_analysis, name='get_analysis'),
     path('api/<int:portfolio_id>/analyze/', views.run_portfolio_analysis, name='run_analysis'),
-    path('api/<int:portfolio_id>/performance/', views.get_portfolio_performance, name='get_performance'),
-    path('api/<int:portfolio_id>/recommendations/', views.get_recommendations, name='get_recommendations'),
+    path('api/<int:portfolio_id>/performance/', reads.get_portfolio_performance, name='get_performance'),
+    path('api/<int:portfolio_id>/chart/', reads.get_portfolio_chart, name='get_chart'),
+    path('api/<int:portfolio_id>/trends/', reads.get_portfolio_trends, name='get_trends'),
+    path('api/<int:portfolio_id>/recommendations/', reads.get_recommendations, name='get_recommendations'),
 ]
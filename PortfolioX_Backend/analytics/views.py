@@ -1,65 +1,45 @@
 ﻿from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from portfolios.models import Portfolio
-from analytics.models import AnalysisResult
+from analytics.models import LatestAnalysis
+from core.models import Alert
 from analytics.services.analyzer import PortfolioAnalyzer
+from analytics.services.chart_series import ChartSeriesBuilder
+from analytics.services.history import HistoryReader
+from core.admission import admission_control
+from core.querybudget import QueryBudgetExceeded, query_budget
+from core.response_cache import cached_response
 from datetime import datetime, timedelta
 
 
+# Query budgets of the read endpoints, shared by their async versions (analytics.async_views)
+READ_BUDGETS = {
+    'analysis': 8,
+    'performance': 4,
+    'chart': 5,
+    'trends': 2,
+    'recommendations': 8,
+    'dashboard': 2,
+}
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['analysis'])
 def get_portfolio_analysis(request, portfolio_id):
     """Get latest analysis for a portfolio"""
-    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
-    
-    analysis = AnalysisResult.objects.filter(
-        portfolio_id=portfolio_id
-    ).order_by('-analysis_date').first()
-    
-    if not analysis:
-        return Response({
-            'error': 'No analysis found. Run analysis first.',
-            'portfolio_id': portfolio_id
-        }, status=404)
-    
-    return Response({
-        'portfolio_id': portfolio.id,
-        'portfolio_name': portfolio.name,
-        'analysis_date': analysis.analysis_date,
-        'health_score': analysis.health_score,
-        'diversification_score': analysis.diversification_score,
-        'risk_score': float(analysis.risk_score) if analysis.risk_score else None,
-        'sharpe_ratio': float(analysis.sharpe_ratio) if analysis.sharpe_ratio else None,
-        'returns': {
-            '1d': float(analysis.return_1d) if analysis.return_1d else None,
-            '1w': float(analysis.return_1w) if analysis.return_1w else None,
-            '1m': float(analysis.return_1m) if analysis.return_1m else None,
-            '3m': float(analysis.return_3m) if analysis.return_3m else None,
-            '6m': float(analysis.return_6m) if analysis.return_6m else None,
-            '1y': float(analysis.return_1y) if analysis.return_1y else None,
-            'ytd': float(analysis.return_ytd) if analysis.return_ytd else None,
-        },
-        'benchmark_comparison': {
-            'alpha': float(analysis.alpha) if analysis.alpha else None,
-            'beta': float(analysis.beta) if analysis.beta else None,
-            'benchmark_return_ytd': float(analysis.benchmark_return_ytd) if analysis.benchmark_return_ytd else None,
-        },
-        'risk_metrics': {
-            'volatility_30d': float(analysis.volatility_30d) if analysis.volatility_30d else None,
-            'max_drawdown': float(analysis.max_drawdown) if analysis.max_drawdown else None,
-            'var_95': float(analysis.var_95) if analysis.var_95 else None,
-        },
-        'sector_allocation': analysis.sector_allocation,
-        'top_holdings': analysis.top_holdings,
-        'concentration_data': analysis.concentration_data,
-        'recommendations': analysis.recommendations,
-    })
+    return _analysis_response(request, portfolio_id)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@admission_control('analysis')
+@query_budget(38)
 def run_portfolio_analysis(request, portfolio_id):
     """Trigger analysis for a portfolio"""
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
@@ -84,6 +64,8 @@ def run_portfolio_analysis(request, portfolio_id):
                 'portfolio_id': portfolio_id
             }, status=500)
             
+    except QueryBudgetExceeded:
+        raise
     except Exception as e:
         return Response({
             'status': 'error',
@@ -94,42 +76,127 @@ def run_portfolio_analysis(request, portfolio_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['performance'])
 def get_portfolio_performance(request, portfolio_id):
     """Get historical performance data"""
+    return _performance_response(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['chart'])
+def get_portfolio_chart(request, portfolio_id):
+    """Portfolio value and benchmark close downsampled to ?points= (default 200).
+    
+    Parallel arrays sharing one dates array, the same size whatever the period,
+    read from the value history rather than the analysis rows.
+    """
+    return _chart_response(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['trends'])
+def get_portfolio_trends(request, portfolio_id):
+    """Metric trends from the analysis archive as parallel arrays.
+    
+    ?metrics= takes archive column names, including flattened ones such as
+    sector:Technology or concentration:top_5_weight.
+    """
+    return _trends_response(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response()
+@query_budget(READ_BUDGETS['recommendations'])
+def get_recommendations(request, portfolio_id):
+    """Get recommendations for a portfolio"""
+    return _recommendations_response(request, portfolio_id)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(READ_BUDGETS['dashboard'])
+def get_dashboard(request):
+    """Summary of every active portfolio of the user in one response.
+    
+    Two queries however many portfolios: portfolios joined to their latest
+    analysis, then the newest unread alerts per portfolio (?alerts=, default 3).
+    """
+    return _dashboard_response(request)
+
+
+# Bodies of the read endpoints. The sync views call them directly and the async
+# views through sync_to_async, so both check ownership and build the same payloads.
+
+def _analysis_response(request, portfolio_id):
+    _, latest = _get_latest_analysis(request, portfolio_id)
+    
+    if not latest:
+        return Response({
+            'error': 'No analysis found. Run analysis first.',
+            'portfolio_id': portfolio_id
+        }, status=404)
+    
+    return Response(latest.response_body())
+
+
+def _performance_response(request, portfolio_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     
-    period = request.GET.get('period', '1y')
-    periods_map = {'1m': 30, '3m': 90, '6m': 180, '1y': 365, 'all': 3650}
-    days = periods_map.get(period, 365)
-    start_date = datetime.now().date() - timedelta(days=days)
+    period, start_date = _period_start(request)
     
-    analyses = AnalysisResult.objects.filter(
-        portfolio_id=portfolio_id,
-        analysis_date__gte=start_date
-    ).order_by('analysis_date').values(
-        'analysis_date', 'return_ytd', 'health_score', 
-        'diversification_score', 'sharpe_ratio'
-    )
+    # Archived days, recent daily rows, plus weekly/monthly rollups for anything older
+    analyses = HistoryReader.analysis_series(portfolio_id, start_date)
     
     return Response({
         'portfolio_id': portfolio_id,
         'portfolio_name': portfolio.name,
         'period': period,
-        'data': list(analyses)
+        'data': analyses
     })
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_recommendations(request, portfolio_id):
-    """Get recommendations for a portfolio"""
+def _chart_response(request, portfolio_id):
+    portfolio = get_object_or_404(Portfolio.objects.select_related('benchmark'), id=portfolio_id, user=request.user)
+    
+    period, start_date = _period_start(request)
+    points = ChartSeriesBuilder.clamp_points(request.GET.get('points'))
+    series = ChartSeriesBuilder.build(portfolio_id, portfolio.benchmark_id, start_date, points)
+    
+    return Response({
+        'portfolio_id': portfolio_id,
+        'portfolio_name': portfolio.name,
+        'period': period,
+        'benchmark': portfolio.benchmark.symbol if portfolio.benchmark else None,
+        **series,
+    })
+
+
+def _trends_response(request, portfolio_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
     
-    analysis = AnalysisResult.objects.filter(
-        portfolio_id=portfolio_id
-    ).order_by('-analysis_date').first()
+    period, start_date = _period_start(request)
+    metrics = [m for m in request.GET.get('metrics', 'health_score,diversification_score,return_ytd').split(',') if m]
+    trends = HistoryReader.analysis_trends(portfolio_id, start_date, metrics)
     
-    if not analysis:
+    return Response({
+        'portfolio_id': portfolio_id,
+        'portfolio_name': portfolio.name,
+        'period': period,
+        'dates': trends.pop('dates'),
+        'series': trends,
+    })
+
+
+def _recommendations_response(request, portfolio_id):
+    portfolio, latest = _get_latest_analysis(request, portfolio_id)
+    
+    if not latest:
         return Response({
             'error': 'No analysis found',
             'portfolio_id': portfolio_id
@@ -138,6 +205,111 @@ def get_recommendations(request, portfolio_id):
     return Response({
         'portfolio_id': portfolio_id,
         'portfolio_name': portfolio.name,
-        'analysis_date': analysis.analysis_date,
-        'recommendations': analysis.recommendations or []
+        'analysis_date': latest.payload['analysis_date'],
+        'recommendations': latest.payload['recommendations'] or []
     })
+
+
+def _dashboard_response(request):
+    portfolios = list(_dashboard_portfolios(request))
+    
+    alerts_per_portfolio = _alerts_per_portfolio(request)
+    alerts = []
+    if portfolios and alerts_per_portfolio:
+        alerts = list(_dashboard_alerts(request, portfolios, alerts_per_portfolio))
+    
+    return Response(_dashboard_payload(portfolios, alerts))
+
+
+def _alerts_per_portfolio(request):
+    try:
+        return max(0, min(int(request.GET.get('alerts', 3)), 20))
+    except ValueError:
+        return 3
+
+
+def _dashboard_portfolios(request):
+    return Portfolio.objects.filter(user=request.user, is_active=True).select_related('latest_analysis').order_by('name')
+
+
+def _dashboard_alerts(request, portfolios, per_portfolio):
+    """Newest `per_portfolio` unread alerts of each portfolio, as value dicts"""
+    return Alert.objects.filter(
+        user=request.user, is_read=False, portfolio_id__in=[p.id for p in portfolios]
+    ).annotate(
+        rank=Window(RowNumber(), partition_by=[F('portfolio_id')], order_by=F('created_at').desc())
+    ).filter(rank__lte=per_portfolio).order_by('portfolio_id', 'rank').values(
+        'id', 'portfolio_id', 'alert_type', 'priority', 'title', 'created_at'
+    )
+
+
+def _dashboard_payload(portfolios, alert_rows):
+    alerts = {}
+    for alert in alert_rows:
+        alerts.setdefault(alert.pop('portfolio_id'), []).append(alert)
+    
+    totals = {'current_value': 0.0, 'total_invested': 0.0, 'total_gain_loss': 0.0}
+    summaries = []
+    for portfolio in portfolios:
+        for key in totals:
+            totals[key] += float(getattr(portfolio, key))
+        summaries.append({
+            'portfolio_id': portfolio.id,
+            'name': portfolio.name,
+            'description': portfolio.description,
+            'current_value': float(portfolio.current_value),
+            'total_invested': float(portfolio.total_invested),
+            'total_gain_loss': float(portfolio.total_gain_loss),
+            'total_gain_pct': float(portfolio.total_gain_pct),
+            'day_change_pct': float(portfolio.day_change_pct),
+            'analysis': _dashboard_analysis(portfolio),
+            'alerts': alerts.get(portfolio.id, []),
+        })
+    
+    invested = totals['total_invested']
+    totals['total_gain_pct'] = round(totals['total_gain_loss'] / invested * 100, 2) if invested else 0.0
+    return {
+        'portfolio_count': len(summaries),
+        'totals': totals,
+        'portfolios': summaries,
+    }
+
+
+def _dashboard_analysis(portfolio):
+    """Compact slice of the latest analysis payload, None before the first analysis"""
+    try:
+        payload = portfolio.latest_analysis.payload
+    except LatestAnalysis.DoesNotExist:
+        return None
+    return {
+        'analysis_date': payload['analysis_date'],
+        'health_score': payload['health_score'],
+        'diversification_score': payload['diversification_score'],
+        'risk_score': payload['risk_score'],
+        'sharpe_ratio': payload['sharpe_ratio'],
+        'returns': payload['returns'],
+        'risk_metrics': payload['risk_metrics'],
+        'alpha': payload['benchmark_comparison']['alpha'],
+        'beta': payload['benchmark_comparison']['beta'],
+    }
+
+
+def _get_latest_analysis(request, portfolio_id):
+    """(portfolio, LatestAnalysis or None); one joined lookup when the pointer exists"""
+    latest = LatestAnalysis.objects.select_related('portfolio').filter(
+        portfolio_id=portfolio_id,
+        portfolio__user=request.user
+    ).first()
+    if latest:
+        return latest.portfolio, latest
+    
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    return portfolio, LatestAnalysis.get_for_portfolio(portfolio_id)
+
+
+def _period_start(request):
+    """(period, start date) from the ?period= query parameter"""
+    period = request.GET.get('period', '1y')
+    periods_map = {'1m': 30, '3m': 90, '6m': 180, '1y': 365, 'all': 3650}
+    days = periods_map.get(period, 365)
+    return period, datetime.now().date() - timedelta(days=days)
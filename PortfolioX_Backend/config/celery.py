@@ -1,6 +1,7 @@
 ﻿import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import task_postrun, worker_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -17,6 +18,39 @@ app.conf.beat_schedule = {
         'task': 'analytics.tasks.update_portfolio_values',
         'schedule': crontab(hour='*/6'),
     },
+    'ensure-history-partitions': {
+        'task': 'core.tasks.ensure_history_partitions',
+        'schedule': crontab(hour=1, minute=0, day_of_month=1),
+    },
+    'export-analysis-archive': {
+        'task': 'analytics.tasks.export_analysis_archive',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'compact-history': {
+        'task': 'analytics.tasks.compact_history',
+        'schedule': crontab(hour=2, minute=0, day_of_week='sun'),
+    },
+    'expire-population-jobs': {
+        'task': 'market.tasks.expire_population_jobs',
+        'schedule': crontab(minute='*/10'),
+    },
+    'rebuild-sector-exposure': {
+        'task': 'analytics.tasks.rebuild_sector_exposure',
+        'schedule': crontab(hour=2, minute=30, day_of_week='sun'),
+    },
 }
 
 app.conf.timezone = 'Asia/Kolkata'
+
+
+@worker_init.connect
+def close_parent_db_pools(**kwargs):
+    # Prefork children must open their own connection pools, not share the parent's sockets
+    from core.dbpool import close_pools
+    close_pools()
+
+
+@task_postrun.connect
+def report_db_pools(**kwargs):
+    from core.dbpool import report
+    report()
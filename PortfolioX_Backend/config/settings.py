@@ -51,7 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,15 +87,134 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DB_NAME', 'portfoliox_db'),
         'USER': os.getenv('DB_USER', 'postgres'),
         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Connection handling, for gunicorn workers and Celery worker children alike:
+#   'pool'      psycopg connection pool per process (needs psycopg[pool]);
+#               connections are checked on checkout and recycled after DB_POOL_MAX_LIFETIME
+#   'pgbouncer' persistent connections to a transaction-pooling pgbouncer at DB_HOST
+#   'none'      Django's own handling, kept open DB_CONN_MAX_AGE seconds (0: per request/task)
+# Pool counters are logged by core.dbpool and served at /core/api/db-pool/.
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'pool')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 4))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 30 * 60))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 5 * 60))
+DB_POOL_STATS_SECONDS = float(os.getenv('DB_POOL_STATS_SECONDS', 60))
+
+if DB_POOL_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {'pool': {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+        'max_lifetime': DB_POOL_MAX_LIFETIME,
+        'max_idle': DB_POOL_MAX_IDLE,
+    }}
+elif DB_POOL_MODE == 'pgbouncer':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+    # Named cursors don't survive transaction pooling; iterator() falls back to chunked fetches
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 0))
+
+# Read replicas: DB_REPLICA_HOSTS="host1,host2:5433" adds replica_1, replica_2, ...
+# with the primary's credentials. Pointing one at the primary's own host gives a
+# local two-alias setup. Routing rules live in core.db_router.
+for _i, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica_{_i}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Replicas further behind than this are skipped; lag is re-measured at most every REPLICA_LAG_CHECK_SECONDS
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 2))
+# After a write request, that client's reads stay on the primary this long
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 10))
+# Cache alias holding those per-user windows; every web worker must see the same one
+READ_YOUR_WRITES_CACHE = 'default'
+
+# Serve the analytics read endpoints with their async views (analytics.async_views).
+# config.asgi turns this on; the WSGI entry point keeps the sync views.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Server-sent events (core.events): 'local' fans out within one process, 'redis'
+# also reaches streams in other workers and events published by Celery
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'local')
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', 'redis://localhost:6379/2')
+# Events held per open stream before its oldest are dropped
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+EVENTS_KEEPALIVE_SECONDS = int(os.getenv('EVENTS_KEEPALIVE_SECONDS', 15))
+# Client reconnect delay sent in the stream's retry: field
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', 5000))
+
+# orjson rendering; views may also hand it pre-encoded bytes (see core.renderers)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Reverse proxies in front of the app. Anonymous clients are rate limited by
+    # the address the last of them appended to X-Forwarded-For, or REMOTE_ADDR
+    # with 0; the rest of that header is client-supplied and never trusted
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
+}
+
+# Local memory outside production (settings_prod uses Redis); tests get a fresh
+# one per process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'portfoliox',
+    }
+}
+# Cache alias and lifetime for core.response_cache; entries are also retired
+# as soon as the portfolio's analysis or holdings change
+RESPONSE_CACHE = 'default'
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', 600))
+
+# What an exceeded core.querybudget budget does: 'raise', 'warn' or 'off'
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'raise' if DEBUG else 'warn')
+# Requests slower than this are logged with their query count
+QUERY_BUDGET_SLOW_MS = int(os.getenv('QUERY_BUDGET_SLOW_MS', 500))
+
+# Token buckets and concurrency caps for expensive endpoints (core.admission).
+# Keep each concurrency below the worker count so cheap reads always find a worker.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+ADMISSION_CACHE = 'default'
+ADMISSION_BUSY_RETRY_SECONDS = int(os.getenv('ADMISSION_BUSY_RETRY_SECONDS', 5))
+ADMISSION_CLASSES = {
+    # Full inline analysis (run_portfolio_analysis)
+    'analysis': {
+        'user_rate': '6/m', 'user_burst': 3,
+        'global_rate': '120/m', 'global_burst': 20,
+        'concurrency': int(os.getenv('ADMISSION_ANALYSIS_CONCURRENCY', 2)), 'max_seconds': 120,
+    },
+    # Stock population requests (add_and_populate_stock) ...
+    'stock_population': {
+        'user_rate': '20/h', 'user_burst': 5,
+        'global_rate': '300/h', 'global_burst': 30,
+    },
+    # ... and the Yahoo lookups they queue, held from enqueue until populate_stock finishes
+    'stock_lookups': {
+        'concurrency': int(os.getenv('ADMISSION_LOOKUP_CONCURRENCY', 4)), 'max_seconds': 300,
+    },
+}
+
 
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -140,6 +261,24 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Memory-mapped close/return matrices read by analytics (see market.price_store)
+PRICE_STORE_DIR = os.getenv('PRICE_STORE_DIR', str(BASE_DIR / 'var' / 'price_store'))
+
+# History retention: daily rows for this many days, then weekly rollups, then monthly
+# (daily must cover the 1y analytics window)
+HISTORY_DAILY_RETENTION_DAYS = int(os.getenv('HISTORY_DAILY_RETENTION_DAYS', 400))
+HISTORY_WEEKLY_RETENTION_DAYS = int(os.getenv('HISTORY_WEEKLY_RETENTION_DAYS', 365 * 5))
+
+# Queued/running stock population jobs older than this are failed (lost message or worker),
+# freeing their search term for a new job
+STOCK_POPULATION_JOB_TIMEOUT = int(os.getenv('STOCK_POPULATION_JOB_TIMEOUT', 600))
+
+# Rows per server-side cursor fetch and per streamed chunk in core.exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# Month-partitioned columnar export of AnalysisResult history (see analytics.archive)
+ANALYSIS_ARCHIVE_DIR = os.getenv('ANALYSIS_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'analysis_archive'))
+
 #Celery config
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -4,6 +4,8 @@ import os
 
 # Security
 DEBUG = False
+# Production logs over-budget queries instead of failing the request
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn')
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '').split(',')
 
@@ -19,20 +21,10 @@ SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
 
 # Database - PostgreSQL
-DATABASES = {
-    'default': {
-        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
-        'NAME': os.environ.get('DB_NAME'),
-        'USER': os.environ.get('DB_USER'),
-        'PASSWORD': os.environ.get('DB_PASSWORD'),
-        'HOST': os.environ.get('DB_HOST', 'localhost'),
-        'PORT': os.environ.get('DB_PORT', '5432'),
-        'CONN_MAX_AGE': 600,
-        'OPTIONS': {
-            'connect_timeout': 10,
-        }
-    }
-}
+# DATABASES (primary, DB_REPLICA_HOSTS replicas and DB_POOL_MODE pooling) is
+# built in settings.py from the same DB_* variables
+for _db in DATABASES.values():
+    _db['OPTIONS'] = {**_db.get('OPTIONS', {}), 'connect_timeout': 10}
 
 # Redis Cache
 CACHES = {
@@ -43,7 +35,9 @@ CACHES = {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             'SOCKET_CONNECT_TIMEOUT': 5,
             'SOCKET_TIMEOUT': 5,
-            'CONNECTION_POOL_KWARGS': {'max_connections': 50}
+            'CONNECTION_POOL_KWARGS': {'max_connections': 50},
+            # A Redis outage degrades to uncached responses instead of errors
+            'IGNORE_EXCEPTIONS': True,
         }
     }
 }
@@ -54,6 +48,10 @@ CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localho
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_TASK_ALWAYS_EAGER = False
 
+# Celery workers publish events that the ASGI workers stream
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'redis')
+EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/2'))
+
 # Static & Media Files
 if os.environ.get('USE_S3', 'False') == 'True':
     # AWS S3 Settings
@@ -116,6 +114,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'portfoliox': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
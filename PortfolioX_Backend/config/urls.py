@@ -21,4 +21,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('portfolios/', include('portfolios.urls')),
     path('analytics/', include('analytics.urls')),
+    path('market/', include('market.urls')),
+    path('core/', include('core.urls')),
 ]
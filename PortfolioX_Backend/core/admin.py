@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Alert, UploadJob
+from .models import Alert, UploadJob, StockPopulationJob
 
 admin.site.register(Alert)
 admin.site.register(UploadJob)
+admin.site.register(StockPopulationJob)
@@ -0,0 +1,187 @@
+"""Admission control for expensive endpoints.
+
+@admission_control('<class>') goes on DRF function views, below
+@permission_classes. The class names an entry in
+settings.ADMISSION_CLASSES, which can set:
+
+- user_rate / user_burst: a token bucket per user (per client address for
+  anonymous requests, as REST_FRAMEWORK['NUM_PROXIES'] trusted proxies
+  report it). Rates are '<tokens>/<s|m|h|d>'. A bucket refills continuously
+  and holds at most `burst` tokens.
+- global_rate / global_burst: one bucket shared by every client.
+- concurrency / max_seconds: at most `concurrency` requests of the class in
+  progress across all workers. A slot left behind by a killed worker frees
+  itself after max_seconds.
+
+A refused request gets 429 with Retry-After: the time until the bucket has
+a token, or ADMISSION_BUSY_RETRY_SECONDS when every slot is taken.
+acquire_slot() / release_slot() hold a slot for work that outlives the
+request, such as a Celery job.
+
+State lives in the ADMISSION_CACHE alias (Redis in production), not the
+database. Turning a spike away costs a few cache round trips and no
+database connection. Concurrency caps below the worker count leave workers
+for cheap reads. Each bucket is one integer: the time in ms at which it
+will be full again, moved with cache.incr (GCRA). Requests racing on an
+idle bucket can let a few extra through, never fewer. A cache that errors
+(django-redis with IGNORE_EXCEPTIONS answers None) admits the request.
+Admitted and refused counts are kept per process; see stats().
+"""
+import math
+import threading
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.ADMISSION_CACHE]
+
+
+def _config(endpoint_class):
+    return settings.ADMISSION_CLASSES[endpoint_class]
+
+
+def parse_rate(rate):
+    """ms per token for a '<tokens>/<period>' rate"""
+    tokens, period = rate.split('/')
+    return max(1, PERIODS[period[0]] * 1000 // int(tokens))
+
+
+def _take(key, interval, burst, now):
+    """0 if a token was taken from the bucket, else ms until one is available"""
+    cache = _cache()
+    capacity = interval * burst
+    timeout = math.ceil(capacity / 1000) + 1
+    cache.add(key, now, timeout)
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        # Expired between add and incr, so the bucket was full
+        return 0
+    if full_at is None:
+        return 0
+    if full_at - interval < now:
+        # The bucket had refilled completely; count from now
+        cache.set(key, now + interval, timeout)
+        return 0
+    if full_at - now > capacity:
+        cache.decr(key, interval)
+        return full_at - capacity - now
+    cache.touch(key, timeout)
+    return 0
+
+
+def _refund(key, interval):
+    try:
+        _cache().decr(key, interval)
+    except ValueError:
+        pass
+
+
+def _buckets(endpoint_class, request):
+    """[(key, ms per token, burst)] for the buckets the request draws from"""
+    config = _config(endpoint_class)
+    buckets = []
+    if 'user_rate' in config:
+        if request.user and request.user.is_authenticated:
+            ident = f'u{request.user.pk}'
+        else:
+            # REMOTE_ADDR, or the address appended by the last trusted proxy; never a client-sent one
+            ident = f'a{BaseThrottle().get_ident(request)}'
+        buckets.append((f'adm:bucket:{endpoint_class}:{ident}', parse_rate(config['user_rate']),
+                        config.get('user_burst', 1)))
+    if 'global_rate' in config:
+        buckets.append((f'adm:bucket:{endpoint_class}', parse_rate(config['global_rate']),
+                        config.get('global_burst', 1)))
+    return buckets
+
+
+def _take_tokens(endpoint_class, request):
+    """Take a token from every bucket of the class, or none of them and raise Throttled"""
+    now = int(time.time() * 1000)
+    taken = []
+    for key, interval, burst in _buckets(endpoint_class, request):
+        wait = _take(key, interval, burst, now)
+        if wait:
+            for taken_key, taken_interval in taken:
+                _refund(taken_key, taken_interval)
+            _record(endpoint_class, 'rate_limited')
+            raise Throttled(wait / 1000, f"Too many {endpoint_class} requests.")
+        taken.append((key, interval))
+    return taken
+
+
+def acquire_slot(endpoint_class):
+    """Handle of a free concurrency slot of the class, held until release_slot(); Throttled if all are taken"""
+    if not settings.ADMISSION_ENABLED:
+        return None
+    config = _config(endpoint_class)
+    cache = _cache()
+    keys = [f'adm:slot:{endpoint_class}:{i}' for i in range(config['concurrency'])]
+    held = cache.get_many(keys)
+    holder = uuid.uuid4().hex
+    for key in keys:
+        # add() is False when another worker took the slot first, None when the cache is down
+        if key not in held and cache.add(key, holder, config['max_seconds']) is not False:
+            return f'{key}#{holder}'
+    _record(endpoint_class, 'busy')
+    raise Throttled(settings.ADMISSION_BUSY_RETRY_SECONDS, f"Too many {endpoint_class} requests in progress.")
+
+
+def release_slot(slot):
+    if not slot:
+        return
+    key, _, holder = slot.partition('#')
+    cache = _cache()
+    # After max_seconds the slot may have passed to another request
+    if cache.get(key) == holder:
+        cache.delete(key)
+
+
+def admission_control(endpoint_class):
+    """Admit the view's requests against the class's buckets and concurrency cap; 429 otherwise"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not settings.ADMISSION_ENABLED:
+                return view(request, *args, **kwargs)
+
+            taken = _take_tokens(endpoint_class, request)
+            slot = None
+            if 'concurrency' in _config(endpoint_class):
+                try:
+                    slot = acquire_slot(endpoint_class)
+                except Throttled:
+                    for key, interval in taken:
+                        _refund(key, interval)
+                    raise
+            _record(endpoint_class, 'admitted')
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                release_slot(slot)
+        return wrapped
+    return decorator
+
+
+def _record(endpoint_class, outcome):
+    with _lock:
+        entry = _stats.setdefault(endpoint_class, {'admitted': 0, 'rate_limited': 0, 'busy': 0})
+        entry[outcome] += 1
+
+
+def stats():
+    """{endpoint class: {'admitted', 'rate_limited', 'busy'}} for this process since start"""
+    with _lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
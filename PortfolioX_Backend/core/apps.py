@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.core.signals import request_finished
+        from core.dbpool import report_on_signal
+        request_finished.connect(report_on_signal, dispatch_uid='core.dbpool.report')
@@ -0,0 +1,49 @@
+"""Async core endpoints, served under ASGI.
+
+core.urls adds them only when settings.ASYNC_VIEWS is on (config.asgi turns
+it on): a stream held open by a sync worker would take that worker away
+from every other request.
+"""
+import asyncio
+
+from adrf.decorators import api_view
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated
+
+from core.events import broker
+from core.querybudget import query_budget
+from core.renderers import EventStreamRenderer, FastJSONRenderer
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer, EventStreamRenderer])
+@query_budget(0)
+async def event_stream(request):
+    """Server-sent events about the user's portfolios, replacing polling.
+
+    Events: analysis.completed, portfolio.values_updated and alerts.created,
+    each with a JSON data line carrying portfolio_id. A comment line goes
+    out every EVENTS_KEEPALIVE_SECONDS so proxies keep the connection open.
+    """
+    response = StreamingHttpResponse(_events(request.user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Pass events straight through nginx instead of buffering them
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _events(user_id):
+    source = broker()
+    queue = await source.subscribe(user_id)
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode()
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+    finally:
+        source.unsubscribe(user_id, queue)
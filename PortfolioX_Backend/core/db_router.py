@@ -0,0 +1,160 @@
+"""Primary/replica routing.
+
+Writes, migrations and anything inside a transaction on the primary go to
+'default'. Other reads go to a replica alias (replica_1, replica_2, ... see
+DB_REPLICA_HOSTS in settings) whose measured lag is within
+REPLICA_MAX_LAG_SECONDS, falling back to the primary when none qualifies.
+
+Reads are pinned to the primary while use_primary() is active, or inside
+pin_when(check) once check() returns True. The ReadYourWritesMiddleware uses
+those for the whole of a write request and for READ_YOUR_WRITES_SECONDS
+afterwards, so a client never reads back an older copy of what it just wrote.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from core.querybudget import uncounted
+
+PRIMARY = 'default'
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+_pin_check = ContextVar('db_pin_check', default=None)
+
+# alias -> (checked at, lag in seconds or None when unreachable)
+_lag_cache = {}
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+@contextmanager
+def use_primary():
+    """Route every read in this block (and this context only) to the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def pin_when(check):
+    """Route reads in this block to the primary whenever check() returns True.
+
+    For pins that depend on something not known when the block starts, such
+    as the user a view authenticates; check() runs on every read, so it
+    should remember its answer once it has one.
+    """
+    token = _pin_check.set(check)
+    try:
+        yield
+    finally:
+        _pin_check.reset(token)
+
+
+def is_pinned():
+    check = _pin_check.get()
+    return _pinned.get() or bool(check and check())
+
+
+def replica_lag(alias):
+    """Replication lag of a replica in seconds, None if it cannot be reached.
+
+    Cached for REPLICA_LAG_CHECK_SECONDS so routing does not add a query per read.
+    """
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached and now - cached[0] < settings.REPLICA_LAG_CHECK_SECONDS:
+        return cached[1]
+
+    lag = _measure_lag(alias)
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    max_lag = settings.REPLICA_MAX_LAG_SECONDS
+    return [alias for alias in replica_aliases() if (lag := replica_lag(alias)) is not None and lag <= max_lag]
+
+
+def primary_lsn():
+    """Current WAL position of the primary (None off PostgreSQL)"""
+    connection = connections[PRIMARY]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        return cursor.fetchone()[0]
+
+
+def wait_for_replicas(lsn, timeout=30.0, poll=0.5):
+    """Block until every replica has replayed up to `lsn`; False if timed out.
+
+    For jobs that write and then scan what they wrote from a replica.
+    """
+    pending = set(replica_aliases()) if lsn else set()
+    deadline = time.monotonic() + timeout
+    while pending:
+        for alias in list(pending):
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)", [lsn]
+                    )
+                    if cursor.fetchone()[0]:
+                        pending.discard(alias)
+            except Exception as e:
+                print(f"Error checking replica {alias}: {e}")
+        if pending:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+    return True
+
+
+def _measure_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        # Runs inside whichever read triggered routing; not that caller's query
+        with uncounted(), connection.cursor() as cursor:
+            # An idle primary stops advancing the replay timestamp, so a replica that
+            # has replayed everything it received counts as caught up
+            cursor.execute(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )
+            lag = cursor.fetchone()[0]
+        return float(lag) if lag is not None else 0.0
+    except Exception as e:
+        print(f"Replica {alias} unavailable: {e}")
+        return None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if is_pinned() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        replicas = healthy_replicas()
+        if not replicas:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
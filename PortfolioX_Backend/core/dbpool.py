@@ -0,0 +1,97 @@
+"""Database connection pool metrics and lifecycle.
+
+With DB_POOL_MODE='pool' every process (gunicorn worker, Celery worker
+child) keeps a psycopg ConnectionPool per database alias, opened on first
+use. Connections are health-checked on checkout and recycled after
+DB_POOL_MAX_LIFETIME. pool_stats() reads the counters of the pools this
+process has opened; report() logs them at most every DB_POOL_STATS_SECONDS
+and is hooked to request_finished (core.apps) and Celery's task_postrun
+(config.celery). Staff can read the same numbers from /core/api/db-pool/.
+"""
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('portfoliox.dbpool')
+
+_last_report = 0.0
+
+
+def _pools():
+    """{alias: ConnectionPool} for the pools this process has created"""
+    pools = {}
+    for alias in connections:
+        wrapper = connections[alias]
+        # Read the backend's registry rather than wrapper.pool, which would create the pool
+        pool = getattr(wrapper, '_connection_pools', {}).get(alias)
+        if pool is not None:
+            pools[alias] = pool
+    return pools
+
+
+def pool_stats():
+    """{alias: counters} for this process's pools.
+
+    checkouts        connections handed out since the pool opened
+    waited           checkouts that had to queue for a free connection
+    wait_ms_total    time spent queueing, and its per-checkout average
+    timeouts         checkouts that gave up after DB_POOL_TIMEOUT
+    size/available   open connections and how many are idle
+    saturation       share of max_size checked out right now (1.0 = full)
+    """
+    stats = {}
+    for alias, pool in _pools().items():
+        raw = pool.get_stats()
+        size = raw.get('pool_size', 0)
+        available = raw.get('pool_available', 0)
+        checkouts = raw.get('requests_num', 0)
+        wait_ms = raw.get('requests_wait_ms', 0)
+        stats[alias] = {
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'size': size,
+            'available': available,
+            'waiting': raw.get('requests_waiting', 0),
+            'saturation': round((size - available) / pool.max_size, 3) if pool.max_size else 0.0,
+            'checkouts': checkouts,
+            'waited': raw.get('requests_queued', 0),
+            'wait_ms_total': wait_ms,
+            'wait_ms_avg': round(wait_ms / checkouts, 3) if checkouts else 0.0,
+            'timeouts': raw.get('requests_errors', 0),
+            'connections_opened': raw.get('connections_num', 0),
+            'connections_lost': raw.get('connections_lost', 0),
+            'returned_bad': raw.get('returns_bad', 0),
+        }
+    return stats
+
+
+def report(force=False):
+    """Log this process's pool counters, at most every DB_POOL_STATS_SECONDS unless forced"""
+    global _last_report
+    now = time.monotonic()
+    if not force and now - _last_report < settings.DB_POOL_STATS_SECONDS:
+        return
+    _last_report = now
+    for alias, stats in pool_stats().items():
+        logger.info(
+            "db pool %s pid=%d size=%d/%d available=%d waiting=%d saturation=%.2f checkouts=%d "
+            "waited=%d wait_ms_avg=%.2f timeouts=%d lost=%d",
+            alias, os.getpid(), stats['size'], stats['max_size'], stats['available'], stats['waiting'],
+            stats['saturation'], stats['checkouts'], stats['waited'], stats['wait_ms_avg'],
+            stats['timeouts'], stats['connections_lost'],
+        )
+        if stats['saturation'] >= 1 and stats['waiting']:
+            logger.warning("db pool %s pid=%d is saturated with %d waiting", alias, os.getpid(), stats['waiting'])
+
+
+def report_on_signal(sender=None, **kwargs):
+    report()
+
+
+def close_pools():
+    """Close this process's pools; call in a parent process before it forks workers"""
+    for alias in _pools():
+        connections[alias].close_pool()
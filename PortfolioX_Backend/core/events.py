@@ -0,0 +1,142 @@
+"""Per-user server-sent events.
+
+publish(user_id, event, data) queues an event for the user once the current
+transaction commits. Every open stream of that user receives it
+(core.async_views.event_stream, served under ASGI). Events are
+notifications, not a log: a client that was disconnected reloads what it
+shows instead of replaying what it missed.
+
+settings.EVENTS_BROKER picks how events travel:
+
+- 'local': in-process fan-out, for tests and a single-process dev server.
+- 'redis': publishers, including Celery workers, PUBLISH each event to
+  EVENTS_REDIS_URL. Every ASGI worker holds one pattern subscription and
+  fans the events out to its own streams, so the Redis connection count
+  does not grow with the number of open streams.
+
+An event is encoded once, as its finished SSE frame, when it is published.
+Each stream gets a bounded queue (EVENTS_QUEUE_SIZE); a stream that falls
+behind loses its oldest events, not the publisher's time. A broker that
+cannot be reached is logged and skipped; the work that triggered the event
+still stands.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction
+
+from core.renderers import event_frame
+
+CHANNEL_PREFIX = 'events:user:'
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def publish(user_id, event, data):
+    """Send `event` to the user's open streams after the current transaction commits"""
+    message = event_frame(event, data)
+
+    def send():
+        try:
+            broker().publish(user_id, message)
+        except Exception as e:
+            print(f"Error publishing {event} to user {user_id}: {e}")
+
+    transaction.on_commit(send)
+
+
+def broker():
+    name = settings.EVENTS_BROKER
+    with _brokers_lock:
+        if name not in _brokers:
+            _brokers[name] = {'local': LocalBroker, 'redis': RedisBroker}[name]()
+        return _brokers[name]
+
+
+class LocalBroker:
+    """Fans events out to the streams open in this process"""
+
+    def __init__(self):
+        self._streams = defaultdict(dict)  # user id -> {queue: its event loop}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, message):
+        self.deliver(user_id, message)
+
+    def deliver(self, user_id, message):
+        with self._lock:
+            streams = list(self._streams.get(user_id, {}).items())
+        for queue, loop in streams:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # That stream's event loop has closed
+                pass
+
+    async def subscribe(self, user_id):
+        """A queue receiving the user's events; pass it to unsubscribe() when done"""
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            self._streams[user_id][queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            streams = self._streams.get(user_id, {})
+            streams.pop(queue, None)
+            if not streams:
+                self._streams.pop(user_id, None)
+
+    def stream_count(self):
+        with self._lock:
+            return sum(len(streams) for streams in self._streams.values())
+
+
+class RedisBroker(LocalBroker):
+    """Publishes through Redis pub/sub; one listener per event loop feeds the local streams"""
+
+    def __init__(self):
+        super().__init__()
+        self._client = None
+        self._listeners = {}
+
+    def publish(self, user_id, message):
+        if self._client is None:
+            self._client = redis.Redis.from_url(settings.EVENTS_REDIS_URL, socket_timeout=5)
+        self._client.publish(f'{CHANNEL_PREFIX}{user_id}', message)
+
+    async def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._listeners or self._listeners[loop].done():
+                self._listeners[loop] = loop.create_task(self._listen())
+        return await super().subscribe(user_id)
+
+    async def _listen(self):
+        while True:
+            client = aioredis.Redis.from_url(settings.EVENTS_REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                    async for message in pubsub.listen():
+                        if message['type'] == 'pmessage':
+                            user_id = int(message['channel'][len(CHANNEL_PREFIX):])
+                            self.deliver(user_id, message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Event listener lost Redis, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+def _offer(queue, message):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
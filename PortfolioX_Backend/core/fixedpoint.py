@@ -0,0 +1,56 @@
+"""Fixed-point reads of DecimalField history columns into NumPy arrays.
+
+Prices and values come back as integer paise and percent returns as integer
+basis points (hundredths of a basis point for the 4 dp daily_return columns,
+so nothing is lost). The scaling and rounding happen in SQL, so the database
+driver hands back plain ints instead of building a Decimal per row. Each
+column is packed with np.fromiter and scaled back to float64 in one
+vectorized step.
+"""
+import numpy as np
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+PAISE = 100                 # rupee prices and values -> paise
+BASIS_POINTS = 100          # 2 dp percent returns -> basis points
+DAILY_RETURN_SCALE = 10000  # daily_return columns keep 4 dp of percent -> hundredths of a bp
+
+# int64 stand-in for NULL while packing; no real paise/bp value gets near it
+_NULL = np.iinfo(np.int64).min
+
+
+def fixed_point(field, scale):
+    """SQL expression reading `field` as round(field * scale)::bigint"""
+    return Cast(Round(F(field) * scale), BigIntegerField())
+
+
+def to_array(values, scale):
+    """Fixed-point ints (None for NULL) -> float64 array with NaN for NULL"""
+    raw = np.fromiter((_NULL if v is None else v for v in values), dtype=np.int64)
+    out = raw / scale
+    out[raw == _NULL] = np.nan
+    return out
+
+
+def fixed_point_array(queryset, field, scale):
+    """One column of a queryset as a float64 array, in queryset order"""
+    return to_array(queryset.values_list(fixed_point(field, scale), flat=True), scale)
+
+
+def history_arrays(queryset, date_field=None, **columns):
+    """Several columns of a queryset as arrays in one query.
+
+    columns maps an output name to (field, scale); the result has one array per
+    name, plus 'dates' (datetime64[D]) when date_field is given.
+    """
+    exprs = {f'fp_{name}': fixed_point(field, scale) for name, (field, scale) in columns.items()}
+    names = ([date_field] if date_field else []) + list(exprs)
+    rows = list(queryset.annotate(**exprs).values_list(*names))
+    cols = list(zip(*rows)) if rows else [()] * len(names)
+
+    arrays = {}
+    if date_field:
+        arrays['dates'] = np.array(cols.pop(0), dtype='datetime64[D]')
+    for (name, (field, scale)), values in zip(columns.items(), cols):
+        arrays[name] = to_array(values, scale)
+    return arrays
@@ -0,0 +1,88 @@
+"""Closed-loop HTTP load generator for comparing server profiles.
+
+run() keeps `concurrency` clients busy against a running server for
+`duration` seconds. Each client is a thread with its own keep-alive
+connection, sending its next GET as soon as the last one completes. It
+reports throughput and latency percentiles. Run it at a few concurrency
+levels against the sync (WSGI) and ASGI profiles of gunicorn_config.py
+with the same worker count and data. bust_cache adds a unique query
+parameter to every request, so cached endpoints are measured on the
+database path rather than on response-cache hits.
+"""
+import base64
+import threading
+import time
+from collections import Counter
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from itertools import count
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+def basic_auth(username, password):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()}
+
+
+def run(base_url, paths, concurrency, duration, headers=None, bust_cache=False, timeout=60):
+    """{'concurrency', 'requests', 'rps', 'statuses', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}"""
+    url = urlsplit(base_url)
+    connection_class = HTTPSConnection if url.scheme == 'https' else HTTPConnection
+    prefix = url.path.rstrip('/')
+    headers = dict(headers or {})
+    sequence = count()
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset):
+        connection = None
+        latencies, statuses = [], Counter()
+        turn = offset
+        while time.monotonic() < deadline:
+            path = prefix + paths[turn % len(paths)]
+            turn += 1
+            if bust_cache:
+                path += ('&' if '?' in path else '?') + f'_bench={next(sequence)}'
+            started = time.perf_counter()
+            try:
+                connection = connection or connection_class(url.hostname, url.port, timeout=timeout)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, HTTPException) as e:
+                if connection is not None:
+                    connection.close()
+                connection = None
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+        if connection is not None:
+            connection.close()
+        with lock:
+            results.append((latencies, statuses))
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([ms for latency, _ in results for ms in latency]) * 1000
+    statuses = sum((s for _, s in results), Counter())
+    if not len(latencies):
+        latencies = np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'concurrency': concurrency,
+        'requests': int(sum(statuses.values())),
+        'rps': round(sum(statuses.values()) / elapsed, 1),
+        'statuses': dict(statuses),
+        'p50_ms': round(float(p50), 1),
+        'p95_ms': round(float(p95), 1),
+        'p99_ms': round(float(p99), 1),
+        'max_ms': round(float(latencies.max()), 1),
+    }
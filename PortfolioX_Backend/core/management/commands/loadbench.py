@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.loadbench import basic_auth, run
+
+
+class Command(BaseCommand):
+    help = "Load a running server with concurrent GETs and report throughput and latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Server root, e.g. http://127.0.0.1:8000')
+        parser.add_argument('paths', nargs='+', help='Paths requested round-robin, e.g. /analytics/api/dashboard/')
+        parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help='Concurrent clients; one run per value')
+        parser.add_argument('-d', '--duration', type=float, default=10, help='Seconds per run')
+        parser.add_argument('--user', help='Username for HTTP basic auth')
+        parser.add_argument('--password', default='', help='Password for HTTP basic auth')
+        parser.add_argument('-H', '--header', action='append', default=[], metavar='NAME:VALUE',
+                            help='Extra request header (repeatable)')
+        parser.add_argument('--bust-cache', action='store_true',
+                            help='Unique query string per request, so cached endpoints always miss')
+
+    def handle(self, *args, **options):
+        headers = basic_auth(options['user'], options['password']) if options['user'] else {}
+        for header in options['header']:
+            name, sep, value = header.partition(':')
+            if not sep:
+                raise CommandError(f"Header must be NAME:VALUE, got {header!r}")
+            headers[name.strip()] = value.strip()
+
+        self.stdout.write(f"{'clients':>7} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'max ms':>8}  statuses")
+        for concurrency in options['concurrency']:
+            result = run(options['base_url'], options['paths'], concurrency, options['duration'],
+                         headers=headers, bust_cache=options['bust_cache'])
+            statuses = ' '.join(f'{status}={n}' for status, n in sorted(result['statuses'].items(), key=str))
+            self.stdout.write(
+                f"{result['concurrency']:>7} {result['requests']:>9} {result['rps']:>8} {result['p50_ms']:>8} "
+                f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['max_ms']:>8}  {statuses}"
+            )
@@ -0,0 +1,41 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from core.partitioning import PARTITIONED_TABLES, create_partitions, detach_partitions, list_partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly partitions for the history tables, or detach/archive old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='Months ahead to create partitions for')
+        parser.add_argument('--detach-before', type=str, metavar='YYYY-MM', help='Detach partitions for months before this one')
+        parser.add_argument('--archive-schema', type=str, help='Move detached partitions into this schema')
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them')
+        parser.add_argument('--list', action='store_true', help='List existing partitions')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for table in PARTITIONED_TABLES:
+                partitions = list_partitions(table)
+                self.stdout.write(f"{table}: {len(partitions)} partitions")
+                for name, month in partitions:
+                    self.stdout.write(f"  {name}")
+            return
+
+        if options['detach_before']:
+            if options['drop'] and options['archive_schema']:
+                raise CommandError("Use either --drop or --archive-schema, not both")
+            try:
+                before = datetime.strptime(options['detach_before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--detach-before must be YYYY-MM")
+            detached = detach_partitions(before, archive_schema=options['archive_schema'], drop=options['drop'])
+            self.stdout.write(f"Detached {len(detached)} partitions")
+            for name in detached:
+                self.stdout.write(f"  {name}")
+            return
+
+        created = create_partitions(months_ahead=options['ahead'])
+        self.stdout.write(f"Created {len(created)} partitions")
+        for name in created:
+            self.stdout.write(f"  {name}")
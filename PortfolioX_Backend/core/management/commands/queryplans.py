@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core.queryplans import HOT_QUERIES, capture, compare, context, load_baseline, save_baseline, seed
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN (ANALYZE, BUFFERS) the registered hot queries and check them against the stored plan baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='Seed the qp_* data set first (skipped if present) and roll it back afterwards')
+        parser.add_argument('--keep-seed', action='store_true',
+                            help='With --seed, commit the data set for later runs; only on a database used for nothing else')
+        parser.add_argument('--scale', type=int, default=1, help='Seed volume multiplier')
+        parser.add_argument('--only', nargs='+', metavar='NAME', help='Only these registered queries')
+        parser.add_argument('--update-baseline', action='store_true', help='Store the captured plans as the new baseline')
+        parser.add_argument('--list', action='store_true', help='List registered query names')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name in HOT_QUERIES:
+                self.stdout.write(name)
+            return
+        if connection.vendor != 'postgresql':
+            raise CommandError("Query plans are only captured on PostgreSQL")
+
+        unknown = set(options['only'] or []) - set(HOT_QUERIES)
+        if unknown:
+            raise CommandError(f"Unknown queries: {', '.join(sorted(unknown))}")
+
+        if options['keep_seed'] and not options['seed']:
+            raise CommandError("--keep-seed only applies with --seed")
+        if options['seed']:
+            # Everything seeded stays inside this transaction (reads included, see
+            # core.db_router) and is rolled back unless --keep-seed
+            with transaction.atomic():
+                plans = capture(seed(scale=options['scale']), options['only'])
+                transaction.set_rollback(not options['keep_seed'])
+        else:
+            ctx = context()
+            if ctx is None:
+                raise CommandError("No seeded data; run with --seed")
+            plans = capture(ctx, options['only'])
+
+        for name, plan in plans.items():
+            self.stdout.write(
+                f"{name}: {plan['execution_ms']} ms, buffers hit={plan['shared_hit']} read={plan['shared_read']}"
+            )
+            for step in plan['signature']:
+                self.stdout.write(f"    {step}")
+            for flag in plan['flags']:
+                self.stdout.write(f"    ! {flag}")
+
+        if options['update_baseline']:
+            baseline = load_baseline() if options['only'] else {}
+            baseline.update(plans)
+            save_baseline(baseline)
+            self.stdout.write(f"Baseline updated ({len(baseline)} queries)")
+            return
+
+        report = compare(plans, load_baseline())
+        failed = False
+        for name, result in report.items():
+            if result.get('new'):
+                self.stdout.write(f"{name}: not in baseline")
+            elif result['plan_changed']:
+                self.stdout.write(f"{name}: plan shape changed")
+            for flag in result['regressions']:
+                self.stdout.write(self.style.ERROR(f"{name}: {flag}"))
+                failed = True
+        if failed:
+            raise CommandError("Query plan regressions against the baseline")
+        self.stdout.write(self.style.SUCCESS("No query plan regressions"))
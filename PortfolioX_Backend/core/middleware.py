@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.functional import SimpleLazyObject, empty
+
+from core.db_router import pin_when, use_primary
+from core.querybudget import QueryCounter, collect_exceeded
+
+logger = logging.getLogger('portfoliox.queries')
+
+PIN_COOKIE = 'db_pin_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def pin_cache_key(user_id):
+    return f'db:pin:user:{user_id}'
+
+
+class ReadYourWritesMiddleware:
+    """Pin reads to the primary for write requests and for a short window after them.
+
+    The window is kept per user in the cache, so it holds whichever way the
+    client authenticates (the frontend sends a header from another origin and
+    never sees cookies). DRF authenticates inside the view, so a read request
+    is only pinned from its first query after the user is known. Anonymous
+    writers get a cookie instead.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writing = request.method not in SAFE_METHODS
+        with self._routing(request, writing):
+            response = self.get_response(request)
+        return self._pin(request, writing, response)
+
+    async def __acall__(self, request):
+        writing = request.method not in SAFE_METHODS
+        # The pin is a context variable, so sync_to_async'd ORM calls see it too
+        with self._routing(request, writing):
+            response = await self.get_response(request)
+        return self._pin(request, writing, response)
+
+    def _routing(self, request, writing):
+        if writing or self._cookie_pinned(request):
+            return use_primary()
+        return pin_when(lambda: self._user_pinned(request))
+
+    @staticmethod
+    def _pin(request, writing, response):
+        if writing and response.status_code < 400:
+            window = settings.READ_YOUR_WRITES_SECONDS
+            until = int(time.time() + window)
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                caches[settings.READ_YOUR_WRITES_CACHE].set(pin_cache_key(user.pk), until, window)
+            else:
+                response.set_cookie(PIN_COOKIE, str(until), max_age=window, httponly=True)
+        return response
+
+    @staticmethod
+    def _cookie_pinned(request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def _user_pinned(request):
+        if '_db_pinned' in request.__dict__:
+            return request._db_pinned
+        # AuthenticationMiddleware's lazy user until something resolves it. Anonymous
+        # may still become a user: DRF tries header authentication after the session
+        user = request.__dict__.get('user')
+        if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+            return False
+        if not user.is_authenticated:
+            return False
+        until = caches[settings.READ_YOUR_WRITES_CACHE].get(pin_cache_key(user.pk))
+        request._db_pinned = until is not None and until > time.time()
+        return request._db_pinned
+
+
+class QueryBudgetMiddleware:
+    """Record query count and SQL time per request.
+
+    Adds X-Query-Count / X-Query-Time-Ms headers, logs requests that exceeded a
+    declared budget or QUERY_BUDGET_SLOW_MS, and keeps per-view totals (see stats()).
+    """
+
+    _stats = {}
+    _lock = threading.Lock()
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with counter.track(), collect_exceeded() as exceeded:
+            response = self.get_response(request)
+        return self._finish(request, response, counter, exceeded, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        # Under ASGI the ORM runs in the request's sync_to_async thread; count on its connections
+        tracking = counter.track()
+        await sync_to_async(tracking.__enter__)()
+        try:
+            with collect_exceeded() as exceeded:
+                response = await self.get_response(request)
+        finally:
+            await sync_to_async(tracking.__exit__)(None, None, None)
+        return self._finish(request, response, counter, exceeded, started)
+
+    def _finish(self, request, response, counter, exceeded, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        sql_ms = counter.duration * 1000
+
+        request.query_stats = {'count': counter.count, 'sql_ms': sql_ms, 'exceeded': exceeded}
+        response['X-Query-Count'] = str(counter.count)
+        response['X-Query-Time-Ms'] = f'{sql_ms:.1f}'
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        self._record(view, counter.count, sql_ms)
+        if exceeded:
+            logger.warning("%s %s over query budget: %s", request.method, request.path,
+                           ', '.join(f'{name} {count}/{budget}' for name, budget, count in exceeded))
+        elif total_ms >= settings.QUERY_BUDGET_SLOW_MS:
+            logger.warning("%s %s took %.0f ms (%d queries, %.0f ms SQL)",
+                           request.method, request.path, total_ms, counter.count, sql_ms)
+        return response
+
+    @classmethod
+    def _record(cls, view, count, sql_ms):
+        with cls._lock:
+            entry = cls._stats.setdefault(view, {'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0})
+            entry['requests'] += 1
+            entry['queries'] += count
+            entry['max_queries'] = max(entry['max_queries'], count)
+            entry['sql_ms'] += sql_ms
+
+    @classmethod
+    def stats(cls):
+        """{view name: {'requests', 'queries', 'max_queries', 'sql_ms'}} since process start"""
+        with cls._lock:
+            return {view: dict(entry) for view, entry in cls._stats.items()}
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_stockpopulationjob'),
+        ('portfolios', '0003_holding_idx_holdings_pf_value'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='alert',
+            name='idx_alerts_user_unread',
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at', '-id'], name='idx_alerts_user_unread'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alert_unread_created_index'),
+        ('portfolios', '0004_sector_exposure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Build the replacement before dropping the FK index it covers
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='idx_alerts_user_created'),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,5 +1,8 @@
-﻿from django.db import models
+﻿from datetime import timedelta
+
+from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from portfolios.models import Portfolio
 
 class Alert(models.Model):
@@ -9,7 +12,8 @@ class Alert(models.Model):
         ('sector_imbalance', 'Sector Imbalance'),
         ('price_alert', 'Price Alert'),
     ]
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # No separate FK index: both listing indexes lead with user
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     portfolio = models.ForeignKey(Portfolio, on_delete=models.SET_NULL, null=True)
     alert_type = models.CharField(max_length=30, choices=TYPE_CHOICES)
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
@@ -19,7 +23,9 @@ class Alert(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         indexes = [
-            models.Index(fields=['user'], name='idx_alerts_user_unread', condition=models.Q(is_read=False)),
+            # Keyset pages (core.pagination) of unread and of all alerts
+            models.Index(fields=['user', '-created_at', '-id'], name='idx_alerts_user_unread', condition=models.Q(is_read=False)),
+            models.Index(fields=['user', '-created_at', '-id'], name='idx_alerts_user_created'),
         ]
 class UploadJob(models.Model):
     STATUS_CHOICES = [
@@ -32,3 +38,43 @@ class UploadJob(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_log = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+class StockPopulationJob(models.Model):
+    STATUS_CHOICES = UploadJob.STATUS_CHOICES
+    ACTIVE_STATUSES = ['pending', 'processing']
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    query = models.CharField(max_length=50)
+    symbol = models.CharField(max_length=20, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error_log = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    class Meta:
+        constraints = [
+            # At most one queued/running job per search term; concurrent adds share it.
+            # A job lost with its message or worker stops counting once expire_stale() fails it.
+            models.UniqueConstraint(
+                fields=['query'], name='uniq_active_stock_population',
+                condition=models.Q(status__in=['pending', 'processing']),
+            ),
+        ]
+
+    @staticmethod
+    def stale_cutoff():
+        return timezone.now() - timedelta(seconds=settings.STOCK_POPULATION_JOB_TIMEOUT)
+
+    @property
+    def is_stale(self):
+        return self.status in self.ACTIVE_STATUSES and self.created_at < self.stale_cutoff()
+
+    @classmethod
+    def expire_stale(cls, **filters):
+        """Fail queued/running jobs older than STOCK_POPULATION_JOB_TIMEOUT; returns how many"""
+        return cls.objects.filter(
+            status__in=cls.ACTIVE_STATUSES, created_at__lt=cls.stale_cutoff(), **filters
+        ).update(
+            status='failed',
+            error_log={'error': 'Timed out before the lookup finished'},
+            completed_at=timezone.now(),
+        )
@@ -0,0 +1,129 @@
+"""Keyset (cursor) pagination on (created_at, id), newest first.
+
+A page is "the next `limit` rows after the last one the client saw", so
+every page is an index range scan from the cursor, with no OFFSET to walk
+past. Deep pages cost the same as the first, and rows added meanwhile do
+not shift the pages. The listed table needs an index ending in
+(created_at DESC, id DESC) after its equality filters.
+
+The cursor is opaque to clients: base64 of a boundary row's created_at and
+id, and which side of it the page lies on. next_cursor (after the last row)
+and prev_cursor (before the first) are sent back as ?cursor=. Rows tied on
+created_at are ordered by id, so walking either way sees each row once.
+"""
+import base64
+from datetime import datetime, time
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(created_at, pk, before=False):
+    raw = f'{created_at.isoformat()}|{pk}' + ('|before' if before else '')
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id, before) from a cursor; ValidationError (400) if it was not one of ours"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk, *direction = raw.split('|')
+        if direction not in ([], ['before']):
+            raise ValueError(raw)
+        created_at = datetime.fromisoformat(created_at)
+        if timezone.is_naive(created_at):
+            raise ValueError(created_at)
+        return created_at, int(pk), bool(direction)
+    except ValueError:
+        raise ValidationError({'cursor': 'Invalid cursor'})
+
+
+def after_cursor(queryset, cursor):
+    """Rows that come after `cursor`'s row in (-created_at, -id) order.
+
+    The redundant created_at <= bound gives PostgreSQL an index condition to
+    start the scan at; the OR alone would only be a filter on a scan from the top.
+    """
+    created_at, pk, _ = decode_cursor(cursor)
+    return queryset.filter(created_at__lte=created_at).filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    )
+
+
+def before_cursor(queryset, cursor):
+    """Rows that come before `cursor`'s row in (-created_at, -id) order, bounded the same way"""
+    created_at, pk, _ = decode_cursor(cursor)
+    return queryset.filter(created_at__gte=created_at).filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    )
+
+
+def keyset_page(queryset, request):
+    """(rows, next_cursor, prev_cursor) for the page of `queryset` that ?cursor= and ?limit= ask for.
+
+    `queryset` yields dicts with created_at and id (a .values() queryset).
+    Rows are newest first whichever way the cursor points; next_cursor is
+    None on the last page and prev_cursor on the first.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        raise ValidationError({'limit': 'Must be an integer'})
+
+    cursor = request.GET.get('cursor')
+    if cursor and decode_cursor(cursor)[2]:
+        # The rows just before the cursor are the oldest of the newer ones: scan up, then flip
+        rows = list(before_cursor(queryset, cursor).order_by('created_at', 'id')[:limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        if not rows:
+            return rows, None, None
+        return rows, _cursor(rows[-1]), _cursor(rows[0], before=True) if more else None
+
+    if cursor:
+        queryset = after_cursor(queryset, cursor)
+    # One extra row tells whether there is a next page
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _cursor(rows[-1]) if more else None
+    return rows, next_cursor, _cursor(rows[0], before=True) if cursor and rows else None
+
+
+def _cursor(row, before=False):
+    return encode_cursor(row['created_at'], row['id'], before)
+
+
+def date_param(request, name):
+    """?name=YYYY-MM-DD as a date, None when absent; ValidationError if malformed"""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Use YYYY-MM-DD'})
+    return parsed
+
+
+def day_start(day):
+    """Aware datetime at the start of `day` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def choice_param(request, name, choices):
+    """?name= checked against a field's choices, None when absent"""
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    allowed = [key for key, _ in choices]
+    if value not in allowed:
+        raise ValidationError({name: f"One of {', '.join(allowed)}"})
+    return value
@@ -0,0 +1,171 @@
+"""Monthly range partitioning for the append-only history tables.
+
+PostgreSQL only; on other backends every function here is a no-op so SQLite
+or ad-hoc dev databases keep working with plain tables. Partitions are named
+<table>_pYYYYMM and each table also has a <table>_default catch-all, which
+create_partitions() drains into the new partition if it ever holds rows.
+"""
+from datetime import date
+
+from django.db import connection
+
+# db_table -> partition key column
+PARTITIONED_TABLES = {
+    'market_stockpricehistory': 'trade_date',
+    'analytics_portfoliovaluehistory': 'record_date',
+}
+
+
+def month_start(d):
+    return d.replace(day=1)
+
+
+def add_months(d, n):
+    years, month = divmod(d.month - 1 + n, 12)
+    return date(d.year + years, month + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def convert_to_partitioned(schema_editor, model, column, months_ahead=3):
+    """Rebuild a model's table as PARTITION BY RANGE (column), keeping its rows.
+
+    Used from migrations. The primary key becomes (id, column) because
+    PostgreSQL requires the partition key in every unique constraint; ids are
+    still unique since they come from the same sequence.
+    """
+    conn = schema_editor.connection
+    if conn.vendor != 'postgresql':
+        return
+    table = model._meta.db_table
+    old = f'{table}_unpartitioned'
+    qn = schema_editor.quote_name
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [table])
+        if cursor.fetchone()[0] == 'p':
+            return
+        cursor.execute(f'SELECT MIN({qn(column)}), MAX({qn(column)}) FROM {qn(table)}')
+        low, high = cursor.fetchone()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [table]
+        )
+        is_identity = cursor.fetchone()[0] != ''
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+    schema_editor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old)}')
+    schema_editor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(old)} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+        f'PARTITION BY RANGE ({qn(column)})'
+    )
+    schema_editor.execute(f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT')
+
+    today = date.today()
+    month = month_start(low or today)
+    last = add_months(month_start(max(high or today, today)), months_ahead)
+    while month <= last:
+        _create_partition(schema_editor.execute, table, column, month, qn)
+        month = add_months(month, 1)
+
+    schema_editor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old)}')
+    if is_identity:
+        schema_editor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {qn(table)}), 0) + 1, false)"
+        )
+    else:
+        # serial column: the copied DEFAULT still points at the old table's sequence
+        schema_editor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+    schema_editor.execute(f'DROP TABLE {qn(old)}')
+
+    # Recreate the constraints and indexes the model declares, on the parent
+    schema_editor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, {qn(column)})')
+    schema_editor.alter_unique_together(model, [], model._meta.unique_together)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+        if field.db_index and not field.unique:
+            schema_editor.execute(schema_editor._create_index_sql(model, fields=[field]))
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+
+
+def create_partitions(months_ahead=3, tables=None, start=None):
+    """Make sure every month from `start` (default: now) to months_ahead has its own partition"""
+    if connection.vendor != 'postgresql':
+        return []
+    qn = connection.ops.quote_name
+    created = []
+    last = add_months(month_start(date.today()), months_ahead)
+    with connection.cursor() as cursor:
+        for table, column in (tables or PARTITIONED_TABLES).items():
+            month = month_start(start or date.today())
+            while month <= last:
+                if _create_partition(cursor.execute, table, column, month, qn):
+                    created.append(partition_name(table, month))
+                month = add_months(month, 1)
+    return created
+
+
+def list_partitions(table):
+    """(partition name, month) pairs for a table, oldest first; excludes the default partition"""
+    if connection.vendor != 'postgresql':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname", [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{table}_p'
+    return [
+        (name, date(int(name[-6:-2]), int(name[-2:]), 1))
+        for name in names if name.startswith(prefix) and name[len(prefix):].isdigit()
+    ]
+
+
+def detach_partitions(before, archive_schema=None, drop=False, tables=None):
+    """Detach partitions for months entirely before `before`.
+
+    Detached tables are left in place, moved to archive_schema, or dropped.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    qn = connection.ops.quote_name
+    detached = []
+    with connection.cursor() as cursor:
+        if archive_schema:
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {qn(archive_schema)}')
+        for table in (tables or PARTITIONED_TABLES):
+            for name, month in list_partitions(table):
+                if add_months(month, 1) > month_start(before):
+                    continue
+                cursor.execute(f'ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {qn(name)}')
+                elif archive_schema:
+                    cursor.execute(f'ALTER TABLE {qn(name)} SET SCHEMA {qn(archive_schema)}')
+                detached.append(name)
+    return detached
+
+
+def _create_partition(execute, table, column, month, qn):
+    """Create and attach one month's partition; returns False if it already exists"""
+    name = partition_name(table, month)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    execute(f'CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS)')
+    # Rows that landed in the default partition for this month move with it
+    execute(
+        f'WITH moved AS (DELETE FROM {qn(table + "_default")} '
+        f"WHERE {qn(column)} >= '{start}' AND {qn(column)} < '{end}' RETURNING *) "
+        f'INSERT INTO {qn(name)} SELECT * FROM moved'
+    )
+    execute(f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM ('{start}') TO ('{end}')")
+    return True
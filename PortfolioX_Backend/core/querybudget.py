@@ -0,0 +1,148 @@
+"""SQL query budgets.
+
+query_budget(n) declares the most queries a service call, view or block may
+run, as a decorator or a context manager; queries are counted on every
+database alias. What happens when a budget is exceeded is set by
+QUERY_BUDGET_MODE: 'raise' (QueryBudgetExceeded), 'warn' (logged) or 'off'.
+
+Decorated callables expose their budget as `.query_budget` and every named
+budget is listed in BUDGETS. Coroutine functions can be decorated too: their
+queries run in the request's sync_to_async thread, so the counter is
+attached to that thread's connections. QueryBudgetMiddleware (core.middleware) records
+the count and SQL time of every request; core.testing has the test helpers.
+Queries inside uncounted() are not charged to anything.
+"""
+import logging
+import time
+from contextlib import ContextDecorator, ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('portfoliox.queries')
+
+# name -> max queries, for every budget declared so far
+BUDGETS = {}
+
+# Budgets exceeded during the current request, read by the middleware
+_exceeded = ContextVar('query_budgets_exceeded', default=None)
+
+# Set inside uncounted(): queries no counter charges to the code around them
+_suspended = ContextVar('query_counting_suspended', default=False)
+
+
+class QueryBudgetExceeded(Exception):
+
+    def __init__(self, name, budget, count, queries=()):
+        self.name, self.budget, self.count, self.queries = name, budget, count, list(queries)
+        super().__init__(f"{name} ran {count} queries, budget is {budget}")
+
+
+class QueryCounter:
+    """execute_wrapper counting queries and SQL time on every connection while tracking"""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if _suspended.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+            if self.keep_sql:
+                self.queries.append(sql)
+
+    @contextmanager
+    def track(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+
+class query_budget(ContextDecorator):
+
+    def __init__(self, max_queries, name=None):
+        self.max_queries = max_queries
+        self.name = name
+        if name:
+            BUDGETS[name] = max_queries
+
+    def __call__(self, func):
+        if not self.name:
+            self.name = f'{func.__module__}.{func.__qualname__}'
+            BUDGETS[self.name] = self.max_queries
+        wrapped = self._async_wrapper(func) if iscoroutinefunction(func) else super().__call__(func)
+        wrapped.query_budget = self.max_queries
+        return wrapped
+
+    def _async_wrapper(self, func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            budget = self._recreate_cm()
+            await sync_to_async(budget.__enter__)()
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException as e:
+                await sync_to_async(budget.__exit__)(type(e), e, e.__traceback__)
+                raise
+            await sync_to_async(budget.__exit__)(None, None, None)
+            return result
+        return inner
+
+    def _recreate_cm(self):
+        # A fresh counter per call, so decorated functions are reentrant and thread-safe
+        return query_budget(self.max_queries, self.name)
+
+    def __enter__(self):
+        self._counter = QueryCounter(keep_sql=settings.QUERY_BUDGET_MODE == 'raise')
+        self._tracking = self._counter.track()
+        self._tracking.__enter__()
+        return self._counter
+
+    def __exit__(self, exc_type, exc, tb):
+        self._tracking.__exit__(exc_type, exc, tb)
+        mode = settings.QUERY_BUDGET_MODE
+        if exc_type is not None or mode == 'off' or self._counter.count <= self.max_queries:
+            return False
+
+        exceeded = _exceeded.get()
+        if exceeded is not None:
+            exceeded.append((self.name, self.max_queries, self._counter.count))
+        if mode == 'raise':
+            raise QueryBudgetExceeded(self.name, self.max_queries, self._counter.count, self._counter.queries)
+        logger.warning("%s ran %d queries, budget is %d", self.name, self._counter.count, self.max_queries)
+        return False
+
+
+@contextmanager
+def uncounted():
+    """Leave the block's queries out of every counter and budget, for infrastructure
+    queries such as the router's replica lag probe that no view or service asked for"""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+@contextmanager
+def collect_exceeded():
+    """Collect (name, budget, count) for every budget exceeded inside the block"""
+    exceeded = []
+    token = _exceeded.set(exceeded)
+    try:
+        yield exceeded
+    finally:
+        _exceeded.reset(token)
@@ -0,0 +1,454 @@
+"""Query-plan regression harness for the hot ORM queries.
+
+HOT_QUERIES is a registry of named query builders mirroring what the
+analytics services and API views run. seed() fills the database with a
+realistic volume of data under a dedicated user set (qp_*); the management
+command rolls it back once the plans are captured unless told the database
+is a dedicated one (--keep-seed). capture() runs EXPLAIN (ANALYZE, BUFFERS)
+for every registered query, and compare() checks each plan against the
+stored baseline (core/data/query_plans.json).
+
+A plan is flagged for
+  - a Seq Scan reading at least SEQ_SCAN_ROWS rows,
+  - a Sort over at least SORT_ROWS rows,
+  - a node whose row estimate is off by ESTIMATE_RATIO or more;
+only flags missing from the baseline count as regressions. PostgreSQL only,
+see the queryplans management command.
+"""
+import json
+import random
+from collections import namedtuple
+from functools import lru_cache
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from core.fixedpoint import DAILY_RETURN_SCALE, PAISE, fixed_point
+from core.partitioning import create_partitions
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'data' / 'query_plans.json'
+
+SEQ_SCAN_ROWS = 1000
+SORT_ROWS = 1000
+ESTIMATE_RATIO = 10
+ESTIMATE_MIN_ROWS = 100
+
+
+Context = namedtuple('Context', ['user_id', 'portfolio_id', 'benchmark_id', 'stock_id', 'today'])
+
+HOT_QUERIES = {}
+
+
+def hot_query(name):
+    """Register a builder: fn(ctx) -> QuerySet, run the way its caller runs it"""
+    def register(builder):
+        HOT_QUERIES[name] = builder
+        return builder
+    return register
+
+
+# --------------------------------------------------------------- registry
+
+@hot_query('value_history.period_values')
+def _value_history_period(ctx):
+    # ReturnsCalculator._calculate_return / RiskMetrics.calculate_max_drawdown
+    from analytics.models import PortfolioValueHistory
+    return PortfolioValueHistory.objects.filter(
+        portfolio_id=ctx.portfolio_id,
+        record_date__gte=ctx.today - timedelta(days=365),
+        record_date__lte=ctx.today,
+    ).order_by('record_date').values_list(fixed_point('total_value', PAISE), flat=True)
+
+
+@hot_query('value_history.returns')
+def _value_history_returns(ctx):
+    # RiskMetrics.calculate_sharpe_ratio / AlphaBetaCalculator.calculate
+    from analytics.models import PortfolioValueHistory
+    return PortfolioValueHistory.objects.filter(
+        portfolio_id=ctx.portfolio_id,
+        record_date__gte=ctx.today - timedelta(days=365),
+    ).order_by('record_date').values_list(
+        'record_date', fixed_point('total_value', PAISE), fixed_point('daily_return', DAILY_RETURN_SCALE)
+    )
+
+
+@hot_query('value_history.update_daily_returns')
+def _value_history_all(ctx):
+    # ReturnsCalculator.update_daily_returns
+    from analytics.models import PortfolioValueHistory
+    return PortfolioValueHistory.objects.filter(portfolio_id=ctx.portfolio_id).order_by('record_date')
+
+
+@hot_query('benchmark_history.closes')
+def _benchmark_closes(ctx):
+    # ReturnsCalculator.benchmark_closes fallback
+    from market.models import BenchmarkPriceHistory
+    return BenchmarkPriceHistory.objects.filter(
+        benchmark_id=ctx.benchmark_id,
+        trade_date__gte=ctx.today - timedelta(days=365),
+    ).order_by('trade_date').values_list('trade_date', fixed_point('close_value', PAISE))
+
+
+@hot_query('stock_history.closes')
+def _stock_closes(ctx):
+    # AdjustedPrices._raw_closes fallback
+    from market.models import StockPriceHistory
+    return StockPriceHistory.objects.filter(
+        stock_id=ctx.stock_id,
+        trade_date__gte=ctx.today - timedelta(days=365),
+        trade_date__lte=ctx.today,
+    ).order_by('trade_date').values_list('trade_date', fixed_point('close_price', PAISE))
+
+
+@hot_query('stock_history.price_store_refresh')
+def _price_store_refresh(ctx):
+    # PriceStore.refresh: the last stored day plus the stocks not in the store yet or reloaded
+    from market.models import StockPriceHistory
+    return StockPriceHistory.objects.filter(
+        Q(trade_date__gte=ctx.today - timedelta(days=1)) | Q(stock_id__in=[ctx.stock_id])
+    ).values_list('stock_id', 'trade_date', fixed_point('close_price', PAISE))
+
+
+@hot_query('holdings.top')
+def _holdings_top(ctx):
+    # DiversificationScorer.get_top_holdings / get_concentration_data
+    from portfolios.models import Holding
+    return Holding.objects.filter(portfolio_id=ctx.portfolio_id).select_related('stock').order_by('-current_value')[:5]
+
+
+@hot_query('sector_exposure.allocation')
+def _sector_allocation(ctx):
+    # SectorExposure.allocation (DiversificationScorer sector score and allocation)
+    from portfolios.models import SectorExposure
+    return SectorExposure.objects.filter(portfolio_id=ctx.portfolio_id).order_by('-current_value').values_list('sector__name', 'current_value')
+
+
+@hot_query('sector_exposure.by_sector')
+def _sector_exposure_by_sector(ctx):
+    # Cross-portfolio report: largest holders of one sector
+    from market.models import Stock
+    from portfolios.models import SectorExposure
+    sector_id = Stock.objects.filter(id=ctx.stock_id).values_list('sector_id', flat=True).first()
+    return SectorExposure.objects.filter(sector_id=sector_id).order_by('-current_value')[:50]
+
+
+@hot_query('sector_exposure.totals')
+def _sector_totals(ctx):
+    from portfolios.models import SectorExposure
+    return SectorExposure.sector_totals()
+
+
+@hot_query('analysis.latest')
+def _latest_analysis(ctx):
+    # analytics.views._get_latest_analysis
+    from analytics.models import LatestAnalysis
+    return LatestAnalysis.objects.select_related('portfolio').filter(
+        portfolio_id=ctx.portfolio_id, portfolio__user_id=ctx.user_id
+    )[:1]
+
+
+@hot_query('analysis.performance')
+def _analysis_performance(ctx):
+    # HistoryReader.analysis_series (rows after the archive)
+    from analytics.models import AnalysisResult
+    return AnalysisResult.objects.filter(
+        portfolio_id=ctx.portfolio_id, analysis_date__gte=ctx.today - timedelta(days=365)
+    ).order_by('analysis_date').values('analysis_date', 'return_ytd', 'health_score', 'diversification_score', 'sharpe_ratio')
+
+
+@hot_query('alerts.unread')
+def _alerts_unread(ctx):
+    from core.models import Alert
+    return Alert.objects.filter(user_id=ctx.user_id, is_read=False).order_by('-created_at')
+
+
+def _deep_page(queryset, depth):
+    # core.pagination.keyset_page from a cursor `depth` rows in
+    from core.pagination import after_cursor, encode_cursor
+    ordered = queryset.order_by('-created_at', '-id')
+    row = ordered.values('created_at', 'id')[depth:depth + 1].first()
+    if row:
+        ordered = after_cursor(ordered, encode_cursor(row['created_at'], row['id']))
+    return ordered[:51]
+
+
+@hot_query('alerts.page_unread')
+def _alerts_page_unread(ctx):
+    # core.views.list_alerts?unread=true
+    from core.models import Alert
+    return _deep_page(Alert.objects.filter(user_id=ctx.user_id, is_read=False), 20)
+
+
+@hot_query('alerts.page_all')
+def _alerts_page_all(ctx):
+    # core.views.list_alerts
+    from core.models import Alert
+    return _deep_page(Alert.objects.filter(user_id=ctx.user_id), 100)
+
+
+@hot_query('alerts.page_back')
+def _alerts_page_back(ctx):
+    # core.views.list_alerts?cursor=<prev_cursor>
+    from core.models import Alert
+    from core.pagination import before_cursor, encode_cursor
+    alerts = Alert.objects.filter(user_id=ctx.user_id)
+    row = alerts.order_by('-created_at', '-id').values('created_at', 'id')[100:101].first()
+    if row:
+        alerts = before_cursor(alerts, encode_cursor(row['created_at'], row['id'], before=True))
+    return alerts.order_by('created_at', 'id')[:51]
+
+
+@hot_query('transactions.page')
+def _transactions_page(ctx):
+    # portfolios.views.list_transactions
+    from portfolios.models import PortfolioTransaction
+    return _deep_page(PortfolioTransaction.objects.filter(portfolio_id=ctx.portfolio_id), 30)
+
+
+@hot_query('dashboard.portfolios')
+def _dashboard_portfolios(ctx):
+    # analytics.views.get_dashboard
+    from portfolios.models import Portfolio
+    return Portfolio.objects.filter(user_id=ctx.user_id, is_active=True).select_related('latest_analysis').order_by('name')
+
+
+@hot_query('dashboard.alerts')
+def _dashboard_alerts(ctx):
+    # analytics.views.get_dashboard: newest unread alerts per portfolio
+    from django.db.models import F, Window
+    from django.db.models.functions import RowNumber
+    from core.models import Alert
+    from portfolios.models import Portfolio
+    portfolio_ids = list(Portfolio.objects.filter(user_id=ctx.user_id).values_list('id', flat=True))
+    return Alert.objects.filter(user_id=ctx.user_id, is_read=False, portfolio_id__in=portfolio_ids).annotate(
+        rank=Window(RowNumber(), partition_by=[F('portfolio_id')], order_by=F('created_at').desc())
+    ).filter(rank__lte=3).order_by('portfolio_id', 'rank').values('id', 'portfolio_id', 'alert_type', 'priority', 'title', 'created_at')
+
+
+@hot_query('portfolios.for_user')
+def _portfolios_for_user(ctx):
+    from portfolios.models import Portfolio
+    return Portfolio.objects.filter(user_id=ctx.user_id, is_active=True)
+
+
+# ------------------------------------------------------------------- seed
+
+def seed(scale=1, days=730, seed_value=0):
+    """Create the qp_* data set (skipped if already present); returns its Context"""
+    from analytics.models import AnalysisResult, LatestAnalysis, PortfolioValueHistory
+    from core.models import Alert
+    from market.models import BenchmarkIndex, BenchmarkPriceHistory, Sector, Stock, StockPriceHistory
+    from portfolios.models import Holding, Portfolio, PortfolioTransaction, SectorExposure
+    from users.models import User
+
+    existing = context()
+    if existing:
+        return existing
+
+    rng = random.Random(seed_value)
+    today = date.today()
+    dates = [today - timedelta(days=d) for d in range(days - 1, -1, -1) if (today - timedelta(days=d)).weekday() < 5]
+    # Give the seeded months their own partitions like production has, not the default one
+    create_partitions(start=dates[0])
+    n_stocks, n_users = 300 * scale, 20 * scale
+
+    sectors = [Sector.objects.get_or_create(name=f'qp_sector_{i}')[0] for i in range(10)]
+    Stock.objects.bulk_create([
+        Stock(symbol=f'QP{i:05d}.NS', name=f'QP stock {i}', sector=sectors[i % len(sectors)],
+              current_price=Decimal(rng.randint(50, 5000)))
+        for i in range(n_stocks)
+    ])
+    stocks = list(Stock.objects.filter(symbol__startswith='QP').order_by('id'))
+    BenchmarkIndex.objects.bulk_create([
+        BenchmarkIndex(symbol=f'^QP{i}', name=f'QP index {i}') for i in range(5)
+    ])
+    benchmarks = list(BenchmarkIndex.objects.filter(symbol__startswith='^QP').order_by('id'))
+
+    def walk(start):
+        price = start
+        for _ in dates:
+            price = max(1.0, price * (1 + rng.gauss(0, 0.015)))
+            yield Decimal(f'{price:.2f}')
+
+    StockPriceHistory.objects.bulk_create((
+        StockPriceHistory(stock=stock, trade_date=d, close_price=close)
+        for stock in stocks for d, close in zip(dates, walk(float(stock.current_price)))
+    ), batch_size=5000)
+    BenchmarkPriceHistory.objects.bulk_create((
+        BenchmarkPriceHistory(benchmark=b, trade_date=d, close_value=close)
+        for b in benchmarks for d, close in zip(dates, walk(20000.0))
+    ), batch_size=5000)
+
+    User.objects.bulk_create([
+        User(username=f'qp_user_{i}', email=f'qp_user_{i}@example.com') for i in range(n_users)
+    ])
+    users = list(User.objects.filter(username__startswith='qp_user_').order_by('id'))
+    Portfolio.objects.bulk_create([
+        Portfolio(user=u, name=f'qp portfolio {j}', benchmark=benchmarks[j % len(benchmarks)])
+        for u in users for j in range(3)
+    ])
+    portfolios = list(Portfolio.objects.filter(user__in=users).order_by('id'))
+
+    holdings, transactions, values, analyses, alerts = [], [], [], [], []
+    for p in portfolios:
+        for stock in rng.sample(stocks, 25):
+            qty = Decimal(rng.randint(1, 200))
+            holdings.append(Holding(portfolio=p, stock=stock, quantity=qty, avg_buy_price=stock.current_price,
+                                    current_value=qty * stock.current_price))
+            transactions.extend(
+                PortfolioTransaction(portfolio=p, stock=stock, transaction_type='BUY', quantity=qty,
+                                     price=stock.current_price, transaction_date=rng.choice(dates))
+                for _ in range(2)
+            )
+        for d, total in zip(dates, walk(1_000_000.0)):
+            values.append(PortfolioValueHistory(portfolio=p, record_date=d, total_value=total,
+                                                daily_return=Decimal(f'{rng.gauss(0, 1.2):.4f}')))
+        for d in dates[-260:]:
+            analyses.append(AnalysisResult(
+                portfolio=p, analysis_date=d, health_score=rng.randint(30, 90), diversification_score=rng.randint(30, 90),
+                return_ytd=Decimal(f'{rng.gauss(8, 10):.2f}'),
+                sector_allocation={s.name: 10.0 for s in sectors},
+                recommendations=[{'type': 'low_diversification', 'priority': 'medium', 'title': 'qp', 'message': 'qp'}],
+            ))
+        alerts.extend(
+            Alert(user_id=p.user_id, portfolio=p, alert_type='concentration_risk', title='qp', message='qp',
+                  is_read=rng.random() < 0.8)
+            for _ in range(50)
+        )
+
+    Holding.objects.bulk_create(holdings, batch_size=5000)
+    SectorExposure.rebuild([p.id for p in portfolios])
+    PortfolioTransaction.objects.bulk_create(transactions, batch_size=5000)
+    PortfolioValueHistory.objects.bulk_create(values, batch_size=5000)
+    AnalysisResult.objects.bulk_create(analyses, batch_size=2000)
+    Alert.objects.bulk_create(alerts, batch_size=5000)
+    for p in portfolios:
+        LatestAnalysis.get_for_portfolio(p.id)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return context()
+
+
+def context():
+    """Ids the registry queries run against, or None before seed()"""
+    from portfolios.models import Holding, Portfolio
+
+    portfolio = Portfolio.objects.filter(user__username='qp_user_0').order_by('id').first()
+    if portfolio is None:
+        return None
+    stock_id = Holding.objects.filter(portfolio=portfolio).order_by('id').values_list('stock_id', flat=True).first()
+    return Context(portfolio.user_id, portfolio.id, portfolio.benchmark_id, stock_id, date.today())
+
+
+# ---------------------------------------------------------------- explain
+
+def capture(ctx, names=None):
+    """{name: plan summary} for the registered queries"""
+    return {name: explain(HOT_QUERIES[name](ctx)) for name in (names or HOT_QUERIES)}
+
+
+def explain(queryset):
+    # EXPLAIN over the compiled SQL: QuerySet.explain() misplaces it for window-filtered querysets
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON, ANALYZE, BUFFERS) {sql}', params)
+        plan = cursor.fetchone()[0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+    nodes = list(_walk(plan['Plan']))
+    _parent_name.cache_clear()
+    return {
+        'signature': sorted({_signature(node) for node in nodes}),
+        'flags': sorted({flag for node in nodes for flag in _flags(node)}),
+        'execution_ms': round(plan.get('Execution Time', 0), 3),
+        'shared_hit': plan['Plan'].get('Shared Hit Blocks', 0),
+        'shared_read': plan['Plan'].get('Shared Read Blocks', 0),
+    }
+
+
+def compare(current, baseline):
+    """{name: {'regressions': [...], 'plan_changed': bool}} for queries that differ from the baseline"""
+    report = {}
+    for name, plan in current.items():
+        base = baseline.get(name)
+        if base is None:
+            report[name] = {'regressions': plan['flags'], 'plan_changed': True, 'new': True}
+            continue
+        regressions = [flag for flag in plan['flags'] if flag not in base['flags']]
+        changed = plan['signature'] != base['signature']
+        if regressions or changed:
+            report[name] = {'regressions': regressions, 'plan_changed': changed}
+    return report
+
+
+def load_baseline(path=None):
+    try:
+        with open(path or BASELINE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(plans, path=None):
+    path = Path(path or BASELINE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Timings and buffer counts vary run to run; only the plan shape is the baseline
+    stable = {name: {'signature': p['signature'], 'flags': p['flags']} for name, p in sorted(plans.items())}
+    with open(path, 'w') as f:
+        json.dump(stable, f, indent=2)
+        f.write('\n')
+
+
+def _walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def _relation(node):
+    name = node.get('Relation Name')
+    return _parent_name(name) if name else None
+
+
+def _index(node):
+    name = node.get('Index Name')
+    return _parent_name(name) if name else None
+
+
+@lru_cache(maxsize=None)
+def _parent_name(name):
+    """Partitions and their indexes report under the partitioned parent's name"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT p.relname FROM pg_class c JOIN pg_inherits i ON i.inhrelid = c.oid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE c.relname = %s", [name]
+        )
+        row = cursor.fetchone()
+    return _parent_name(row[0]) if row else name
+
+
+def _signature(node):
+    parts = [node['Node Type']]
+    if _relation(node):
+        parts.append(f"on {_relation(node)}")
+    if _index(node):
+        parts.append(f"using {_index(node)}")
+    return ' '.join(parts)
+
+
+def _flags(node):
+    loops = node.get('Actual Loops', 1) or 1
+    actual = node.get('Actual Rows', 0) * loops
+    if node['Node Type'] == 'Seq Scan' and actual + node.get('Rows Removed by Filter', 0) * loops >= SEQ_SCAN_ROWS:
+        yield f"seq_scan:{_relation(node)}"
+    if node['Node Type'] in ('Sort', 'Incremental Sort') and actual >= SORT_ROWS:
+        yield f"sort:{','.join(node.get('Sort Key', []))}"
+    if node['Node Type'] in ('BitmapAnd', 'BitmapOr'):
+        return  # always report 0 actual rows
+    estimate = node.get('Plan Rows', 0) * loops
+    high, low = max(actual, estimate), max(min(actual, estimate), 1)
+    if high >= ESTIMATE_MIN_ROWS and high / low >= ESTIMATE_RATIO:
+        yield f"estimate:{node['Node Type']}{' on ' + _relation(node) if _relation(node) else ''}"
@@ -0,0 +1,65 @@
+"""orjson-backed JSON rendering for the API.
+
+FastJSONRenderer is the default DRF renderer (settings.REST_FRAMEWORK). It
+encodes in C, and numpy arrays/scalars pass through without conversion.
+Anything orjson does not know, such as Decimal, lazy strings or timedelta,
+falls back to DRF's encoder. Dates and times are handed to DRF's encoder
+as well, so they read exactly as they do with DRF's JSONRenderer (Z for
+UTC, offsets kept to the second). A pretty-printed response (?indent=
+through the Accept header, or the browsable API) still goes through DRF's
+own renderer.
+
+A view holding an already-encoded body returns Response(PreRendered(body)),
+and the renderer sends those bytes unchanged. LatestAnalysis keeps the
+analysis endpoint's payload that way, and @cached_response stores and
+replays it as bytes.
+
+EventStreamRenderer lets text/event-stream requests (EventSource) through
+content negotiation on the event stream endpoint (see core.events). An
+error reaching such a client goes out as an `error` event.
+"""
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_fallback = JSONEncoder()
+
+
+class PreRendered(bytes):
+    """JSON that is already encoded; FastJSONRenderer sends it as it is"""
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes of `data`"""
+    return orjson.dumps(data, default=_fallback.default, option=OPTIONS)
+
+
+def event_frame(event, data):
+    """One server-sent event with a JSON data line"""
+    return b'event: ' + event.encode() + b'\ndata: ' + dumps(data) + b'\n\n'
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if isinstance(data, PreRendered):
+            if not indent:
+                return bytes(data)
+            data = orjson.loads(bytes(data))
+        if indent:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return event_frame('error', data)
@@ -0,0 +1,182 @@
+"""Per-portfolio cache of API responses.
+
+@cached_response goes on DRF function views taking a portfolio_id, below
+@permission_classes so only authorised requests reach it. Responses are
+cached per view, portfolio, user and query string in the RESPONSE_CACHE
+alias (Redis in production, local memory otherwise).
+
+Keys embed a generation number for the portfolio and a global one, so
+invalidate_portfolio() / invalidate_all() retire every cached response in
+one write instead of finding and deleting keys. Generations are
+time-based, so a generation key that gets evicted never comes back as a
+value older entries were stored under.
+
+Keys also carry today's date, since periods like ?period=1m move daily.
+Refreshed benchmark or price history calls invalidate_all().
+
+Each entry keeps its HTTP validators: the ETag hashes the encoded body and
+Last-Modified is when the body was built. Conditional GETs are only answered
+from an entry (stored under the caller's user id, so only after the view's
+ownership check passed for them) or from the view's own 200. Anyone else
+reaches the view and its 404. A matching If-None-Match / If-Modified-Since
+on a cached entry gets a 304 after one cache read, without touching the
+database. Hit, miss and 304 counts are kept per process; see stats().
+"""
+import hashlib
+import threading
+import time
+from datetime import date
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from core.renderers import PreRendered, dumps
+
+GLOBAL_GENERATION = 'resp:gen'
+# A generation that expires is replaced by a newer one, which only retires entries early
+GENERATION_SECONDS = 7 * 24 * 3600
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE]
+
+
+def _portfolio_generation_key(portfolio_id):
+    return f'resp:gen:{portfolio_id}'
+
+
+def _generations(portfolio_id):
+    cache = _cache()
+    keys = [GLOBAL_GENERATION, _portfolio_generation_key(portfolio_id)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=GENERATION_SECONDS)
+            found[key] = cache.get(key)
+    return found[GLOBAL_GENERATION], found[keys[1]]
+
+
+def response_key(view_name, request, portfolio_id):
+    """Cache key of the request's response"""
+    global_gen, portfolio_gen = _generations(portfolio_id)
+    query = hashlib.md5(repr(sorted(request.GET.lists())).encode()).hexdigest()
+    renderer = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+    return f'resp:{global_gen}:{portfolio_gen}:{date.today()}:{view_name}:{portfolio_id}:{request.user.pk}:{query}:{renderer}'
+
+
+def invalidate_portfolio(portfolio_id):
+    """Retire every cached response for the portfolio, once the current transaction commits"""
+    transaction.on_commit(lambda: _cache().set(_portfolio_generation_key(portfolio_id), time.time_ns(), timeout=GENERATION_SECONDS))
+
+
+def invalidate_all():
+    """Retire every cached response, once the current transaction commits"""
+    transaction.on_commit(lambda: _cache().set(GLOBAL_GENERATION, time.time_ns(), timeout=GENERATION_SECONDS))
+
+
+def cached_response(view_name=None, timeout=None):
+    """Cache a view's 200 responses and answer conditional GETs; adds X-Cache: HIT/MISS.
+
+    Works on sync and async views; for async ones the cache is read and
+    written through sync_to_async.
+    """
+    def decorator(view):
+        name = view_name or view.__name__
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped(request, portfolio_id, *args, **kwargs):
+                key, entry = await sync_to_async(_lookup)(name, request, portfolio_id)
+                if entry is not None:
+                    return _replay(name, request, entry)
+                response = await view(request, portfolio_id, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                entry = await sync_to_async(_store)(name, key, response, timeout)
+                return _respond(request, response, entry)
+            return wrapped
+
+        @wraps(view)
+        def wrapped(request, portfolio_id, *args, **kwargs):
+            key, entry = _lookup(name, request, portfolio_id)
+            if entry is not None:
+                return _replay(name, request, entry)
+            response = view(request, portfolio_id, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            return _respond(request, response, _store(name, key, response, timeout))
+        return wrapped
+    return decorator
+
+
+def _lookup(view_name, request, portfolio_id):
+    """(key, cached (data, etag, last_modified) entry or None)"""
+    key = response_key(view_name, request, portfolio_id)
+    return key, _cache().get(key)
+
+
+def _replay(view_name, request, entry):
+    """304 or the cached body for a request that hit an entry"""
+    data, etag, last_modified = entry
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        _record(view_name, 'not_modified')
+        return _with_validators(not_modified, etag, last_modified)
+    _record(view_name, 'hits')
+    response = Response(data)
+    response['X-Cache'] = 'HIT'
+    return _with_validators(response, etag, last_modified)
+
+
+def _store(view_name, key, response, timeout):
+    """Cache the view's response with validators derived from its body"""
+    _record(view_name, 'misses')
+    data = response.data
+    body = bytes(data) if isinstance(data, PreRendered) else dumps(data)
+    entry = (data, 'W/"%s"' % hashlib.md5(body).hexdigest(), int(time.time()))
+    _cache().set(key, entry, settings.RESPONSE_CACHE_SECONDS if timeout is None else timeout)
+    response['X-Cache'] = 'MISS'
+    return entry
+
+
+def _respond(request, response, entry):
+    """The view's fresh response, or a 304 when the client already holds the same body"""
+    _, etag, last_modified = entry
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return _with_validators(response if not_modified is None else not_modified, etag, last_modified)
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the copy but revalidate it on every use
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _record(view_name, outcome):
+    with _lock:
+        entry = _stats.setdefault(view_name, {'hits': 0, 'misses': 0, 'not_modified': 0})
+        entry[outcome] += 1
+
+
+def stats():
+    """{view name: {'hits', 'misses', 'not_modified', 'hit_ratio'}} for this process since start.
+
+    hit_ratio counts 304s from cached entries as hits: neither reached the database.
+    """
+    with _lock:
+        return {
+            name: {**entry, 'hit_ratio': round((entry['hits'] + entry['not_modified']) / sum(entry.values()), 3)}
+            for name, entry in _stats.items()
+        }
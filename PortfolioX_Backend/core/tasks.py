@@ -0,0 +1,8 @@
+from celery import shared_task
+from core.partitioning import create_partitions
+
+
+@shared_task
+def ensure_history_partitions(months_ahead=3):
+    """Keep monthly partitions created ahead of incoming history rows"""
+    return {'created': create_partitions(months_ahead=months_ahead)}
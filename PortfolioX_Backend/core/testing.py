@@ -0,0 +1,57 @@
+"""Test helpers for query budgets (core.querybudget), the response cache (core.response_cache) and events (core.events)"""
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.test import override_settings
+
+from core import events
+from core.querybudget import QueryCounter
+
+# Decorator/context manager making every declared budget raise inside tests
+strict_query_budgets = override_settings(QUERY_BUDGET_MODE='raise')
+
+
+class local_response_cache(override_settings):
+    """Run on an emptied local-memory cache, whatever CACHES the settings module has"""
+
+    def __init__(self):
+        super().__init__(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'portfoliox-tests'}},
+            RESPONSE_CACHE='default',
+        )
+
+    def enable(self):
+        super().enable()
+        caches['default'].clear()
+
+
+class local_event_broker(override_settings):
+    """Publish through a fresh in-process broker instead of Redis.
+
+    Events are sent on commit, so publishing tests need TestCase.captureOnCommitCallbacks(execute=True)
+    or a TransactionTestCase.
+    """
+
+    def __init__(self):
+        super().__init__(EVENTS_BROKER='local')
+
+    def enable(self):
+        super().enable()
+        events._brokers.pop('local', None)
+
+
+@contextmanager
+def assert_max_queries(max_queries, name='block'):
+    """Fail the test if the block runs more than max_queries queries, listing them"""
+    counter = QueryCounter(keep_sql=True)
+    with counter.track():
+        yield counter
+    if counter.count > max_queries:
+        listing = '\n'.join(f'  {i}. {sql}' for i, sql in enumerate(counter.queries, 1))
+        raise AssertionError(f"{name} ran {counter.count} queries, budget is {max_queries}:\n{listing}")
+
+
+def assert_within_budget(func, *args, **kwargs):
+    """Call a @query_budget function and fail if it exceeds its declared budget"""
+    with assert_max_queries(func.query_budget, getattr(func, '__qualname__', repr(func))):
+        return func(*args, **kwargs)
@@ -1,3 +1,329 @@
-from django.test import TestCase
+import os
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
 
-# Create your tests here.
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import Throttled
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from core import admission, async_views, db_router
+from core.models import Alert
+from core.pagination import decode_cursor, encode_cursor
+from core.querybudget import QueryBudgetExceeded, query_budget
+from core.renderers import FastJSONRenderer, PreRendered
+from core.testing import assert_max_queries, local_event_broker, local_response_cache, strict_query_budgets
+from portfolios.models import Portfolio
+from users.models import User
+
+
+@strict_query_budgets
+@local_response_cache()
+class CoreQueryBudgetTests(TestCase):
+    """Every core endpoint stays within its declared budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'pw', is_staff=True)
+        portfolio = Portfolio.objects.create(user=cls.user, name='Budget', benchmark=None)
+        Alert.objects.bulk_create([
+            Alert(user=cls.user, portfolio=portfolio, alert_type='concentration_risk', priority='high',
+                  title='t', message='m', is_read=i % 2 == 0)
+            for i in range(80)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, params=None):
+        response = self.client.get(f'/core/api/{path}', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_list_alerts(self):
+        first = self.get('alerts/')
+        newest = Alert.objects.filter(user=self.user).order_by('-created_at', '-id')
+        self.assertEqual([row['id'] for row in first['results']], [a.id for a in newest[:50]])
+        following = self.get('alerts/', {'cursor': first['next_cursor']})
+        self.assertEqual([row['id'] for row in following['results']], [a.id for a in newest[50:]])
+        self.assertIsNone(following['next_cursor'])
+
+        unread = self.get('alerts/', {'unread': 'true', 'priority': 'high', 'since': '2020-01-01'})
+        self.assertEqual(len(unread['results']), 40)
+        self.assertFalse(any(row['is_read'] for row in unread['results']))
+        self.assertEqual(self.get('alerts/', {'priority': 'low'})['results'], [])
+
+    def test_list_alerts_rejects_bad_parameters(self):
+        for params in ({'cursor': 'not-a-cursor'}, {'priority': 'urgent'}, {'since': '01/02/2024'}):
+            self.assertEqual(self.client.get('/core/api/alerts/', params).status_code, 400, params)
+
+    def test_stats_views(self):
+        self.client.get('/core/api/alerts/')
+        self.assertEqual(self.get('db-pool/')['pid'], os.getpid())
+        self.assertIsInstance(self.get('response-cache/')['views'], dict)
+        self.assertIsInstance(self.get('admission/')['classes'], dict)
+
+        regular = APIClient()
+        regular.force_authenticate(User.objects.create_user('regular', 'regular@example.com', 'pw'))
+        for path in ('db-pool/', 'response-cache/', 'admission/'):
+            self.assertEqual(regular.get(f'/core/api/{path}').status_code, 403, path)
+
+    @local_event_broker()
+    def test_event_stream(self):
+        async def open_stream():
+            request = APIRequestFactory().get('/core/api/events/', HTTP_ACCEPT='text/event-stream')
+            force_authenticate(request, self.user)
+            response = await async_views.event_stream(request)
+            stream = response.streaming_content
+            try:
+                return response, await anext(stream)
+            finally:
+                await stream.aclose()
+
+        response, first = async_to_sync(open_stream)()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(first.startswith(b'retry: '))
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the alert list by cursor, with many alerts sharing one created_at"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pages', 'pages@example.com', 'pw')
+        Alert.objects.bulk_create([
+            Alert(user=cls.user, alert_type='concentration_risk', title=str(i), message='m') for i in range(23)
+        ])
+        # Five distinct timestamps, so most pages start or end inside a tie
+        start = datetime(2024, 3, 1, 9, 30, tzinfo=timezone.utc)
+        for n, alert in enumerate(Alert.objects.filter(user=cls.user).order_by('id')):
+            Alert.objects.filter(id=alert.id).update(created_at=start + timedelta(seconds=n % 5))
+        cls.expected = list(Alert.objects.filter(user=cls.user).order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, **params):
+        response = self.client.get('/core/api/alerts/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [row['id'] for row in data['results']], data['next_cursor'], data['prev_cursor']
+
+    def walk_forward(self, limit):
+        pages, cursors = [], []
+        ids, next_cursor, prev_cursor = self.page(limit=limit)
+        self.assertIsNone(prev_cursor)
+        pages.append(ids)
+        while next_cursor:
+            ids, next_cursor, prev_cursor = self.page(limit=limit, cursor=next_cursor)
+            pages.append(ids)
+            cursors.append(prev_cursor)
+        return pages, cursors
+
+    def test_forwards_sees_every_alert_once_in_order(self):
+        for limit in (1, 4, 5, 7, 23, 50):
+            pages, _ = self.walk_forward(limit)
+            self.assertEqual(sum(pages, []), self.expected, limit)
+            self.assertTrue(all(0 < len(ids) <= limit for ids in pages), limit)
+
+    def test_backwards_returns_the_same_pages(self):
+        for limit in (1, 4, 5, 7):
+            pages, prev_cursors = self.walk_forward(limit)
+            # Each page's prev_cursor leads back to the page before it
+            for n, prev_cursor in enumerate(prev_cursors):
+                ids, next_cursor, before = self.page(limit=limit, cursor=prev_cursor)
+                self.assertEqual(ids, pages[n], (limit, n))
+                self.assertEqual(before is None, n == 0, (limit, n))
+                self.assertEqual(self.page(limit=limit, cursor=next_cursor)[0], pages[n + 1], (limit, n))
+
+    def test_backwards_from_the_last_page_to_the_first(self):
+        pages, prev_cursors = self.walk_forward(4)
+        seen, cursor = [], prev_cursors[-1]
+        while cursor:
+            ids, _, cursor = self.page(limit=4, cursor=cursor)
+            seen = ids + seen
+        self.assertEqual(seen + pages[-1], self.expected)
+
+    def test_filtered_walk(self):
+        Alert.objects.filter(id__in=self.expected[::2]).update(is_read=True)
+        unread = self.expected[1::2]
+        ids, cursor, _ = self.page(limit=3, unread='true')
+        walked = ids
+        while cursor:
+            ids, cursor, _ = self.page(limit=3, unread='true', cursor=cursor)
+            walked += ids
+        self.assertEqual(walked, unread)
+
+    def test_cursor_is_checked(self):
+        for cursor in ('not-a-cursor', encode_cursor(datetime(2024, 3, 1), 1)):
+            self.assertEqual(self.client.get('/core/api/alerts/', {'cursor': cursor}).status_code, 400)
+        self.assertEqual(decode_cursor(encode_cursor(datetime(2024, 3, 1, tzinfo=timezone.utc), 7, before=True)),
+                         (datetime(2024, 3, 1, tzinfo=timezone.utc), 7, True))
+
+
+class QueryCounterTests(TestCase):
+
+    def test_replica_lag_probe_is_not_counted(self):
+        with assert_max_queries(0, 'lag probe'):
+            db_router._measure_lag('default')
+
+    @strict_query_budgets
+    def test_budget_counts_the_block(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(0, 'test.block'), connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+
+class AdmissionTests(SimpleTestCase):
+
+    def anonymous_bucket(self, **meta):
+        request = APIRequestFactory().get('/', **meta)
+        request.user = AnonymousUser()
+        user_bucket, _ = admission._buckets('stock_population', request)
+        return user_bucket[0]
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        key = self.anonymous_bucket(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9')
+        self.assertTrue(key.endswith(':a10.0.0.1'), key)
+
+    @override_settings(REST_FRAMEWORK={'NUM_PROXIES': 1})
+    def test_only_the_trusted_proxy_address_is_used(self):
+        key = self.anonymous_bucket(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.7, 203.0.113.9')
+        self.assertTrue(key.endswith(':a203.0.113.9'), key)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'admission-tests'}},
+    ADMISSION_CACHE='default',
+    ADMISSION_ENABLED=True,
+    ADMISSION_BUSY_RETRY_SECONDS=7,
+    ADMISSION_CLASSES={
+        'test': {'user_rate': '1/s', 'user_burst': 3, 'global_rate': '1/s', 'global_burst': 4,
+                 'concurrency': 1, 'max_seconds': 60},
+        'slots': {'concurrency': 2, 'max_seconds': 60},
+    },
+)
+class TokenBucketTests(SimpleTestCase):
+    """GCRA buckets and concurrency slots of core.admission on a local cache and a fake clock"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.now = 1_700_000_000_000
+        clock = mock.patch('core.admission.time')
+        clock.start().time.side_effect = lambda: self.now / 1000
+        self.addCleanup(clock.stop)
+        self.outcome = None
+
+        @api_view(['POST'])
+        @admission.admission_control('test')
+        def view(request):
+            if isinstance(self.outcome, Exception):
+                raise self.outcome
+            return Response({'ok': True})
+        self.view = view
+
+    def post(self, user_id=1):
+        request = APIRequestFactory().post('/')
+        force_authenticate(request, User(pk=user_id, username=f'u{user_id}'))
+        return self.view(request)
+
+    def test_take_admits_the_burst_then_waits_one_interval(self):
+        for _ in range(3):
+            self.assertEqual(admission._take('b', 1000, 3, self.now), 0)
+        self.assertEqual(admission._take('b', 1000, 3, self.now), 1000)
+        self.assertEqual(admission._take('b', 1000, 3, self.now + 400), 600)
+        # The refused requests took nothing: one token is back after one interval
+        self.assertEqual(admission._take('b', 1000, 3, self.now + 1000), 0)
+        self.assertEqual(admission._take('b', 1000, 3, self.now + 1000), 1000)
+
+    def test_idle_bucket_refills_to_the_burst_only(self):
+        admission._take('b', 1000, 3, self.now)
+        later = self.now + 60_000
+        self.assertEqual([admission._take('b', 1000, 3, later) for _ in range(4)], [0, 0, 0, 1000])
+
+    def test_refused_request_gets_retry_after(self):
+        self.assertEqual([self.post().status_code for _ in range(3)], [200, 200, 200])
+        self.now += 250
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+        self.now += 750
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.post().status_code, 429)
+
+    def test_global_refusal_refunds_the_user_bucket(self):
+        for user_id in (1, 1, 2, 2):
+            self.assertEqual(self.post(user_id).status_code, 200)
+        self.assertEqual(self.post(3).status_code, 429)
+        # User 3's token was taken before the global bucket refused, then given back: full as of now
+        self.assertEqual(caches['default'].get('adm:bucket:test:u3'), self.now)
+        self.now += 3000
+        self.assertEqual([self.post(3).status_code for _ in range(3)], [200, 200, 200])
+
+    def test_slot_is_released_when_the_view_raises(self):
+        self.outcome = RuntimeError('boom')
+        with self.assertRaises(RuntimeError):
+            self.post()
+        self.assertEqual(caches['default'].get('adm:slot:test:0'), None)
+        self.outcome = None
+        self.assertEqual(self.post().status_code, 200)
+
+    def test_busy_refusal_refunds_the_tokens(self):
+        slot = admission.acquire_slot('test')
+        response = self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        admission.release_slot(slot)
+        # The busy refusal took no token: the whole burst is still there
+        self.assertEqual([self.post().status_code for _ in range(3)], [200, 200, 200])
+
+    def test_slots(self):
+        first, second = admission.acquire_slot('slots'), admission.acquire_slot('slots')
+        self.assertNotEqual(first, second)
+        with self.assertRaises(Throttled) as refused:
+            admission.acquire_slot('slots')
+        self.assertEqual(refused.exception.wait, 7)
+        admission.release_slot(first)
+        self.assertEqual(admission.acquire_slot('slots').partition('#')[0], first.partition('#')[0])
+
+    def test_expired_slot_is_not_released_by_its_old_holder(self):
+        first = admission.acquire_slot('slots')
+        key = first.partition('#')[0]
+        caches['default'].set(key, 'next-holder')
+        admission.release_slot(first)
+        self.assertEqual(caches['default'].get(key), 'next-holder')
+
+
+class FastJSONRendererTests(SimpleTestCase):
+
+    def test_output_matches_drf(self):
+        data = {
+            'created_at': datetime(2024, 3, 1, 9, 30, 15, 123456, tzinfo=timezone.utc),
+            'naive': datetime(2024, 3, 1, 9, 30, 15, 120000),
+            'offset': datetime(1900, 1, 1, 12, tzinfo=timezone(timedelta(hours=5, minutes=53, seconds=28))),
+            'day': date(2024, 3, 1),
+            'at': time(9, 30, 15, 500),
+            'amount': Decimal('12.50'),
+            'id': uuid.UUID(int=7),
+            'label': gettext_lazy('Name'),
+            'items': [1, 2.5, None, 'ünïcode', {'nested': True}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_pre_rendered_bytes_are_sent_unchanged(self):
+        body = PreRendered(b'{"a":1}')
+        self.assertIs(type(FastJSONRenderer().render(body)), bytes)
+        self.assertEqual(FastJSONRenderer().render(body), b'{"a":1}')
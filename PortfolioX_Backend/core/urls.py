@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('api/alerts/', views.list_alerts),
+    path('api/db-pool/', views.get_db_pool_stats),
+    path('api/response-cache/', views.get_response_cache_stats),
+    path('api/admission/', views.get_admission_stats),
+]
+
+# Long-lived streams are only served under ASGI (settings.ASYNC_VIEWS)
+if settings.ASYNC_VIEWS:
+    from . import async_views
+
+    urlpatterns += [
+        path('api/events/', async_views.event_stream),
+    ]
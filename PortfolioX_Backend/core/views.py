@@ -1,3 +1,74 @@
+import os
+from datetime import timedelta
+
 from django.shortcuts import render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+
+from core import admission
+from core.dbpool import pool_stats
+from core.models import Alert
+from core.pagination import choice_param, date_param, day_start, keyset_page
+from core.querybudget import query_budget
+from core import response_cache
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(1)
+def list_alerts(request):
+    """The user's alerts, newest first, a keyset page at a time.
+
+    Filters: ?unread=true|false, ?priority=, ?type=, ?portfolio=, and
+    ?since= / ?until= (YYYY-MM-DD, inclusive) on the creation date. Pass the
+    returned next_cursor (or prev_cursor) as ?cursor= for the following
+    (or preceding) page.
+    """
+    alerts = Alert.objects.filter(user=request.user)
+
+    unread = request.GET.get('unread')
+    if unread is not None:
+        alerts = alerts.filter(is_read=unread.lower() not in ('true', '1'))
+    priority = choice_param(request, 'priority', Alert.PRIORITY_CHOICES)
+    if priority:
+        alerts = alerts.filter(priority=priority)
+    alert_type = choice_param(request, 'type', Alert.TYPE_CHOICES)
+    if alert_type:
+        alerts = alerts.filter(alert_type=alert_type)
+    if request.GET.get('portfolio', '').isdigit():
+        alerts = alerts.filter(portfolio_id=int(request.GET['portfolio']))
+    since, until = date_param(request, 'since'), date_param(request, 'until')
+    if since:
+        alerts = alerts.filter(created_at__gte=day_start(since))
+    if until:
+        alerts = alerts.filter(created_at__lt=day_start(until + timedelta(days=1)))
+
+    rows, next_cursor, prev_cursor = keyset_page(alerts.values(
+        'id', 'portfolio_id', 'alert_type', 'priority', 'title', 'message', 'is_read', 'created_at'
+    ), request)
+    return Response({'results': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@query_budget(0)
+def get_db_pool_stats(request):
+    """Connection pool counters of the worker process serving this request"""
+    return Response({'pid': os.getpid(), 'pools': pool_stats()})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@query_budget(0)
+def get_response_cache_stats(request):
+    """Response cache hits and misses per view in the worker process serving this request"""
+    return Response({'pid': os.getpid(), 'views': response_cache.stats()})
+
 
-# Create your views here.
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@query_budget(0)
+def get_admission_stats(request):
+    """Admitted and refused requests per endpoint class in the worker process serving this request"""
+    return Response({'pid': os.getpid(), 'classes': admission.stats()})
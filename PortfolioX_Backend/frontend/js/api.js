@@ -30,6 +30,9 @@ const API = {
                 headers: this.getHeaders()
             });
 
+            if (response.status === 429) {
+                throw new Error('Too many requests, try again in ' + (response.headers.get('Retry-After') || 'a few') + ' seconds');
+            }
             if (!response.ok) {
                 throw new Error('HTTP ' + response.status + ': ' + response.statusText);
             }
@@ -52,6 +55,10 @@ const API = {
     },
 
     // Analytics
+    async getDashboard() {
+        return this.fetch('/analytics/api/dashboard/');
+    },
+
     async triggerAnalysis(portfolioId) {
         return this.fetch('/analytics/api/' + portfolioId + '/analyze/', {
             method: 'POST'
@@ -66,10 +73,58 @@ const API = {
         return this.fetch('/analytics/api/' + portfolioId + '/performance/');
     },
 
+    async getChart(portfolioId, period = '1y', points = 200) {
+        return this.fetch('/analytics/api/' + portfolioId + '/chart/?period=' + period + '&points=' + points);
+    },
+
     async getRecommendations(portfolioId) {
         return this.fetch('/analytics/api/' + portfolioId + '/recommendations/');
     },
 
+    // Server-sent events: calls onEvent(name, data) for each event until the stream ends.
+    // Resolves false when the server has no event stream (it is only served under ASGI).
+    async subscribeEvents(onEvent, onOpen) {
+        const response = await fetch(API_CONFIG.baseUrl + '/core/api/events/', {
+            headers: { ...this.getHeaders(), 'Accept': 'text/event-stream' }
+        });
+        if (response.status === 404) {
+            return false;
+        }
+        if (!response.ok) {
+            throw new Error('HTTP ' + response.status + ': ' + response.statusText);
+        }
+        if (onOpen) {
+            onOpen();
+        }
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const chunk = await reader.read();
+            if (chunk.done) {
+                return true;
+            }
+            buffer += chunk.value;
+            let end;
+            while ((end = buffer.indexOf('\n\n')) > -1) {
+                const frame = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                let name = 'message';
+                let data = '';
+                frame.split('\n').forEach(function(line) {
+                    if (line.startsWith('event: ')) {
+                        name = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                if (data) {
+                    onEvent(name, JSON.parse(data));
+                }
+            }
+        }
+    },
+
     // Test connection
     async testConnection() {
         try {
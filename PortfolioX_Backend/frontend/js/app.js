@@ -1,6 +1,8 @@
 ﻿// Global state
 let currentPortfolios = [];
 let selectedPortfolioId = null;
+// True while the server is pushing events; views then refresh on events instead of timers
+let liveEvents = false;
 
 // Initialize app on load
 document.addEventListener('DOMContentLoaded', function() {
@@ -22,6 +24,48 @@ async function initializeApp() {
     // Load initial data
     await loadDashboard();
     await loadPortfolios();
+    listenForEvents();
+}
+
+// Server push
+async function listenForEvents(reconnecting) {
+    try {
+        const available = await API.subscribeEvents(handleServerEvent, function() {
+            liveEvents = true;
+            // Catch up on whatever was pushed while disconnected
+            if (reconnecting && isSectionActive('dashboard')) {
+                loadDashboard();
+            }
+        });
+        if (!available) {
+            return;
+        }
+    } catch (error) {
+        console.error('Event stream error:', error);
+    }
+    liveEvents = false;
+    setTimeout(function() {
+        listenForEvents(true);
+    }, 5000);
+}
+
+function handleServerEvent(name, data) {
+    if (name === 'analysis.completed') {
+        const select = document.getElementById('analyticsPortfolioSelect');
+        if (isSectionActive('analytics') && select && select.value === String(data.portfolio_id)) {
+            loadAnalytics();
+        }
+    } else if (name === 'alerts.created') {
+        showToast(data.alerts.length + ' new alert(s)', 'info');
+    }
+    if (isSectionActive('dashboard')) {
+        loadDashboard();
+    }
+}
+
+function isSectionActive(sectionName) {
+    const section = document.getElementById(sectionName + '-section');
+    return section !== null && section.classList.contains('active');
 }
 
 // Navigation
@@ -65,20 +109,16 @@ function showSection(sectionName) {
 // Dashboard Functions
 async function loadDashboard() {
     try {
-        const portfolios = await API.getPortfolios();
-        currentPortfolios = portfolios;
-        
-        let totalValue = 0;
-        let totalGain = 0;
-        let totalInvested = 0;
-        
-        portfolios.forEach(function(p) {
-            totalValue += parseFloat(p.current_value || 0);
-            totalGain += parseFloat(p.total_gain_loss || 0);
-            totalInvested += parseFloat(p.total_invested || 0);
+        // One request for every portfolio's summary, analysis and alerts. Only
+        // active portfolios are included, so currentPortfolios is left to the full list
+        const dashboard = await API.getDashboard();
+        const portfolios = dashboard.portfolios.map(function(p) {
+            return Object.assign({ id: p.portfolio_id }, p);
         });
         
-        const totalReturn = totalInvested > 0 ? ((totalGain / totalInvested) * 100) : 0;
+        const totalValue = dashboard.totals.current_value;
+        const totalGain = dashboard.totals.total_gain_loss;
+        const totalReturn = dashboard.totals.total_gain_pct;
         
         // Update stats
         document.getElementById('totalValue').textContent = formatCurrency(totalValue);
@@ -199,9 +239,16 @@ function createPortfolio() {
 }
 
 // Analytics Functions
-function populatePortfolioSelector() {
+async function populatePortfolioSelector() {
     const select = document.getElementById('analyticsPortfolioSelect');
     
+    // Every portfolio, inactive ones included, can be analysed
+    try {
+        currentPortfolios = await API.getPortfolios();
+    } catch (error) {
+        console.error('Failed to load portfolios:', error);
+    }
+    
     const options = currentPortfolios.map(function(p) {
         return '<option value="' + p.id + '">' + p.name + '</option>';
     }).join('');
@@ -320,6 +367,11 @@ async function triggerAnalysis() {
     try {
         showToast('Starting analysis...', 'info');
         await API.triggerAnalysis(portfolioId);
+        if (liveEvents) {
+            // analysis.completed reloads the view
+            showToast('Analysis started!', 'success');
+            return;
+        }
         showToast('Analysis started! Refreshing in 3 seconds...', 'success');
         
         setTimeout(function() {
@@ -7,14 +7,32 @@ bind = "0.0.0.0:8000"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+#   sync (default)  gunicorn config.wsgi:application -c gunicorn_config.py
+#                   one request at a time per worker
+#   asgi            GUNICORN_PROFILE=asgi gunicorn config.asgi:application -c gunicorn_config.py
+#                   uvicorn workers; the analytics reads are async views, so a worker keeps
+#                   serving while requests wait on the database or cache
+PROFILE = os.environ.get('GUNICORN_PROFILE', 'sync')
+
+if PROFILE == 'asgi':
+    workers = multiprocessing.cpu_count() + 1
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    workers = multiprocessing.cpu_count() * 2 + 1
+    worker_class = "sync"
 worker_connections = 1000
 timeout = 120
 keepalive = 5
 max_requests = 1000
 max_requests_jitter = 50
 
+# Database connections: each worker keeps its own pool (DB_POOL_MODE in settings),
+# so the server needs about workers * DB_POOL_MAX_SIZE connections. An ASGI worker
+# runs many requests at once, each on its own connection: give it a larger
+# DB_POOL_MAX_SIZE, and keep DB_POOL_MODE='pool' (persistent connections are per
+# thread and would pile up under ASGI)
+preload_app = False
+
 # Logging
 accesslog = "/var/log/portfoliox/gunicorn-access.log"
 errorlog = "/var/log/portfoliox/gunicorn-error.log"
@@ -34,3 +52,16 @@ tmp_upload_dir = None
 # SSL (if terminating SSL at Gunicorn)
 # keyfile = '/etc/ssl/private/portfoliox.key'
 # certfile = '/etc/ssl/certs/portfoliox.crt'
+
+
+# Server hooks
+def pre_fork(server, worker):
+    # A preloaded master must not hand its pooled connections down to workers
+    if server.cfg.preload_app:
+        from core.dbpool import close_pools
+        close_pools()
+
+
+def worker_exit(server, worker):
+    from core.dbpool import report
+    report(force=True)
@@ -0,0 +1,86 @@
+"""Corporate-action adjusted prices, applied at read time.
+
+Raw StockPriceHistory rows are never rewritten. Each stock's CorporateAction
+rows are turned into a factor schedule (ex-dates plus the cumulative factor
+that applies before each of them), cached until an action for that stock is
+recorded or removed (or for a day at most), and multiplied into the raw
+closes with one vectorized lookup. GET /market/api/stocks/<symbol>/prices/
+serves them.
+"""
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from core.fixedpoint import PAISE, history_arrays
+from market.models import CorporateAction, StockPriceHistory
+from market.price_store import PriceStore
+
+
+class AdjustedPrices:
+
+    # Saving or deleting an action invalidates its stock's schedule (market.signals); the
+    # timeout bounds how long a change made without signals, e.g. a raw UPDATE, can go unseen
+    CACHE_TIMEOUT = 24 * 60 * 60
+
+    @staticmethod
+    def get(stock_id, start=None, end=None, adjust=True):
+        """Return (dates, adjusted closes, daily returns in percent) for a stock; raw closes if not adjust"""
+        dates, closes = AdjustedPrices._raw_closes(stock_id, start, end)
+        adjusted = closes * AdjustedPrices.factors_for(stock_id, dates) if adjust else closes
+
+        returns = np.full_like(adjusted, np.nan)
+        if len(adjusted) > 1:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns[1:] = (adjusted[1:] / adjusted[:-1] - 1) * 100
+        return dates, adjusted, returns
+
+    @staticmethod
+    def factors_for(stock_id, dates):
+        """Cumulative adjustment factor for each date (1.0 on and after the last ex-date)"""
+        ex_dates, cumulative = AdjustedPrices.schedule(stock_id)
+        if not len(ex_dates):
+            return np.ones(len(dates))
+        # Number of actions already in effect on each date picks its factor
+        return cumulative[np.searchsorted(ex_dates, dates, side='right')]
+
+    @staticmethod
+    def schedule(stock_id):
+        key = AdjustedPrices._cache_key(stock_id)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        actions = list(CorporateAction.objects.filter(stock_id=stock_id)
+                       .order_by('ex_date').values_list('ex_date', 'factor'))
+        ex_dates = np.array([a[0] for a in actions], dtype='datetime64[D]')
+        factors = np.array([float(a[1]) for a in actions] + [1.0])
+        # cumulative[k] = product of factors k..n-1: what applies to a date before the k-th ex-date
+        cumulative = np.cumprod(factors[::-1])[::-1]
+
+        cache.set(key, (ex_dates, cumulative), AdjustedPrices.CACHE_TIMEOUT)
+        return ex_dates, cumulative
+
+    @staticmethod
+    def invalidate(stock_id):
+        """Drop the stock's schedule once the current transaction commits, so no read recaches the old one"""
+        transaction.on_commit(lambda: cache.delete(AdjustedPrices._cache_key(stock_id)))
+
+    @staticmethod
+    def _cache_key(stock_id):
+        return f'market:adjustments:{stock_id}'
+
+    @staticmethod
+    def _raw_closes(stock_id, start, end):
+        stored = PriceStore.stocks().series(id=stock_id, start=start, end=end)
+        if stored is not None:
+            dates, closes = stored
+            observed = ~np.isnan(closes)
+            return dates[observed], np.asarray(closes[observed])
+
+        history = StockPriceHistory.objects.filter(stock_id=stock_id)
+        if start:
+            history = history.filter(trade_date__gte=start)
+        if end:
+            history = history.filter(trade_date__lte=end)
+        history = history_arrays(history.order_by('trade_date'), date_field='trade_date', closes=('close_price', PAISE))
+        return history['dates'], history['closes']
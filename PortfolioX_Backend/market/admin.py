@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Sector, Stock, StockPriceHistory, BenchmarkIndex, BenchmarkPriceHistory
+from .models import Sector, Stock, StockPriceHistory, BenchmarkIndex, BenchmarkPriceHistory, CorporateAction
 
 admin.site.register(Sector)
 admin.site.register(Stock)
 admin.site.register(StockPriceHistory)
 admin.site.register(BenchmarkIndex)
 admin.site.register(BenchmarkPriceHistory)
+admin.site.register(CorporateAction)
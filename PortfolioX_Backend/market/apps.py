@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MarketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'market'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from market.models import CorporateAction
+        from market.signals import corporate_action_changed
+        post_save.connect(corporate_action_changed, sender=CorporateAction,
+                          dispatch_uid='market.signals.corporate_action_saved')
+        post_delete.connect(corporate_action_changed, sender=CorporateAction,
+                            dispatch_uid='market.signals.corporate_action_deleted')
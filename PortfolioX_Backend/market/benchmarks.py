@@ -0,0 +1,92 @@
+"""Benchmark catalogue sync.
+
+The catalogue (market/data/benchmarks.json by default) lists every index we
+track with an optional sector tag. Yahoo history is fetched concurrently on a
+thread pool; each index only fetches from a few days before its last stored
+close, and writes go through one bulk upsert per index.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+
+import yfinance as yf
+from django.db.models import Max
+from django.utils import timezone
+
+from market.models import BenchmarkIndex, BenchmarkPriceHistory, Sector
+from market.utils import upsert_benchmark_history
+
+CATALOGUE_PATH = Path(__file__).resolve().parent / 'data' / 'benchmarks.json'
+
+# Re-fetch this far behind the last stored close so the first new day has a previous close;
+# the days already stored are not rewritten
+OVERLAP_DAYS = 7
+
+
+def load_catalogue(path=None):
+    with open(path or CATALOGUE_PATH) as f:
+        return json.load(f)
+
+
+def sync_benchmarks(entries, max_workers=8, period='90d'):
+    """Create/tag catalogue indices and bring their history up to date.
+
+    Returns a list of {'symbol', 'name', 'rows', 'error'} in catalogue order.
+    """
+    indices = {entry['symbol']: _ensure_index(entry) for entry in entries}
+    last_dates = dict(
+        BenchmarkPriceHistory.objects.filter(benchmark__in=indices.values())
+        .values('benchmark_id').annotate(last=Max('trade_date'))
+        .values_list('benchmark_id', 'last')
+    )
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_fetch_history, symbol, last_dates.get(index.id), period): symbol
+            for symbol, index in indices.items()
+        }
+        # Network work runs in the pool; DB writes stay on this thread
+        for future in as_completed(futures):
+            symbol = futures[future]
+            index = indices[symbol]
+            result = {'symbol': symbol, 'name': index.name, 'rows': 0, 'error': None}
+            try:
+                hist = future.result()
+                if hist.empty:
+                    result['error'] = 'No data returned'
+                else:
+                    result['rows'] = upsert_benchmark_history(
+                        index, hist, stored_through=last_dates.get(index.id)
+                    )
+                    index.current_value = round(float(hist['Close'].dropna().iloc[-1]), 2)
+                    index.last_updated = timezone.now()
+                    index.save(update_fields=['current_value', 'last_updated'])
+            except Exception as e:
+                result['error'] = str(e)
+            results[symbol] = result
+
+    return [results[entry['symbol']] for entry in entries]
+
+
+def _ensure_index(entry):
+    sector = None
+    if entry.get('sector'):
+        sector, _ = Sector.objects.get_or_create(name=entry['sector'])
+    index, _ = BenchmarkIndex.objects.update_or_create(
+        symbol=entry['symbol'],
+        defaults={
+            'name': entry.get('name', entry['symbol']),
+            'description': entry.get('description', ''),
+            'sector': sector,
+        }
+    )
+    return index
+
+
+def _fetch_history(symbol, last_date, period):
+    ticker = yf.Ticker(symbol)
+    if last_date:
+        return ticker.history(start=last_date - timedelta(days=OVERLAP_DAYS))
+    return ticker.history(period=period)
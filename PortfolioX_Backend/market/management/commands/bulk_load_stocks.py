@@ -3,6 +3,7 @@ import yfinance as yf
 from django.core.management.base import BaseCommand
 from market.utils import search_yahoo_stock
 from market.models import Stock, StockPriceHistory
+from market.price_store import refresh_price_stores
 
 class Command(BaseCommand):
     help = "Bulk load stock info and historical prices based on a list of partial names or symbols in a CSV"
@@ -20,6 +21,7 @@ class Command(BaseCommand):
             with open(file_path, 'r') as txtfile:
                 lines = [line.strip() for line in txtfile.readlines() if line.strip()]
         self.stdout.write(f"Processing {len(lines)} input names/symbols...")
+        loaded = []
         for partial in lines:
             candidates = search_yahoo_stock(partial)
             if not candidates:
@@ -61,7 +63,9 @@ class Command(BaseCommand):
                         }
                     )
                     count += 1
+                loaded.append(stock.id)
                 self.stdout.write(f"Loaded {count} history records for {symbol}")
             except Exception as e:
                 self.stdout.write(f"Failed to load '{symbol}': {str(e)}")
+        refresh_price_stores(stock_ids=loaded)
         self.stdout.write("Bulk load complete.")
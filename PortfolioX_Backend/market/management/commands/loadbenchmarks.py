@@ -1,19 +1,29 @@
-from django.core.management.base import BaseCommand
-from market.utils import load_benchmark_index
+from django.core.management.base import BaseCommand, CommandError
+from market.benchmarks import load_catalogue, sync_benchmarks
+from market.price_store import refresh_price_stores
 
-BENCHMARKS = [
-    # (Yahoo symbol, Custom name, Description)
-    ('^NSEI', 'NIFTY 50', 'NSE Nifty 50 Index'),
-    ('^BSESN', 'SENSEX', 'BSE Sensex Index'),
-    # Add more as needed: Bank Nifty, etc.
-]
 
 class Command(BaseCommand):
-    help = "Load benchmark indices and their price history from Yahoo Finance"
+    help = "Load benchmark indices from the catalogue and sync their price history from Yahoo Finance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalogue', type=str, help='JSON catalogue to use instead of market/data/benchmarks.json')
+        parser.add_argument('--symbols', nargs='*', help='Only sync these catalogue symbols')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent Yahoo fetches')
+        parser.add_argument('--period', type=str, default='90d', help='History to load for indices with none stored')
 
     def handle(self, *args, **options):
-        for symbol, name, description in BENCHMARKS:
-            self.stdout.write(f"Loading {symbol} ({name}) ...")
-            index = load_benchmark_index(symbol, name, description)
-            self.stdout.write(f"  Added/updated: {index.name}")
+        entries = load_catalogue(options['catalogue'])
+        if options['symbols']:
+            entries = [e for e in entries if e['symbol'] in options['symbols']]
+            if not entries:
+                raise CommandError("None of the given symbols are in the catalogue")
+
+        self.stdout.write(f"Syncing {len(entries)} benchmarks ...")
+        for result in sync_benchmarks(entries, max_workers=options['workers'], period=options['period']):
+            if result['error']:
+                self.stdout.write(f"  Failed {result['symbol']} ({result['name']}): {result['error']}")
+            else:
+                self.stdout.write(f"  {result['name']}: {result['rows']} rows")
+        refresh_price_stores()
         self.stdout.write("All benchmarks processed.")
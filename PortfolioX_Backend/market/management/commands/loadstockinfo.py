@@ -2,6 +2,7 @@
 from market.utils import search_yahoo_stock
 from market.models import Stock, StockPriceHistory
 import yfinance as yf
+from market.price_store import refresh_price_stores
 
 class Command(BaseCommand):
     help = "Search stocks on Yahoo Finance by partial name or symbol and load to DB"
@@ -48,4 +49,5 @@ class Command(BaseCommand):
                     'daily_return': None,
                 }
             )
+        refresh_price_stores(stock_ids=[stock.id])
         self.stdout.write(f"Added/updated {stock.name} ({stock.symbol}) with recent price history.")
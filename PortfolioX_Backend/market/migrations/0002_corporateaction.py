@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorporateAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ex_date', models.DateField()),
+                ('action_type', models.CharField(choices=[('split', 'Split'), ('bonus', 'Bonus'), ('other', 'Other')], max_length=10)),
+                ('factor', models.DecimalField(decimal_places=10, max_digits=14)),
+                ('description', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='market.stock')),
+            ],
+            options={
+                'unique_together': {('stock', 'ex_date')},
+            },
+        ),
+    ]
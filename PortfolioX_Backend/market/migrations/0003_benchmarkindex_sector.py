@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0002_corporateaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='benchmarkindex',
+            name='sector',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='market.sector'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.db import migrations
+
+from core.partitioning import convert_to_partitioned
+
+
+def partition_price_history(apps, schema_editor):
+    convert_to_partitioned(schema_editor, apps.get_model('market', 'StockPriceHistory'), 'trade_date')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0003_benchmarkindex_sector'),
+    ]
+
+    operations = [
+        # Reversing leaves the table partitioned; it behaves the same as a plain table
+        migrations.RunPython(partition_price_history, migrations.RunPython.noop),
+    ]
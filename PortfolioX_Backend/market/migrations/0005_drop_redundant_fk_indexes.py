@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_partition_stockpricehistory'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='benchmarkpricehistory',
+            name='benchmark',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='market.benchmarkindex'),
+        ),
+        migrations.AlterField(
+            model_name='stockpricehistory',
+            name='stock',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='market.stock'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='corporateaction',
+            name='action_type',
+            field=models.CharField(choices=[('split', 'Split'), ('bonus', 'Bonus'), ('dividend', 'Dividend'), ('other', 'Other')], max_length=10),
+        ),
+    ]
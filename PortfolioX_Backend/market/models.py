@@ -27,7 +27,9 @@ class Stock(models.Model):
             models.Index(fields=['sector'], name='idx_stocks_sector'),
         ]
 class StockPriceHistory(models.Model):
-    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    """Monthly range-partitioned on trade_date under PostgreSQL (see core.partitioning)"""
+    # No separate FK index: the (stock, trade_date) unique index serves stock lookups in date order
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, db_index=False)
     trade_date = models.DateField()
     open_price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
     high_price = models.DecimalField(max_digits=12, decimal_places=2, null=True)
@@ -46,12 +48,39 @@ class BenchmarkIndex(models.Model):
     symbol = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=100)
     description = models.TextField(null=True)
+    sector = models.ForeignKey(Sector, on_delete=models.SET_NULL, null=True, blank=True)
     current_value = models.DecimalField(max_digits=12, decimal_places=2, null=True)
     last_updated = models.DateTimeField(null=True)
 class BenchmarkPriceHistory(models.Model):
-    benchmark = models.ForeignKey(BenchmarkIndex, on_delete=models.CASCADE)
+    benchmark = models.ForeignKey(BenchmarkIndex, on_delete=models.CASCADE, db_index=False)
     trade_date = models.DateField()
     close_value = models.DecimalField(max_digits=12, decimal_places=2)
     daily_return = models.DecimalField(max_digits=8, decimal_places=4, null=True)
     class Meta:
         unique_together = ['benchmark', 'trade_date']
+class CorporateAction(models.Model):
+    """Price adjustment for a split/bonus/dividend; closes before ex_date are multiplied by factor"""
+    TYPE_CHOICES = [('split', 'Split'), ('bonus', 'Bonus'), ('dividend', 'Dividend'), ('other', 'Other')]
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    ex_date = models.DateField()
+    action_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    factor = models.DecimalField(max_digits=14, decimal_places=10)
+    description = models.CharField(max_length=200, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        unique_together = ['stock', 'ex_date']
+
+    @staticmethod
+    def split_factor(new_shares, old_shares=1):
+        """new_shares:old_shares split, e.g. 5:1 face-value split -> 0.2"""
+        return old_shares / new_shares
+
+    @staticmethod
+    def bonus_factor(bonus_shares, held_shares=1):
+        """bonus_shares for every held_shares, e.g. 1:1 bonus -> 0.5"""
+        return held_shares / (held_shares + bonus_shares)
+
+    @staticmethod
+    def dividend_factor(dividend, previous_close):
+        """Cash dividend against the close before the ex-date, e.g. 10 on 500 -> 0.98"""
+        return (previous_close - dividend) / previous_close
@@ -0,0 +1,254 @@
+"""Columnar close-price store.
+
+Keeps a date x symbol matrix of closes (and derived daily returns, in percent)
+as versioned .npy files that readers memory-map. Columns are stored
+contiguously (Fortran order) so one symbol over a date range is a zero-copy
+slice. Refreshed incrementally from StockPriceHistory / BenchmarkPriceHistory:
+the last stored day and new symbols are read on every refresh, and callers
+that backfill or correct older closes name the symbols to re-read in full.
+
+Refreshes of a store are serialised by a lock file in its directory, since
+every populate_stock queues one. Each file is written under a unique temporary
+name and renamed into place, so a file another process has memory-mapped is
+never truncated or rewritten.
+"""
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from core.fixedpoint import PAISE, fixed_point, to_array
+from market.models import Stock, StockPriceHistory, BenchmarkIndex, BenchmarkPriceHistory
+
+
+class PriceStore:
+
+    SOURCES = {
+        'stocks': (StockPriceHistory, 'stock', 'close_price', Stock),
+        'benchmarks': (BenchmarkPriceHistory, 'benchmark', 'close_value', BenchmarkIndex),
+    }
+
+    # Loaded (meta, arrays) per store directory, reused until the version changes
+    _loaded = {}
+
+    def __init__(self, kind):
+        if kind not in self.SOURCES:
+            raise ValueError(f"Unknown price store: {kind}")
+        self.kind = kind
+        self.path = Path(settings.PRICE_STORE_DIR) / kind
+
+    @classmethod
+    def stocks(cls):
+        return cls('stocks')
+
+    @classmethod
+    def benchmarks(cls):
+        return cls('benchmarks')
+
+    # ------------------------------------------------------------------ read
+
+    def window(self, symbols=None, start=None, end=None, field='close', ids=None):
+        """Return (dates, symbols, values) for the requested columns and date range.
+
+        Rows are sliced without copying; selecting a subset of columns copies
+        only those columns. Missing observations are NaN.
+        """
+        data = self._load()
+        if data is None:
+            return None
+        meta, arrays = data
+        rows = self._row_slice(arrays['dates'], start, end)
+        matrix = arrays[field]
+
+        if symbols is None and ids is None:
+            return arrays['dates'][rows], list(meta['symbols']), matrix[rows]
+
+        cols = self._columns(meta, symbols, ids)
+        return arrays['dates'][rows], [meta['symbols'][c] for c in cols], matrix[rows][:, cols]
+
+    def series(self, symbol=None, start=None, end=None, field='close', id=None):
+        """Return (dates, values) for a single column, or None if it isn't stored"""
+        data = self._load()
+        if data is None:
+            return None
+        meta, arrays = data
+        cols = self._columns(meta, [symbol] if symbol is not None else None, [id] if id is not None else None)
+        if not cols:
+            return None
+        rows = self._row_slice(arrays['dates'], start, end)
+        return arrays['dates'][rows], arrays[field][rows, cols[0]]
+
+    @staticmethod
+    def _row_slice(dates, start, end):
+        lo = np.searchsorted(dates, np.datetime64(start, 'D')) if start else 0
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), side='right') if end else len(dates)
+        return slice(lo, hi)
+
+    @staticmethod
+    def _columns(meta, symbols, ids):
+        if symbols is not None:
+            index = {s: i for i, s in enumerate(meta['symbols'])}
+            return [index[s] for s in symbols if s in index]
+        index = {pk: i for i, pk in enumerate(meta['ids'])}
+        return [index[pk] for pk in ids if pk in index]
+
+    def _load(self):
+        meta = self._read_meta()
+        if meta is None:
+            return None
+        cached = self._loaded.get(self.path)
+        if cached and cached[0]['version'] == meta['version']:
+            return cached
+        version = meta['version']
+        arrays = {
+            name: np.load(self.path / f'{name}.v{version}.npy', mmap_mode='r')
+            for name in ('dates', 'close', 'return')
+        }
+        self._loaded[self.path] = (meta, arrays)
+        return meta, arrays
+
+    def _read_meta(self):
+        try:
+            with open(self.path / 'meta.json') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # ----------------------------------------------------------------- write
+
+    def refresh(self, reload_ids=()):
+        """Merge new history rows into the store; returns the number of rows read.
+
+        reload_ids are parents whose older history was backfilled or corrected;
+        their columns are replaced by a full re-read.
+        """
+        # A refresh queued behind a running one waits, then merges from the version it wrote
+        with self._exclusive():
+            return self._refresh(reload_ids)
+
+    @contextmanager
+    def _exclusive(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / '.refresh.lock', 'a+b') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            else:
+                lock.seek(0)
+                # LK_LOCK gives up after 10 seconds; keep waiting like flock does
+                while True:
+                    try:
+                        msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _refresh(self, reload_ids):
+        model, fk, value_field, parent = self.SOURCES[self.kind]
+        meta = self._read_meta()
+
+        if meta:
+            old = {
+                name: np.load(self.path / f'{name}.v{meta["version"]}.npy')
+                for name in ('dates', 'close')
+            }
+            old_ids = list(meta['ids'])
+            old_symbols = list(meta['symbols'])
+            reload = sorted(set(reload_ids) & set(old_ids))
+            # Re-read the last stored day (it may have been partial), any new columns and
+            # the reloaded ones. New columns are resolved against the small parent table
+            # first: a NOT IN on the history table itself can only be answered by a full scan.
+            new_parents = parent.objects.exclude(id__in=old_ids).values_list('id', flat=True)
+            rows = model.objects.filter(
+                Q(trade_date__gte=meta['last_date']) | Q(**{f'{fk}_id__in': list(new_parents) + reload})
+            )
+        else:
+            old = None
+            old_ids, old_symbols, reload = [], [], []
+            rows = model.objects.all()
+
+        rows = list(rows.values_list(f'{fk}_id', 'trade_date', fixed_point(value_field, PAISE)))
+        if not rows and not reload:
+            return 0
+
+        row_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        row_dates = np.array([r[1] for r in rows], dtype='datetime64[D]')
+        row_values = to_array((r[2] for r in rows), PAISE)
+
+        new_ids = sorted(set(row_ids.tolist()) - set(old_ids))
+        symbol_of = dict(parent.objects.filter(id__in=new_ids).values_list('id', 'symbol'))
+        ids = old_ids + new_ids
+        symbols = old_symbols + [symbol_of.get(pk, str(pk)) for pk in new_ids]
+
+        old_dates = old['dates'] if old else np.array([], dtype='datetime64[D]')
+        dates = np.union1d(old_dates, row_dates)
+
+        close = np.full((len(dates), len(ids)), np.nan, order='F')
+        col_of = {pk: i for i, pk in enumerate(ids)}
+        if old:
+            close[np.searchsorted(dates, old_dates), :len(old_ids)] = old['close']
+            # Days no longer stored for a reloaded column must not survive from the old version
+            close[:, [col_of[pk] for pk in reload]] = np.nan
+        cols = np.array([col_of[pk] for pk in row_ids.tolist()], dtype=np.int64)
+        close[np.searchsorted(dates, row_dates), cols] = row_values
+
+        # Daily return against each column's previous observed close, so a
+        # holiday or suspension gap doesn't blank out the next day's return
+        valid = ~np.isnan(close)
+        last_seen = np.where(valid, np.arange(len(dates))[:, None], 0)
+        np.maximum.accumulate(last_seen, axis=0, out=last_seen)
+        prev = np.take_along_axis(close, last_seen[:-1], axis=0)
+        returns = np.full_like(close, np.nan, order='F')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = np.where(valid[1:], (close[1:] / prev - 1) * 100, np.nan)
+
+        self._write(meta, dates, close, returns, ids, symbols)
+        return len(rows)
+
+    def _write(self, meta, dates, close, returns, ids, symbols):
+        self.path.mkdir(parents=True, exist_ok=True)
+        version = meta['version'] + 1 if meta else 1
+        for name, array in (('dates', dates), ('close', close), ('return', returns)):
+            target = self.path / f'{name}.v{version}.npy'
+            tmp = self.path / f'{target.name}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, target)
+
+        tmp = self.path / f'meta.json.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'version': version,
+                'ids': ids,
+                'symbols': symbols,
+                'last_date': str(dates[-1]) if len(dates) else None,
+            }, f)
+        os.replace(tmp, self.path / 'meta.json')
+
+        # Keep the previous version for readers that loaded it a moment ago
+        for f in self.path.glob('*.v*.npy'):
+            if int(f.suffixes[-2][2:]) < version - 1:
+                f.unlink(missing_ok=True)
+
+
+def refresh_price_stores(stock_ids=(), benchmark_ids=()):
+    """Refresh both stores; called after every price sync with the ids whose older history it rewrote"""
+    reload = {'stocks': stock_ids, 'benchmarks': benchmark_ids}
+    return {kind: PriceStore(kind).refresh(reload[kind]) for kind in PriceStore.SOURCES}
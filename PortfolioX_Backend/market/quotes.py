@@ -0,0 +1,200 @@
+"""Intraday quote ingestion.
+
+QuoteIngestor consumes any iterable of Quote ticks, keeps only the latest
+tick per symbol in memory and writes them to Stock with a single
+bulk_update every `flush_interval` seconds, so DB write load stays flat
+however fast ticks arrive. The source is read on its own thread, so the
+last ticks before a quiet spell are still written on time. QuoteSimulator
+is a seeded, replayable local stream for development and testing.
+"""
+import csv
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.utils import timezone
+
+from market.models import Stock
+
+Quote = namedtuple('Quote', ['symbol', 'price', 'previous_close', 'ts'], defaults=[None, None])
+
+TWO_PLACES = Decimal('0.01')
+
+# Ticks read ahead of the ingestor before the source thread waits
+BACKLOG = 10000
+# Symbols missing from Stock are looked up again after this long
+UNKNOWN_RETRY_SECONDS = 300
+
+
+def _money(value):
+    return Decimal(str(value)).quantize(TWO_PLACES, rounding=ROUND_HALF_UP)
+
+
+class QuoteIngestor:
+
+    FIELDS = ['current_price', 'previous_close', 'day_change', 'day_change_pct', 'last_updated']
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.stats = {'ticks': 0, 'flushes': 0, 'rows_written': 0, 'unknown_symbols': 0}
+        # symbol -> [stock id, previous close]; loaded once, refreshed for unseen symbols
+        self._stocks = {}
+        # symbol -> when it was last looked up and not found
+        self._unknown = {}
+        self._last_flush = time.monotonic()
+
+    def run(self, stream):
+        """Consume a stream until it ends. A source may yield None as an idle heartbeat."""
+        self._load_stocks()
+        for quote in self._with_heartbeats(stream):
+            if quote is not None:
+                self.on_quote(quote)
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+        self.flush()
+        return self.stats
+
+    def _with_heartbeats(self, stream):
+        """The stream's ticks, plus None whenever a flush falls due while the source is quiet.
+
+        The source is iterated on a daemon thread; database writes stay on this one.
+        """
+        ticks = queue.Queue(maxsize=BACKLOG)
+        end = object()
+        failure = []
+
+        def read():
+            try:
+                for quote in stream:
+                    ticks.put(quote)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                ticks.put(end)
+
+        threading.Thread(target=read, name='quote-source', daemon=True).start()
+        while True:
+            try:
+                quote = ticks.get(timeout=max(0.0, self._last_flush + self.flush_interval - time.monotonic()))
+            except queue.Empty:
+                yield None
+                continue
+            if quote is end:
+                break
+            yield quote
+        if failure:
+            raise failure[0]
+
+    def on_quote(self, quote):
+        self.stats['ticks'] += 1
+        self.pending[quote.symbol] = quote
+
+    def flush(self):
+        """Write the latest pending tick of every symbol in one UPDATE"""
+        self._last_flush = time.monotonic()
+        if not self.pending:
+            return 0
+        ticks, self.pending = self.pending, {}
+
+        retry_before = time.monotonic() - UNKNOWN_RETRY_SECONDS
+        unseen = [s for s in ticks if s not in self._stocks and self._unknown.get(s, retry_before) <= retry_before]
+        if unseen:
+            self._load_stocks(unseen)
+            looked_up = time.monotonic()
+            for symbol in unseen:
+                if symbol in self._stocks:
+                    self._unknown.pop(symbol, None)
+                else:
+                    self._unknown[symbol] = looked_up
+
+        now = timezone.now()
+        updates = []
+        for symbol, quote in ticks.items():
+            known = self._stocks.get(symbol)
+            if known is None:
+                self.stats['unknown_symbols'] += 1
+                continue
+            stock_id, previous_close = known
+            if quote.previous_close is not None:
+                previous_close = _money(quote.previous_close)
+                known[1] = previous_close
+
+            price = _money(quote.price)
+            stock = Stock(id=stock_id, current_price=price, previous_close=previous_close, last_updated=now)
+            if previous_close:
+                stock.day_change = price - previous_close
+                stock.day_change_pct = _money(stock.day_change / previous_close * 100)
+            updates.append(stock)
+
+        if updates:
+            Stock.objects.bulk_update(updates, self.FIELDS)
+        self.stats['flushes'] += 1
+        self.stats['rows_written'] += len(updates)
+        return len(updates)
+
+    def _load_stocks(self, symbols=None):
+        stocks = Stock.objects.filter(is_active=True)
+        if symbols is not None:
+            stocks = stocks.filter(symbol__in=symbols)
+        for symbol, stock_id, previous_close in stocks.values_list('symbol', 'id', 'previous_close'):
+            self._stocks[symbol] = [stock_id, previous_close]
+
+
+class QuoteSimulator:
+    """Seeded random-walk quote stream; the same seed always yields the same ticks"""
+
+    def __init__(self, start_prices, seed=0, ticks=1000, volatility=0.002, interval=0.0):
+        self.start_prices = dict(start_prices)
+        self.seed = seed
+        self.ticks = ticks
+        self.volatility = volatility
+        self.interval = interval
+
+    @classmethod
+    def from_stocks(cls, symbols=None, **kwargs):
+        stocks = Stock.objects.filter(is_active=True, current_price__isnull=False)
+        if symbols:
+            stocks = stocks.filter(symbol__in=symbols)
+        return cls({s: float(p) for s, p in stocks.values_list('symbol', 'current_price')}, **kwargs)
+
+    def __iter__(self):
+        rng = random.Random(self.seed)
+        prices = dict(self.start_prices)
+        symbols = sorted(prices)
+        if not symbols:
+            return
+        for n in range(self.ticks):
+            symbol = rng.choice(symbols)
+            prices[symbol] = max(0.01, prices[symbol] * (1 + rng.gauss(0, self.volatility)))
+            yield Quote(symbol, round(prices[symbol], 2), None, n)
+            if self.interval:
+                time.sleep(self.interval)
+
+    def record(self, path):
+        """Write the stream to CSV so it can be replayed with replay()"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(Quote._fields)
+            for quote in self:
+                writer.writerow(quote)
+
+    @staticmethod
+    def replay(path, speed=0.0):
+        """Yield ticks from a recorded CSV; speed > 0 honours the recorded ts gaps scaled by 1/speed"""
+        with open(path, newline='') as f:
+            prev_ts = None
+            for row in csv.DictReader(f):
+                ts = float(row['ts']) if row.get('ts') else None
+                if speed and ts is not None and prev_ts is not None and ts > prev_ts:
+                    time.sleep((ts - prev_ts) / speed)
+                prev_ts = ts
+                yield Quote(
+                    row['symbol'],
+                    float(row['price']),
+                    float(row['previous_close']) if row.get('previous_close') else None,
+                    ts,
+                )
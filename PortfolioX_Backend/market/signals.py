@@ -0,0 +1,7 @@
+"""Cache invalidation for market data, connected in MarketConfig.ready()"""
+from market.adjustments import AdjustedPrices
+
+
+def corporate_action_changed(sender, instance, **kwargs):
+    # Also fires for actions removed with their stock or through queryset.delete()
+    AdjustedPrices.invalidate(instance.stock_id)
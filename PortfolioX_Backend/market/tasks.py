@@ -0,0 +1,92 @@
+from celery import shared_task
+from django.utils import timezone
+import yfinance as yf
+from core.admission import release_slot
+from core.db_router import PRIMARY
+from core.models import StockPopulationJob
+from market.models import Stock
+from market.utils import search_yahoo_stock, upsert_price_history
+from market.price_store import refresh_price_stores
+
+
+@shared_task
+def populate_stock(job_id, slot=None):
+    """Resolve a partial name on Yahoo, then load the stock and 90 days of history.
+
+    `slot` is the core.admission stock_lookups slot the request took; it is released when the job ends.
+    """
+    try:
+        return _populate(job_id)
+    finally:
+        release_slot(slot)
+
+
+def _populate(job_id):
+    # Only a job still queued is claimed: one expired (and maybe replaced) meanwhile stays failed.
+    # Enqueued right after the job row was committed; a replica may not have it yet
+    jobs = StockPopulationJob.objects.using(PRIMARY).filter(id=job_id)
+    if not jobs.filter(status='pending').update(status='processing'):
+        return {'status': 'skipped', 'job_id': job_id}
+    job = jobs.get()
+
+    try:
+        candidates = search_yahoo_stock(job.query)
+        if not candidates:
+            return _finish(job, 'failed', error={'error': f'No matching stocks found for {job.query}'})
+        selected = candidates[0]
+        yf_symbol = selected['symbol']
+
+        ticker = yf.Ticker(yf_symbol)
+        info = ticker.info
+        current_price = info.get('currentPrice')
+        previous_close = info.get('previousClose')
+        stock, created = Stock.objects.update_or_create(
+            symbol=yf_symbol,
+            defaults={
+                'name': selected['name'],
+                'exchange': selected['exchange'],
+                'current_price': current_price,
+                'previous_close': previous_close,
+                'day_change': current_price - previous_close if current_price and previous_close else None,
+                'day_change_pct': info.get('regularMarketChangePercent'),
+                'is_active': True,
+                'last_updated': timezone.now(),
+            }
+        )
+
+        count = upsert_price_history(stock, ticker.history(period="90d"))
+        # The 90 days may correct closes the store already holds
+        refresh_price_store.delay(stock_ids=[stock.id])
+
+        job.symbol = stock.symbol
+        return _finish(job, 'completed', result={
+            'symbol': stock.symbol,
+            'name': stock.name,
+            'exchange': stock.exchange,
+            'current_price': float(stock.current_price) if stock.current_price is not None else None,
+            'loaded_history_records': count,
+        })
+
+    except Exception as e:
+        return _finish(job, 'failed', error={'error': str(e)})
+
+
+@shared_task
+def expire_population_jobs():
+    """Fail stock population jobs whose message or worker was lost"""
+    return {'expired': StockPopulationJob.expire_stale()}
+
+
+@shared_task
+def refresh_price_store(stock_ids=(), benchmark_ids=()):
+    """Fold newly synced price history into the columnar price store, re-reading the given ids in full"""
+    return refresh_price_stores(stock_ids, benchmark_ids)
+
+
+def _finish(job, status, result=None, error=None):
+    job.status = status
+    job.result = result
+    job.error_log = error
+    job.completed_at = timezone.now()
+    job.save(update_fields=['symbol', 'status', 'result', 'error_log', 'completed_at'])
+    return {'status': status, 'job_id': job.id}
@@ -1,3 +1,408 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.models import StockPopulationJob
+from core.testing import local_response_cache, strict_query_budgets
+from market.adjustments import AdjustedPrices
+from market import tasks
+from market.benchmarks import sync_benchmarks
+from market.models import BenchmarkIndex, BenchmarkPriceHistory, CorporateAction, Stock, StockPriceHistory
+from market.price_store import PriceStore, refresh_price_stores
+from market.quotes import Quote, QuoteIngestor, QuoteSimulator
+from market.utils import upsert_benchmark_history
+from users.models import User
+
+
+@strict_query_budgets
+@local_response_cache()
+class MarketQueryBudgetTests(TransactionTestCase):
+    """The stock population endpoints stay within their declared budgets.
+
+    Not a TestCase: its savepoints would be counted against the view's atomic block.
+    """
+
+    def setUp(self):
+        # Lookup slots are only released by populate_stock, which is not queued here
+        caches[settings.ADMISSION_CACHE].clear()
+        enqueue = mock.patch('market.views.populate_stock.delay')
+        self.delay = enqueue.start()
+        self.addCleanup(enqueue.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('budget', 'budget@example.com', 'pw'))
+
+    def populate(self, name):
+        return self.client.post('/market/api/populate-stock/', {'partial_name': name}, format='json')
+
+    def test_new_job(self):
+        response = self.populate('infy')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['status'], 'pending')
+        self.delay.assert_called_once()
+
+    def test_repeated_search_reuses_the_job(self):
+        job_id = self.populate('infy').json()['job_id']
+        self.assertEqual(self.populate('INFY').json()['job_id'], job_id)
+
+    def test_stale_job_is_replaced(self):
+        job_id = self.populate('infy').json()['job_id']
+        StockPopulationJob.objects.filter(id=job_id).update(created_at=StockPopulationJob.stale_cutoff())
+        self.assertNotEqual(self.populate('infy').json()['job_id'], job_id)
+        self.assertEqual(StockPopulationJob.objects.get(id=job_id).status, 'failed')
+
+    def test_job_status(self):
+        job_id = self.populate('infy').json()['job_id']
+        response = self.client.get(f'/market/api/populate-stock/{job_id}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual((data['job_id'], data['query'], data['status']), (job_id, 'INFY', 'pending'))
+        self.assertIsNone(data['completed_at'])
+        self.assertEqual(self.client.get('/market/api/populate-stock/0/').status_code, 404)
+
+    def test_failed_enqueue_releases_the_slot(self):
+        self.delay.side_effect = ConnectionError('broker down')
+        job_id = self.populate('infy').json()['job_id']
+        self.assertEqual(StockPopulationJob.objects.get(id=job_id).status, 'failed')
+        concurrency = settings.ADMISSION_CLASSES['stock_lookups']['concurrency']
+        held = caches[settings.ADMISSION_CACHE].get_many([f'adm:slot:stock_lookups:{i}' for i in range(concurrency)])
+        self.assertEqual(held, {})
+
+
+class PopulateStockTaskTests(TestCase):
+
+    @mock.patch('market.tasks.search_yahoo_stock', return_value=[])
+    def test_pending_job_is_claimed(self, search):
+        job = StockPopulationJob.objects.create(query='INFY')
+        self.assertEqual(tasks._populate(job.id)['status'], 'failed')
+        search.assert_called_once_with('INFY')
+        job.refresh_from_db()
+        self.assertEqual(job.error_log, {'error': 'No matching stocks found for INFY'})
+
+    @mock.patch('market.tasks.refresh_price_store.delay')
+    @mock.patch('market.tasks.yf.Ticker')
+    @mock.patch('market.tasks.search_yahoo_stock', return_value=[{'symbol': 'INFY.NS', 'name': 'Infosys', 'exchange': 'NSI'}])
+    def test_loaded_history_is_reloaded_into_the_price_store(self, search, ticker, refresh):
+        ticker.return_value.info = {'currentPrice': 1500.0, 'previousClose': 1490.0}
+        ticker.return_value.history.return_value = pd.DataFrame(
+            {'Open': [1.0], 'High': [1.0], 'Low': [1.0], 'Close': [1.0], 'Volume': [10]},
+            index=pd.to_datetime([date(2024, 3, 1)]),
+        )
+        job = StockPopulationJob.objects.create(query='INFY')
+        self.assertEqual(tasks._populate(job.id)['status'], 'completed')
+        refresh.assert_called_once_with(stock_ids=[Stock.objects.get(symbol='INFY.NS').id])
+
+    @mock.patch('market.tasks.search_yahoo_stock')
+    def test_expired_job_is_not_revived(self, search):
+        job = StockPopulationJob.objects.create(query='INFY')
+        StockPopulationJob.objects.filter(id=job.id).update(created_at=StockPopulationJob.stale_cutoff())
+        StockPopulationJob.expire_stale()
+        replacement = StockPopulationJob.objects.create(query='INFY')
+
+        self.assertEqual(tasks._populate(job.id), {'status': 'skipped', 'job_id': job.id})
+        search.assert_not_called()
+        self.assertEqual(StockPopulationJob.objects.get(id=job.id).status, 'failed')
+        self.assertEqual(StockPopulationJob.objects.get(id=replacement.id).status, 'pending')
+
+
+class BenchmarkHistoryTests(TestCase):
+    """Incremental syncs write only the days after the last stored close"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.index = BenchmarkIndex.objects.create(symbol='^SYNC', name='Sync index')
+        cls.days = [date(2024, 3, 1) + timedelta(days=d) for d in range(8)]
+        BenchmarkPriceHistory.objects.bulk_create([
+            BenchmarkPriceHistory(benchmark=cls.index, trade_date=d, close_value=Decimal(100), daily_return=Decimal(0))
+            for d in cls.days[:6]
+        ])
+
+    def frame(self):
+        # Yahoo's copy of the stored days differs, so a rewrite would show
+        return pd.DataFrame({'Close': [200.0 + i for i in range(8)]}, index=pd.to_datetime(self.days))
+
+    def stored(self):
+        return list(BenchmarkPriceHistory.objects.filter(benchmark=self.index).order_by('trade_date').values_list(
+            'trade_date', 'close_value', 'daily_return'))
+
+    def test_stored_days_are_only_previous_closes(self):
+        self.assertEqual(upsert_benchmark_history(self.index, self.frame(), stored_through=self.days[5]), 2)
+        rows = self.stored()
+        self.assertEqual(rows[:6], [(d, Decimal('100.00'), Decimal('0.0000')) for d in self.days[:6]])
+        self.assertEqual(rows[6:], [
+            (self.days[6], Decimal('206.00'), Decimal('0.4878')),
+            (self.days[7], Decimal('207.00'), Decimal('0.4854')),
+        ])
+
+    def test_full_frame_without_stored_days(self):
+        self.assertEqual(upsert_benchmark_history(self.index, self.frame()), 8)
+        self.assertEqual(self.stored()[0], (self.days[0], Decimal('200.00'), None))
+
+    @mock.patch('market.benchmarks._fetch_history')
+    def test_sync_passes_the_last_stored_day(self, fetch):
+        fetch.return_value = self.frame()
+        [result] = sync_benchmarks([{'symbol': '^SYNC', 'name': 'Sync index'}], max_workers=1)
+        self.assertEqual(result['rows'], 2, result)
+        fetch.assert_called_once_with('^SYNC', self.days[5], '90d')
+        self.assertEqual([r[1] for r in self.stored()], [Decimal(100)] * 6 + [Decimal(206), Decimal(207)])
+
+
+class PriceStoreTests(TestCase):
+    """Refreshes, reads and file replacement of the columnar store, in a temporary directory"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stocks = [Stock.objects.create(symbol=f'PS{i}.NS', name=f'Store {i}') for i in range(2)]
+        cls.days = [date(2024, 3, 1) + timedelta(days=d) for d in range(5)]
+        StockPriceHistory.objects.bulk_create([
+            StockPriceHistory(stock=stock, trade_date=d, close_price=Decimal(100 * (i + 1) + n))
+            for i, stock in enumerate(cls.stocks) for n, d in enumerate(cls.days)
+        ])
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PRICE_STORE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.store = PriceStore.stocks()
+        self.assertEqual(self.store.refresh(), 10)
+
+    def add_close(self, stock, day, close):
+        StockPriceHistory.objects.update_or_create(stock=stock, trade_date=day, defaults={'close_price': Decimal(close)})
+
+    def test_reads(self):
+        dates, values = self.store.series('PS1.NS', start=self.days[1], end=self.days[3])
+        self.assertEqual(dates.tolist(), self.days[1:4])
+        self.assertEqual(values.tolist(), [201.0, 202.0, 203.0])
+        self.assertIsNone(self.store.series('MISSING.NS'))
+
+        dates, symbols, matrix = self.store.window(ids=[self.stocks[1].id, self.stocks[0].id], start=self.days[3])
+        self.assertEqual(symbols, ['PS1.NS', 'PS0.NS'])
+        self.assertEqual(matrix.tolist(), [[203.0, 103.0], [204.0, 104.0]])
+
+        _, returns = self.store.series(id=self.stocks[0].id, field='return')
+        self.assertTrue(np.isnan(returns[0]))
+        self.assertAlmostEqual(returns[1], 1.0)
+
+    def test_refresh_adds_new_days_and_symbols(self):
+        self.add_close(self.stocks[0], self.days[-1] + timedelta(days=3), 110)
+        stock = Stock.objects.create(symbol='PS2.NS', name='Store 2')
+        self.add_close(stock, self.days[0], 50)
+        # The last stored day of both columns, the new day and the new column
+        self.assertEqual(self.store.refresh(), 4)
+
+        dates, values = self.store.series('PS0.NS', start=self.days[-1])
+        self.assertEqual(values.tolist(), [104.0, 110.0])
+        # A gap day is blank, and the return spans the gap
+        _, returns = self.store.series('PS0.NS', start=dates[-1], field='return')
+        self.assertAlmostEqual(returns[0], (110 / 104 - 1) * 100)
+        self.assertEqual(self.store.series('PS2.NS')[1][0], 50.0)
+
+    def test_older_corrections_need_a_reload(self):
+        self.add_close(self.stocks[0], self.days[1], 150)
+        self.store.refresh()
+        self.assertEqual(self.store.series('PS0.NS')[1][1], 101.0)
+
+        StockPriceHistory.objects.filter(stock=self.stocks[0], trade_date=self.days[2]).delete()
+        refresh_price_stores(stock_ids=[self.stocks[0].id])
+        self.assertEqual(self.store.series('PS0.NS')[1][1], 150.0)
+        self.assertTrue(np.isnan(self.store.series('PS0.NS')[1][2]))
+        # Other columns are left as they were
+        self.assertEqual(self.store.series('PS1.NS')[1].tolist(), [200.0, 201.0, 202.0, 203.0, 204.0])
+
+    def test_mapped_version_is_not_rewritten(self):
+        _, before = self.store.series('PS0.NS')
+        self.add_close(self.stocks[0], self.days[-1], 999)
+        self.store.refresh()
+
+        self.assertEqual(before[-1], 104.0)
+        self.assertEqual(self.store.series('PS0.NS')[1][-1], 999.0)
+        self.assertEqual(self.store._read_meta()['version'], 2)
+        # The version before stays for readers that still map it; nothing else is left behind
+        self.store.refresh()
+        names = sorted(f.name for f in self.store.path.iterdir())
+        self.assertEqual(names, sorted(['.refresh.lock', 'meta.json'] + [
+            f'{name}.v{version}.npy' for name in ('dates', 'close', 'return') for version in (2, 3)
+        ]))
+
+
+class QuoteIngestorTests(TestCase):
+    """Coalesced writes from simulated and replayed streams"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Stock.objects.create(symbol=f'QT{i}.NS', name=f'Quote {i}', current_price=Decimal(100 * (i + 1)),
+                                 previous_close=Decimal(100 * (i + 1)))
+
+    def simulator(self):
+        return QuoteSimulator.from_stocks(seed=7, ticks=500)
+
+    def last_prices(self, stream):
+        return {quote.symbol: Decimal(str(quote.price)).quantize(Decimal('0.01')) for quote in stream}
+
+    def stored_prices(self):
+        return dict(Stock.objects.filter(symbol__startswith='QT').values_list('symbol', 'current_price'))
+
+    def test_ticks_coalesce_to_one_write_per_symbol(self):
+        simulator = self.simulator()
+        stats = QuoteIngestor(flush_interval=3600).run(simulator)
+        self.assertEqual(stats, {'ticks': 500, 'flushes': 1, 'rows_written': 3, 'unknown_symbols': 0})
+        self.assertEqual(self.stored_prices(), self.last_prices(simulator))
+        stock = Stock.objects.get(symbol='QT0.NS')
+        self.assertEqual(stock.day_change, stock.current_price - Decimal(100))
+
+    def test_replay_matches_the_recording(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'ticks.csv')
+        simulator = self.simulator()
+        simulator.record(path)
+
+        stats = QuoteIngestor(flush_interval=3600).run(QuoteSimulator.replay(path))
+        self.assertEqual(stats['ticks'], 500)
+        self.assertEqual(self.stored_prices(), self.last_prices(simulator))
+
+    def test_quiet_source_is_flushed_on_time(self):
+        ingestor = QuoteIngestor(flush_interval=0.05)
+        written_while_quiet = []
+
+        def stream():
+            yield Quote('QT0.NS', 150.0)
+            yield Quote('QT1.NS', 250.0)
+            # The market goes quiet: no further tick arrives to trigger a flush
+            deadline = time.monotonic() + 5
+            while ingestor.stats['rows_written'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            written_while_quiet.append(ingestor.stats['rows_written'])
+
+        stats = ingestor.run(stream())
+        self.assertEqual(written_while_quiet, [2])
+        self.assertEqual(stats['rows_written'], 2)
+        self.assertEqual(self.stored_prices()['QT1.NS'], Decimal('250.00'))
+
+    def test_source_errors_reach_the_caller(self):
+        def stream():
+            yield Quote('QT0.NS', 150.0)
+            raise ConnectionError('feed dropped')
+
+        with self.assertRaisesMessage(ConnectionError, 'feed dropped'):
+            QuoteIngestor(flush_interval=3600).run(stream())
+
+    def test_unknown_symbols_are_not_looked_up_every_flush(self):
+        ingestor = QuoteIngestor()
+        ingestor._load_stocks()
+        ingestor.on_quote(Quote('GONE.NS', 1.0))
+        with self.assertNumQueries(1):
+            self.assertEqual(ingestor.flush(), 0)
+        ingestor.on_quote(Quote('GONE.NS', 1.0))
+        with self.assertNumQueries(0):
+            self.assertEqual(ingestor.flush(), 0)
+        self.assertEqual(ingestor.stats['unknown_symbols'], 2)
+
+        Stock.objects.create(symbol='GONE.NS', name='Listed later', previous_close=Decimal(1))
+        with mock.patch('market.quotes.UNKNOWN_RETRY_SECONDS', 0):
+            ingestor.on_quote(Quote('GONE.NS', 2.0))
+            self.assertEqual(ingestor.flush(), 1)
+
+
+@strict_query_budgets
+@local_response_cache()
+class AdjustedPricesTests(TestCase):
+    """Read-time corporate-action adjustment and its cached factor schedules"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.stock = Stock.objects.create(symbol='ADJ.NS', name='Adjusted')
+        cls.days = [date(2024, 3, 1) + timedelta(days=d) for d in range(6)]
+        # A 2:1 split takes effect on day 2 and a 10 rupee dividend on day 4
+        closes = [1000, 1010, 505, 510, 490, 495]
+        StockPriceHistory.objects.bulk_create([
+            StockPriceHistory(stock=cls.stock, trade_date=d, close_price=Decimal(c)) for d, c in zip(cls.days, closes)
+        ])
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # An empty store, so closes are read from the history table
+        store = override_settings(PRICE_STORE_DIR=directory.name)
+        store.enable()
+        self.addCleanup(store.disable)
+        caches['default'].clear()
+
+    def add_actions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CorporateAction.objects.create(stock=self.stock, ex_date=self.days[2], action_type='split',
+                                           factor=CorporateAction.split_factor(2))
+            CorporateAction.objects.create(stock=self.stock, ex_date=self.days[4], action_type='dividend',
+                                           factor=CorporateAction.dividend_factor(10, 500))
+
+    def closes(self):
+        return np.round(AdjustedPrices.get(self.stock.id)[1], 2).tolist()
+
+    def test_factors(self):
+        self.assertEqual(CorporateAction.split_factor(5), 0.2)
+        self.assertEqual(CorporateAction.bonus_factor(1), 0.5)
+        self.assertEqual(CorporateAction.dividend_factor(10, 500), 0.98)
+
+    def test_split_and_dividend_adjustment(self):
+        self.add_actions()
+        dates, closes, returns = AdjustedPrices.get(self.stock.id)
+        self.assertEqual(dates.tolist(), self.days)
+        self.assertEqual(np.round(closes, 2).tolist(), [490.0, 494.9, 494.9, 499.8, 490.0, 495.0])
+        # No jump across the split; the dividend day only loses what was not paid out
+        self.assertAlmostEqual(returns[2], 0.0)
+        self.assertAlmostEqual(returns[4], (490 / 499.8 - 1) * 100)
+
+    def test_schedule_is_cached_until_an_action_changes(self):
+        self.assertEqual(self.closes(), [1000.0, 1010.0, 505.0, 510.0, 490.0, 495.0])
+        with self.assertNumQueries(1):
+            self.closes()
+
+        self.add_actions()
+        self.assertEqual(self.closes()[0], 490.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CorporateAction.objects.filter(action_type='dividend').delete()
+        self.assertEqual(self.closes()[0], 500.0)
+
+        action = CorporateAction.objects.get()
+        action.factor = Decimal('0.25')
+        with self.captureOnCommitCallbacks(execute=True):
+            action.save()
+        self.assertEqual(self.closes()[0], 250.0)
+
+    def test_stock_delete_drops_the_schedule(self):
+        self.add_actions()
+        AdjustedPrices.schedule(self.stock.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.delete()
+        self.assertIsNone(caches['default'].get(AdjustedPrices._cache_key(self.stock.id)))
+
+    def test_endpoint(self):
+        self.add_actions()
+        client = APIClient()
+        response = client.get('/market/api/stocks/adj.ns/prices/', {'start': '2024-03-02', 'end': '2024-03-05'})
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(body['dates'], ['2024-03-02', '2024-03-03', '2024-03-04', '2024-03-05'])
+        self.assertEqual(body['close'], [494.9, 494.9, 499.8, 490.0])
+        self.assertIsNone(body['daily_return'][0])
+        self.assertEqual(body['daily_return'][1], 0.0)
+
+        raw = client.get('/market/api/stocks/ADJ.NS/prices/', {'adjusted': 'false'}).json()
+        self.assertEqual(raw['close'], [1000.0, 1010.0, 505.0, 510.0, 490.0, 495.0])
+        self.assertEqual(client.get('/market/api/stocks/ADJ.NS/prices/', {'start': 'March'}).status_code, 400)
+        self.assertEqual(client.get('/market/api/stocks/NONE.NS/prices/').status_code, 404)
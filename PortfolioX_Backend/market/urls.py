@@ -4,4 +4,6 @@ from . import views
 urlpatterns = []
 urlpatterns += [
     path('api/populate-stock/', views.add_and_populate_stock),
+    path('api/populate-stock/<int:job_id>/', views.get_population_job),
+    path('api/stocks/<str:symbol>/prices/', views.get_price_history),
 ]
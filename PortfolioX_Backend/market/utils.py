@@ -46,8 +46,10 @@ def search_yahoo_stock(partial_name):
     return candidates
 
 import yfinance as yf
+import pandas as pd
 from datetime import datetime
-from market.models import BenchmarkIndex, BenchmarkPriceHistory
+from market.models import BenchmarkIndex, BenchmarkPriceHistory, StockPriceHistory
+from core.response_cache import invalidate_all
 
 def load_benchmark_index(yahoo_symbol, custom_name=None, description=None):
     ticker = yf.Ticker(yahoo_symbol)
@@ -66,15 +68,61 @@ def load_benchmark_index(yahoo_symbol, custom_name=None, description=None):
             'last_updated': last_updated,
         }
     )
-    # Import price history (keep this section as-is)
-    hist = ticker.history(period="90d")
-    for dt, row in hist.iterrows():
-        BenchmarkPriceHistory.objects.update_or_create(
+    upsert_benchmark_history(index, ticker.history(period="90d"))
+    return index
+
+
+def upsert_price_history(stock, hist):
+    """Write a yfinance history frame to StockPriceHistory in one statement"""
+    rows = [
+        StockPriceHistory(
+            stock=stock,
+            trade_date=dt.date(),
+            open_price=row['Open'],
+            high_price=row['High'],
+            low_price=row['Low'],
+            close_price=row['Close'],
+            volume=row['Volume'],
+            daily_return=None,
+        )
+        for dt, row in hist.iterrows()
+    ]
+    StockPriceHistory.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['stock', 'trade_date'],
+        update_fields=['open_price', 'high_price', 'low_price', 'close_price', 'volume'],
+    )
+    if rows:
+        invalidate_all()
+    return len(rows)
+
+
+def upsert_benchmark_history(index, hist, stored_through=None):
+    """Write a yfinance history frame to BenchmarkPriceHistory in one statement.
+
+    daily_return is the percent change from the previous row of the frame. Rows
+    up to stored_through (the last date already stored) are only used as
+    previous closes and not rewritten.
+    """
+    closes = hist['Close'].dropna()
+    returns = closes.pct_change() * 100
+    rows = [
+        BenchmarkPriceHistory(
             benchmark=index,
             trade_date=dt.date(),
-            defaults={
-                'close_value': row['Close'],
-                'daily_return': None if row['Close'] is None else 0.0  # Put logic here if desired
-            }
+            close_value=round(float(close), 2),
+            daily_return=None if pd.isna(ret) else round(float(ret), 4),
         )
-    return index
+        for (dt, close), ret in zip(closes.items(), returns)
+        if stored_through is None or dt.date() > stored_through
+    ]
+    BenchmarkPriceHistory.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['benchmark', 'trade_date'],
+        update_fields=['close_value', 'daily_return'],
+    )
+    if rows:
+        invalidate_all()
+    return len(rows)
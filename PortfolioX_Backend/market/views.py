@@ -1,58 +1,125 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+import numpy as np
 
 # Create your views here.
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from market.models import Stock, StockPriceHistory
-from market.utils import search_yahoo_stock
-import yfinance as yf
+from core.admission import acquire_slot, admission_control, release_slot
+from core.models import StockPopulationJob
+from core.querybudget import query_budget
+from market.adjustments import AdjustedPrices
+from market.models import Stock
+from market.tasks import populate_stock
+
+
+def _job_payload(job):
+    return {
+        'job_id': job.id,
+        'query': job.query,
+        'symbol': job.symbol,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error_log,
+        'created_at': job.created_at,
+        'completed_at': job.completed_at,
+    }
+
+
+def _enqueue(job, slot):
+    """Queue the job's lookup; a job that cannot be queued is failed rather than left active"""
+    try:
+        populate_stock.delay(job.id, slot)
+    except Exception as e:
+        print(f"Error queueing stock population job {job.id}: {e}")
+        # populate_stock would have released it
+        release_slot(slot)
+        job.status = 'failed'
+        job.error_log = {'error': 'The lookup could not be queued'}
+        job.completed_at = timezone.now()
+        job.save(update_fields=['status', 'error_log', 'completed_at'])
+
 
 @api_view(['POST'])
+@admission_control('stock_population')
+@query_budget(4)
 def add_and_populate_stock(request):
+    """Queue a Yahoo lookup + history load; poll the returned job for the result"""
     partial_name = request.data.get('partial_name', '').strip()
     if not partial_name:
         return Response({'error': 'partial_name is required'}, status=400)
+    query = partial_name.upper()
+    if len(query) > StockPopulationJob._meta.get_field('query').max_length:
+        return Response({'error': 'partial_name is too long'}, status=400)
+
+    active = StockPopulationJob.objects.filter(query=query, status__in=StockPopulationJob.ACTIVE_STATUSES)
+    job = active.first()
+    if job is not None and job.is_stale:
+        # Its message or worker was lost; fail it so the search term can be queued again
+        StockPopulationJob.expire_stale(id=job.id)
+        job = None
+    if job is None:
+        user = request.user if request.user.is_authenticated else None
+        # Held until populate_stock finishes; 429 while too many lookups are queued
+        slot = acquire_slot('stock_lookups')
+        try:
+            with transaction.atomic():
+                job = StockPopulationJob.objects.create(user=user, query=query)
+                transaction.on_commit(lambda: _enqueue(job, slot))
+        except IntegrityError:
+            release_slot(slot)
+            # Lost the race to a concurrent request for the same symbol
+            job = active.first()
+            if job is None:
+                return Response({'error': 'A lookup for this name just finished; retry'}, status=409)
+
+    return Response(_job_payload(job), status=202)
+
 
-    stock, created = Stock.objects.get_or_create(symbol=partial_name, defaults={'name': partial_name})
-    candidates = search_yahoo_stock(partial_name)
-    if not candidates:
-        return Response({'error': f'No matching stocks found for {partial_name}'}, status=404)
-    selected = candidates[0]
-    yf_symbol = selected['symbol']
-
-    ticker = yf.Ticker(yf_symbol)
-    info = ticker.info
-    stock.name = selected['name']
-    stock.symbol = yf_symbol
-    stock.exchange = selected['exchange']
-    stock.current_price = info.get('currentPrice')
-    stock.previous_close = info.get('previousClose')
-    stock.day_change = info.get('currentPrice', 0) - info.get('previousClose', 0) if info.get('currentPrice') and info.get('previousClose') else None
-    stock.day_change_pct = info.get('regularMarketChangePercent')
-    stock.is_active = True
-    stock.save()
-
-    hist = ticker.history(period="90d")
-    count = 0
-    for dt, row in hist.iterrows():
-        StockPriceHistory.objects.update_or_create(
-            stock=stock,
-            trade_date=dt.date(),
-            defaults={
-                'open_price': row['Open'],
-                'high_price': row['High'],
-                'low_price': row['Low'],
-                'close_price': row['Close'],
-                'volume': row['Volume'],
-                'daily_return': None,
-            }
-        )
-        count += 1
+@api_view(['GET'])
+@query_budget(1)
+def get_population_job(request, job_id):
+    """Status of a stock population job"""
+    job = get_object_or_404(StockPopulationJob, id=job_id)
+    return Response(_job_payload(job))
 
+
+@api_view(['GET'])
+@query_budget(3)
+def get_price_history(request, symbol):
+    """Daily closes and returns of a stock, adjusted for corporate actions unless ?adjusted=false.
+
+    ?start= / ?end= (YYYY-MM-DD) bound the range. Returns are in percent and
+    null where there is no previous close.
+    """
+    stock = get_object_or_404(Stock, symbol=symbol.upper())
+    try:
+        start, end = (_date_param(request, name) for name in ('start', 'end'))
+    except ValueError:
+        return Response({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+    adjusted = request.GET.get('adjusted', 'true').lower() != 'false'
+
+    dates, closes, returns = AdjustedPrices.get(stock.id, start, end, adjust=adjusted)
     return Response({
         'symbol': stock.symbol,
-        'name': stock.name,
-        'exchange': stock.exchange,
-        'current_price': stock.current_price,
-        'loaded_history_records': count
+        'adjusted': adjusted,
+        'dates': np.datetime_as_string(dates).tolist(),
+        'close': _floats(closes, 2),
+        'daily_return': _floats(returns, 4),
     })
+
+
+def _date_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def _floats(values, places):
+    return [None if np.isnan(v) else v for v in np.round(values, places).tolist()]
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Portfolio, Holding, PortfolioTransaction
+from .models import Portfolio, Holding, PortfolioTransaction, SectorExposure
 
 admin.site.register(Portfolio)
 admin.site.register(Holding)
-admin.site.register(PortfolioTransaction)
\ No newline at end of file
+admin.site.register(PortfolioTransaction)
+admin.site.register(SectorExposure)
\ No newline at end of file
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PortfoliosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portfolios'
+
+    def ready(self):
+        from django.db.models.signals import post_delete
+        from portfolios.models import Holding, Portfolio
+        from portfolios.signals import holding_deleted, portfolio_deleted
+        post_delete.connect(portfolio_deleted, sender=Portfolio, dispatch_uid='portfolios.signals.portfolio_deleted')
+        post_delete.connect(holding_deleted, sender=Holding, dispatch_uid='portfolios.signals.holding_deleted')
@@ -0,0 +1,59 @@
+"""Datasets served by the portfolio export endpoint (see core.exports).
+
+Each builder returns (columns, parts) for one portfolio. value-history is the
+full series: the monthly and weekly rollups HistoryCompactor left for older
+dates, then the daily rows, split the way HistoryReader stitches them.
+Holdings are the positions as they stand at export time.
+"""
+from django.db.models import CharField, DecimalField, Value
+
+from analytics.models import PortfolioValueHistory, PortfolioValueRollup
+from portfolios.models import Holding, PortfolioTransaction
+
+
+def transactions(portfolio_id):
+    columns = ['id', 'transaction_date', 'symbol', 'transaction_type', 'quantity', 'price', 'notes', 'created_at']
+    queryset = PortfolioTransaction.objects.filter(portfolio_id=portfolio_id).order_by('transaction_date', 'id')
+    return columns, [(queryset, ['id', 'transaction_date', 'stock__symbol', 'transaction_type', 'quantity',
+                                 'price', 'notes', 'created_at'])]
+
+
+def holdings(portfolio_id):
+    columns = ['id', 'symbol', 'name', 'quantity', 'avg_buy_price', 'buy_date', 'invested_value',
+               'current_value', 'gain_loss', 'weight_pct', 'updated_at']
+    queryset = Holding.objects.filter(portfolio_id=portfolio_id).order_by('stock__symbol')
+    return columns, [(queryset, ['id', 'stock__symbol', 'stock__name', 'quantity', 'avg_buy_price', 'buy_date',
+                                 'invested_value', 'current_value', 'gain_loss', 'weight_pct', 'updated_at'])]
+
+
+def value_history(portfolio_id):
+    """Rollups contribute their period-end (close) value dated at period_end"""
+    columns = ['date', 'granularity', 'total_value', 'invested_value', 'daily_return', 'cumulative_return']
+    daily = PortfolioValueHistory.objects.filter(portfolio_id=portfolio_id).order_by('record_date')
+    rollups = PortfolioValueRollup.objects.filter(portfolio_id=portfolio_id).order_by('period_end')
+
+    first_daily = daily.values_list('record_date', flat=True).first()
+    weekly = rollups.filter(granularity='week')
+    if first_daily:
+        weekly = weekly.filter(period_end__lt=first_daily)
+    first_weekly = weekly.values_list('period_end', flat=True).first() or first_daily
+    monthly = rollups.filter(granularity='month')
+    if first_weekly:
+        monthly = monthly.filter(period_end__lt=first_weekly)
+
+    # Rollups keep no returns
+    unknown = {name: Value(None, output_field=DecimalField()) for name in ('no_daily_return', 'no_cumulative_return')}
+    rollup_fields = ['period_end', 'granularity', 'close_value', 'invested_value', *unknown]
+    return columns, [
+        (monthly.annotate(**unknown), rollup_fields),
+        (weekly.annotate(**unknown), rollup_fields),
+        (daily.annotate(granularity=Value('day', output_field=CharField())),
+         ['record_date', 'granularity', 'total_value', 'invested_value', 'daily_return', 'cumulative_return']),
+    ]
+
+
+DATASETS = {
+    'transactions': transactions,
+    'holdings': holdings,
+    'value-history': value_history,
+}
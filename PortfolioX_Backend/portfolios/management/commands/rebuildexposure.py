@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from portfolios.models import SectorExposure
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-portfolio sector exposure table from holdings (after bulk loads or sector changes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('portfolio_ids', nargs='*', type=int, help='Only these portfolios (default: all)')
+        parser.add_argument('--report', action='store_true', help='Print value held per sector across portfolios')
+
+    def handle(self, *args, **options):
+        rows = SectorExposure.rebuild(options['portfolio_ids'] or None)
+        self.stdout.write(f"Rebuilt {rows} sector exposure rows")
+        if options['report']:
+            for row in SectorExposure.sector_totals():
+                self.stdout.write(
+                    f"  {row['sector__name'] or SectorExposure.UNKNOWN:<30} {row['current_value']:>16} "
+                    f"({row['portfolios']} portfolios, {row['holdings']} holdings)"
+                )
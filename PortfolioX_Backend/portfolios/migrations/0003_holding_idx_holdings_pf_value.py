@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolios', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='holding',
+            index=models.Index(fields=['portfolio', '-current_value'], name='idx_holdings_pf_value'),
+        ),
+    ]
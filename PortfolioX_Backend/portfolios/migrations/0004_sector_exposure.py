@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_exposure(apps, schema_editor):
+    Holding = apps.get_model('portfolios', 'Holding')
+    SectorExposure = apps.get_model('portfolios', 'SectorExposure')
+    totals = Holding.objects.values('portfolio_id', 'stock__sector_id').annotate(
+        count=Count('id'), value=Sum('current_value'), invested=Sum('invested_value'),
+    ).order_by()
+    SectorExposure.objects.bulk_create([
+        SectorExposure(portfolio_id=t['portfolio_id'], sector_id=t['stock__sector_id'], holdings_count=t['count'],
+                       current_value=t['value'] or 0, invested_value=t['invested'] or 0)
+        for t in totals.iterator(chunk_size=5000)
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_drop_redundant_fk_indexes'),
+        ('portfolios', '0003_holding_idx_holdings_pf_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectorExposure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holdings_count', models.IntegerField(default=0)),
+                ('current_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('invested_value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('portfolio', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sector_exposures', to='portfolios.portfolio')),
+                ('sector', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='market.sector')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sector', '-current_value'], name='idx_sector_exposure_value')],
+                'constraints': [models.UniqueConstraint(fields=('portfolio', 'sector'), name='uniq_sector_exposure'), models.UniqueConstraint(condition=models.Q(('sector__isnull', True)), fields=('portfolio',), name='uniq_sector_exposure_unknown')],
+            },
+        ),
+        migrations.RunPython(build_exposure, migrations.RunPython.noop),
+    ]
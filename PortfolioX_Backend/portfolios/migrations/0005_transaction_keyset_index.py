@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_drop_redundant_fk_indexes'),
+        ('portfolios', '0004_sector_exposure'),
+    ]
+
+    operations = [
+        # Build the replacement before dropping the FK index it covers
+        migrations.AddIndex(
+            model_name='portfoliotransaction',
+            index=models.Index(fields=['portfolio', '-created_at', '-id'], name='idx_transactions_pf_created'),
+        ),
+        migrations.AlterField(
+            model_name='portfoliotransaction',
+            name='portfolio',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='portfolios.portfolio'),
+        ),
+    ]
@@ -1,6 +1,13 @@
-﻿from django.db import models
+﻿from decimal import Decimal
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, F, Q, Sum, Value, Window
+from django.db.models.functions import NullIf
 from django.conf import settings
-from market.models import Stock, BenchmarkIndex
+from django.utils import timezone
+from market.models import Stock, BenchmarkIndex, Sector
+from core.response_cache import invalidate_portfolio
+
+CENT = Decimal('0.01')
 
 class Portfolio(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -18,6 +25,10 @@ class Portfolio(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ['user', 'name']
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_portfolio(self.pk)
 
 class Holding(models.Model):
     portfolio = models.ForeignKey(Portfolio, related_name='holdings', on_delete=models.CASCADE)
@@ -33,10 +44,196 @@ class Holding(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ['portfolio', 'stock']
+        indexes = [
+            # Top holdings by value without a sort
+            models.Index(fields=['portfolio', '-current_value'], name='idx_holdings_pf_value'),
+        ]
+    
+    # Keeping SectorExposure current: save() and the post_delete receiver
+    # (portfolios.signals, so queryset and cascade deletes too) apply the change
+    # in value against the row as it was loaded. Queryset update() and
+    # bulk_create() bypass this; call SectorExposure.rebuild() after them.
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        holding = super().from_db(db, field_names, values)
+        holding._stored_exposure = holding._exposure_state()
+        return holding
+    
+    def save(self, *args, **kwargs):
+        # An instance built with an explicit pk may be an update; its stored state is unknown
+        adding = self._state.adding and self.pk is None
+        old = getattr(self, '_stored_exposure', None)
+        new = self._exposure_state()
+        update_fields = kwargs.get('update_fields')
+        if old and new and update_fields is not None:
+            # Fields left out of update_fields keep their stored value
+            saved = {'portfolio', 'portfolio_id', 'stock', 'stock_id', 'current_value', 'invested_value'} & set(update_fields)
+            new = tuple(n if f in saved else o for f, o, n in zip(
+                ('portfolio_id', 'stock_id', 'current_value', 'invested_value'), old, new))
+        
+        with transaction.atomic(using=router.db_for_write(Holding, instance=self)):
+            super().save(*args, **kwargs)
+            if adding:
+                self._apply_exposure(*new, 1)
+            elif old is None or new is None:
+                SectorExposure.rebuild([self.portfolio_id])
+            elif old[:2] == new[:2]:
+                self._apply_exposure(*new[:2], new[2] - old[2], new[3] - old[3], 0)
+            else:
+                self._apply_exposure(*old[:2], -old[2], -old[3], -1)
+                self._apply_exposure(*new, 1)
+            invalidate_portfolio(self.portfolio_id)
+        self._stored_exposure = new
+    
+    def remove_exposure(self):
+        """Take the deleted holding's stored values out of SectorExposure"""
+        old = getattr(self, '_stored_exposure', None)
+        if old is None:
+            SectorExposure.rebuild([self.portfolio_id])
+        else:
+            self._apply_exposure(*old[:2], -old[2], -old[3], -1)
+    
+    def _exposure_state(self):
+        """(portfolio_id, stock_id, current_value, invested_value) as written to the database"""
+        if self.get_deferred_fields() & {'portfolio_id', 'stock_id', 'current_value', 'invested_value'}:
+            return None
+        return (self.portfolio_id, self.stock_id, self._cents('current_value'), self._cents('invested_value'))
+    
+    def _cents(self, name):
+        value = getattr(self, name)
+        if value is None:
+            return Decimal(0)
+        return self._meta.get_field(name).to_python(value).quantize(CENT)
+    
+    def _apply_exposure(self, portfolio_id, stock_id, current_value, invested_value, holdings_count):
+        if not (current_value or invested_value or holdings_count):
+            return
+        if 'stock' in self._state.fields_cache and self.stock_id == stock_id:
+            sector_id = self.stock.sector_id
+        else:
+            sector_id = Stock.objects.filter(id=stock_id).values_list('sector_id', flat=True).first()
+        SectorExposure.apply(portfolio_id, sector_id, current_value, invested_value, holdings_count)
+
+
+class SectorExposure(models.Model):
+    """Per-portfolio, per-sector totals of the holdings, maintained by Holding.save() and deletes.
+    
+    sector is NULL for holdings whose stock has no sector ('Unknown'). A
+    weekly rebuild() corrects anything that bypassed Holding.save(), such as
+    queryset updates or stocks moving sector.
+    """
+    UNKNOWN = 'Unknown'
+    
+    # No separate FK index: the (portfolio, sector) unique index covers portfolio lookups
+    portfolio = models.ForeignKey(Portfolio, related_name='sector_exposures', on_delete=models.CASCADE, db_index=False)
+    sector = models.ForeignKey(Sector, on_delete=models.CASCADE, null=True, db_index=False)
+    holdings_count = models.IntegerField(default=0)
+    current_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    invested_value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'sector'], name='uniq_sector_exposure'),
+            # NULLs are distinct in the constraint above, so 'Unknown' needs its own
+            models.UniqueConstraint(fields=['portfolio'], condition=Q(sector__isnull=True), name='uniq_sector_exposure_unknown'),
+        ]
+        indexes = [
+            # Cross-portfolio reports: largest exposures to a sector first
+            models.Index(fields=['sector', '-current_value'], name='idx_sector_exposure_value'),
+        ]
+    
+    @classmethod
+    def apply(cls, portfolio_id, sector_id, current_value, invested_value, holdings_count):
+        """Add a change to one (portfolio, sector) row, creating or dropping the row as needed"""
+        if not (current_value or invested_value or holdings_count):
+            return
+        rows = cls.objects.filter(portfolio_id=portfolio_id, sector_id=sector_id)
+        changes = dict(
+            current_value=F('current_value') + current_value,
+            invested_value=F('invested_value') + invested_value,
+            holdings_count=F('holdings_count') + holdings_count,
+            updated_at=timezone.now(),
+        )
+        if rows.update(**changes):
+            if holdings_count < 0:
+                rows.filter(holdings_count__lte=0).delete()
+            return
+        if holdings_count <= 0:
+            # Nothing to take the change from: the table was out of step
+            cls.rebuild([portfolio_id])
+            return
+        try:
+            with transaction.atomic(using=router.db_for_write(cls)):
+                cls.objects.create(
+                    portfolio_id=portfolio_id, sector_id=sector_id, holdings_count=holdings_count,
+                    current_value=current_value, invested_value=invested_value,
+                )
+        except IntegrityError:
+            # A concurrent save created the row first
+            rows.update(**changes)
+    
+    @classmethod
+    def rebuild(cls, portfolio_ids=None):
+        """Recompute the rows of the given portfolios (all portfolios if None) from their holdings"""
+        holdings = Holding.objects.all()
+        rows = cls.objects.all()
+        if portfolio_ids is not None:
+            holdings = holdings.filter(portfolio_id__in=portfolio_ids)
+            rows = rows.filter(portfolio_id__in=portfolio_ids)
+        totals = holdings.values('portfolio_id', 'stock__sector_id').annotate(
+            count=Count('id'), value=Sum('current_value'), invested=Sum('invested_value'),
+        ).order_by()
+        with transaction.atomic(using=router.db_for_write(cls)):
+            rows.delete()
+            created = cls.objects.bulk_create([
+                cls(portfolio_id=t['portfolio_id'], sector_id=t['stock__sector_id'], holdings_count=t['count'],
+                    current_value=t['value'] or 0, invested_value=t['invested'] or 0)
+                for t in totals.iterator(chunk_size=5000)
+            ], batch_size=5000)
+        return len(created)
+    
+    @classmethod
+    def allocation(cls, portfolio_id):
+        """{sector name: weight %} for one portfolio, largest first; {} when it has no value"""
+        rows = list(cls.objects.filter(portfolio_id=portfolio_id).order_by('-current_value').values_list('sector__name', 'current_value'))
+        total = sum(value for _, value in rows)
+        if not total:
+            return {}
+        allocation = {}
+        for name, value in rows:
+            name = name or cls.UNKNOWN
+            allocation[name] = allocation.get(name, 0) + float(value / total * 100)
+        return {name: round(weight, 2) for name, weight in allocation.items()}
+    
+    @classmethod
+    def sector_totals(cls):
+        """Value held in each sector across all portfolios, largest first"""
+        return cls.objects.values('sector__name').annotate(
+            portfolios=Count('portfolio_id'),
+            holdings=Sum('holdings_count'),
+            current_value=Sum('current_value'),
+            invested_value=Sum('invested_value'),
+        ).order_by('-current_value')
+    
+    @classmethod
+    def overweight(cls, threshold):
+        """Rows making up more than threshold % of their portfolio, annotated with that weight.
+        
+        Further .filter() calls on plain columns run before the window and so
+        would narrow the portfolio totals too; pick sectors from the results.
+        """
+        return cls.objects.annotate(
+            portfolio_value=Window(Sum('current_value'), partition_by=[F('portfolio_id')]),
+        ).annotate(
+            weight=F('current_value') * 100 / NullIf(F('portfolio_value'), Value(Decimal(0))),
+        ).filter(weight__gt=threshold).select_related('portfolio', 'sector')
 
 class PortfolioTransaction(models.Model):
     TYPE_CHOICES = [('BUY', 'Buy'), ('SELL', 'Sell')]
-    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE)
+    # No separate FK index: idx_transactions_pf_created leads with portfolio
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, db_index=False)
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     quantity = models.DecimalField(max_digits=12, decimal_places=4)
@@ -44,3 +241,8 @@ class PortfolioTransaction(models.Model):
     transaction_date = models.DateField()
     notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        indexes = [
+            # Keyset pages (core.pagination) of a portfolio's transactions
+            models.Index(fields=['portfolio', '-created_at', '-id'], name='idx_transactions_pf_created'),
+        ]
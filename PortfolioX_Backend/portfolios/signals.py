@@ -0,0 +1,22 @@
+"""Cache and sector exposure upkeep for portfolio data, connected in PortfoliosConfig.ready()"""
+from django.contrib.auth import get_user_model
+
+from core.response_cache import invalidate_portfolio
+from portfolios.models import Portfolio
+
+
+def portfolio_deleted(sender, instance, **kwargs):
+    invalidate_portfolio(instance.pk)
+
+
+def holding_deleted(sender, instance, origin=None, **kwargs):
+    # Also fires for holdings removed with their portfolio or stock, or through queryset.delete()
+    if not _deletes_portfolios(origin):
+        instance.remove_exposure()
+    invalidate_portfolio(instance.portfolio_id)
+
+
+def _deletes_portfolios(origin):
+    """Whether the delete started from portfolios or their owners, whose SectorExposure rows go with them"""
+    model = getattr(origin, 'model', type(origin))
+    return model in (Portfolio, get_user_model())
@@ -1,3 +1,231 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from analytics.models import PortfolioValueHistory
+from core.testing import local_response_cache, strict_query_budgets
+from market.models import BenchmarkIndex, Sector, Stock
+from portfolios.models import Holding, Portfolio, PortfolioTransaction, SectorExposure
+from users.models import User
+
+
+@strict_query_budgets
+@local_response_cache()
+class PortfolioQueryBudgetTests(TestCase):
+    """Every portfolio endpoint stays within its declared budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'pw')
+        sector = Sector.objects.create(name='Budget sector')
+        cls.benchmark = BenchmarkIndex.objects.create(symbol='^BUDGET', name='Budget index')
+        cls.stocks = [
+            Stock.objects.create(symbol=f'BUD{i}.NS', name=f'Budget {i}', sector=sector, current_price=Decimal(100 + i))
+            for i in range(3)
+        ]
+        cls.portfolio = Portfolio.objects.create(user=cls.user, name='Budget', benchmark=cls.benchmark)
+        for stock in cls.stocks[:2]:
+            Holding.objects.create(portfolio=cls.portfolio, stock=stock, quantity=Decimal(5),
+                                   avg_buy_price=stock.current_price)
+        today = date.today()
+        PortfolioTransaction.objects.bulk_create([
+            PortfolioTransaction(portfolio=cls.portfolio, stock=cls.stocks[i % 3], transaction_type='BUY',
+                                 quantity=Decimal(1), price=Decimal(100), transaction_date=today - timedelta(days=i))
+            for i in range(60)
+        ])
+        PortfolioValueHistory.objects.bulk_create([
+            PortfolioValueHistory(portfolio=cls.portfolio, record_date=today - timedelta(days=i),
+                                  total_value=Decimal(1000 + i))
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, path, data):
+        response = self.client.post(f'/portfolios/api/{path}', data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_create_portfolio(self):
+        data = self.post('create-portfolio/', {'name': 'New', 'benchmark_id': self.benchmark.id})
+        portfolio = Portfolio.objects.get(id=data['portfolio_id'])
+        self.assertEqual((portfolio.user, portfolio.name, portfolio.benchmark), (self.user, 'New', self.benchmark))
+        response = self.client.post('/portfolios/api/create-portfolio/', {'name': 'New'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_add_holding(self):
+        data = self.post('add-holding/', {
+            'portfolio_id': self.portfolio.id, 'symbol': self.stocks[2].symbol,
+            'quantity': '3', 'avg_buy_price': '102.00', 'buy_date': '2024-01-02',
+        })
+        holding = Holding.objects.get(id=data['holding_id'])
+        self.assertEqual((holding.portfolio, holding.stock), (self.portfolio, self.stocks[2]))
+        self.assertEqual((holding.quantity, holding.avg_buy_price), (Decimal(3), Decimal('102.00')))
+        self.assertEqual(self.portfolio.holdings.count(), 3)
+
+    def test_add_holding_to_someone_elses_portfolio(self):
+        other = Portfolio.objects.create(user=User.objects.create_user('other', 'other@example.com', 'pw'), name='Other',
+                                         benchmark=self.benchmark)
+        response = self.client.post('/portfolios/api/add-holding/', {
+            'portfolio_id': other.id, 'symbol': self.stocks[2].symbol, 'quantity': '3', 'avg_buy_price': '102.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(other.holdings.exists())
+
+    def test_add_transaction(self):
+        data = self.post('add-transaction/', {
+            'portfolio_id': self.portfolio.id, 'symbol': self.stocks[0].symbol, 'transaction_type': 'SELL',
+            'quantity': '1', 'price': '101.00', 'transaction_date': '2024-01-03',
+        })
+        tx = PortfolioTransaction.objects.get(id=data['transaction_id'])
+        self.assertEqual((tx.portfolio, tx.stock, tx.transaction_type), (self.portfolio, self.stocks[0], 'SELL'))
+        self.assertEqual((tx.price, tx.transaction_date), (Decimal('101.00'), date(2024, 1, 3)))
+
+    def test_list_transactions(self):
+        path = f'/portfolios/api/{self.portfolio.id}/transactions/'
+        first = self.client.get(path)
+        self.assertEqual(first.status_code, 200, first.content)
+        results = first.json()['results']
+        self.assertEqual(len(results), 50)
+        newest = PortfolioTransaction.objects.filter(portfolio=self.portfolio).order_by('-created_at', '-id')
+        self.assertEqual([row['id'] for row in results], [tx.id for tx in newest[:50]])
+
+        cursor = first.json()['next_cursor']
+        self.assertIsNotNone(cursor)
+        following = self.client.get(path, {'cursor': cursor, 'type': 'BUY', 'symbol': self.stocks[0].symbol})
+        self.assertEqual(following.status_code, 200, following.content)
+        # Every third transaction is in stocks[0]; the rest of them after the first page
+        expected = [tx.id for tx in newest[50:] if tx.stock_id == self.stocks[0].id]
+        self.assertEqual([row['id'] for row in following.json()['results']], expected)
+        self.assertEqual({row['symbol'] for row in following.json()['results']}, {self.stocks[0].symbol})
+        self.assertIsNone(following.json()['next_cursor'])
+
+    def test_transaction_pages_with_tied_timestamps(self):
+        # bulk_create gives every transaction nearly the same created_at; make groups of them equal
+        tied = timezone.now()
+        for n, pk in enumerate(PortfolioTransaction.objects.order_by('id').values_list('id', flat=True)):
+            PortfolioTransaction.objects.filter(id=pk).update(created_at=tied - timedelta(seconds=n // 7))
+        expected = list(PortfolioTransaction.objects.filter(portfolio=self.portfolio).order_by(
+            '-created_at', '-id').values_list('id', flat=True))
+        path = f'/portfolios/api/{self.portfolio.id}/transactions/'
+
+        pages, prev_cursors, cursor = [], [], None
+        while True:
+            data = self.client.get(path, {'limit': 8, **({'cursor': cursor} if cursor else {})}).json()
+            pages.append([row['id'] for row in data['results']])
+            prev_cursors.append(data['prev_cursor'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(sum(pages, []), expected)
+
+        for n in range(1, len(pages)):
+            data = self.client.get(path, {'limit': 8, 'cursor': prev_cursors[n]}).json()
+            self.assertEqual([row['id'] for row in data['results']], pages[n - 1], n)
+
+    def test_export(self):
+        expected = {
+            'transactions': (61, 'id,transaction_date,symbol,transaction_type,quantity,price,notes,created_at'),
+            'holdings': (3, 'id,symbol,name,quantity,avg_buy_price,buy_date,invested_value,current_value,'
+                            'gain_loss,weight_pct,updated_at'),
+            'value-history': (31, 'date,granularity,total_value,invested_value,daily_return,cumulative_return'),
+        }
+        for dataset, (lines, header) in expected.items():
+            response = self.client.get(f'/portfolios/api/{self.portfolio.id}/export/{dataset}.csv')
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content).decode().splitlines()
+            self.assertEqual(content[0], header, dataset)
+            self.assertEqual(len(content), lines, dataset)
+
+
+class SectorExposureTests(TestCase):
+    """The incrementally maintained table matches SectorExposure.rebuild() after every kind of change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('exposure', 'exposure@example.com', 'pw')
+        cls.sectors = [Sector.objects.create(name=f'Exposure {i}') for i in range(2)]
+        cls.stocks = [
+            Stock.objects.create(symbol=f'EXP{i}.NS', name=f'Exposure {i}', sector=cls.sectors[i % 2] if i < 3 else None)
+            for i in range(4)
+        ]
+        cls.portfolio = Portfolio.objects.create(user=cls.user, name='Exposure', benchmark=None)
+
+    def hold(self, stock, value):
+        return Holding.objects.create(portfolio=self.portfolio, stock=stock, quantity=Decimal(1), avg_buy_price=Decimal(value),
+                                      current_value=Decimal(value), invested_value=Decimal(value))
+
+    def exposure(self):
+        return sorted(SectorExposure.objects.filter(portfolio=self.portfolio).values_list(
+            'sector_id', 'holdings_count', 'current_value', 'invested_value'), key=str)
+
+    def assertMatchesRebuild(self, expected_rows):
+        maintained = self.exposure()
+        SectorExposure.rebuild([self.portfolio.id])
+        self.assertEqual(maintained, self.exposure())
+        self.assertEqual(len(maintained), expected_rows)
+
+    def test_add(self):
+        for i, stock in enumerate(self.stocks):
+            self.hold(stock, 100 + i)
+        self.assertMatchesRebuild(3)
+        self.assertEqual(SectorExposure.allocation(self.portfolio.id), {
+            'Exposure 0': 49.75, 'Exposure 1': 24.88, SectorExposure.UNKNOWN: 25.37,
+        })
+
+    def test_update(self):
+        holding = self.hold(self.stocks[0], 100)
+        self.hold(self.stocks[2], 50)
+        holding.current_value = Decimal('180.50')
+        holding.save()
+        self.assertMatchesRebuild(1)
+        self.assertEqual(self.exposure(), [(self.sectors[0].id, 2, Decimal('230.50'), Decimal('150.00'))])
+
+    def test_update_fields_leaves_out_unsaved_values(self):
+        holding = self.hold(self.stocks[0], 100)
+        holding.current_value = Decimal(120)
+        holding.invested_value = Decimal(999)
+        holding.save(update_fields=['current_value'])
+        self.assertMatchesRebuild(1)
+
+    def test_sector_change(self):
+        holding = self.hold(self.stocks[0], 100)
+        self.hold(self.stocks[2], 50)
+        holding.stock = self.stocks[1]
+        holding.save()
+        self.assertMatchesRebuild(2)
+
+    def test_delete(self):
+        holding = self.hold(self.stocks[0], 100)
+        self.hold(self.stocks[1], 50)
+        holding.delete()
+        self.assertMatchesRebuild(1)
+
+    def test_queryset_delete(self):
+        for i, stock in enumerate(self.stocks):
+            self.hold(stock, 100 + i)
+        Holding.objects.filter(stock__in=self.stocks[:2]).delete()
+        self.assertMatchesRebuild(2)
+
+    def test_stock_cascade(self):
+        for i, stock in enumerate(self.stocks):
+            self.hold(stock, 100 + i)
+        self.stocks[3].delete()
+        self.assertMatchesRebuild(2)
 
-# Create your tests here.
+    def test_portfolio_delete(self):
+        for i, stock in enumerate(self.stocks):
+            self.hold(stock, 100 + i)
+        with CaptureQueriesContext(connection) as queries:
+            self.portfolio.delete()
+        self.assertFalse(SectorExposure.objects.exists())
+        # The rows cascade with the portfolio; no per-holding delta or rebuild
+        touching = [q['sql'] for q in queries if 'portfolios_sectorexposure' in q['sql']]
+        self.assertEqual(len(touching), 1, touching)
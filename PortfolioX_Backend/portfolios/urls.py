@@ -5,4 +5,6 @@ urlpatterns = [
     path('api/create-portfolio/', views.create_portfolio),
     path('api/add-holding/', views.add_holding),
     path('api/add-transaction/', views.add_transaction),
+    path('api/<int:portfolio_id>/transactions/', views.list_transactions),
+    path('api/<int:portfolio_id>/export/<slug:dataset>.<slug:fmt>', views.export_portfolio_data),
 ]
@@ -1,10 +1,19 @@
-from django.shortcuts import render
-from rest_framework.decorators import api_view
+from datetime import date
+from django.db.models import F
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from portfolios.exports import DATASETS
 from portfolios.models import Portfolio, Holding, PortfolioTransaction
 from market.models import Stock
+from core.exports import CONTENT_TYPES, export_view, stream_export
+from core.pagination import choice_param, date_param, keyset_page
+from core.querybudget import query_budget
 
 @api_view(['POST'])
+@query_budget(1)
 def create_portfolio(request):
     user = request.user
     data = request.data
@@ -24,6 +33,7 @@ def create_portfolio(request):
     return Response({'portfolio_id': portfolio.id, 'name': portfolio.name})
 
 @api_view(['POST'])
+@query_budget(7)
 def add_holding(request):
     user = request.user
     data = request.data
@@ -46,6 +56,7 @@ def add_holding(request):
     return Response({'holding_id': holding.id})
 
 @api_view(['POST'])
+@query_budget(3)
 def add_transaction(request):
     user = request.user
     data = request.data
@@ -68,3 +79,54 @@ def add_transaction(request):
         transaction_date=transaction_date
     )
     return Response({'transaction_id': tx.id})
+
+@api_view(['GET'])
+@export_view
+@permission_classes([IsAuthenticated])
+@query_budget(3)
+def export_portfolio_data(request, portfolio_id, dataset, fmt):
+    """Stream transactions, holdings or value-history as CSV or NDJSON.
+
+    The rows are read while the response streams, after the budgeted part of
+    the view (see core.exports).
+    """
+    if dataset not in DATASETS or fmt not in CONTENT_TYPES:
+        raise Http404(f"No {dataset}.{fmt} export")
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+
+    columns, parts = DATASETS[dataset](portfolio.id)
+    filename = f'portfolio-{portfolio.id}-{dataset}-{date.today():%Y%m%d}'
+    return stream_export(request, parts, columns, filename, fmt)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@query_budget(2)
+def list_transactions(request, portfolio_id):
+    """The portfolio's transactions, newest entry first, a keyset page at a time.
+
+    Filters: ?type=BUY|SELL, ?symbol=, and ?since= / ?until= (YYYY-MM-DD,
+    inclusive) on the transaction date. Pass the returned next_cursor (or
+    prev_cursor) as ?cursor= for the following (or preceding) page.
+    """
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    transactions = PortfolioTransaction.objects.filter(portfolio=portfolio)
+
+    transaction_type = choice_param(request, 'type', PortfolioTransaction.TYPE_CHOICES)
+    if transaction_type:
+        transactions = transactions.filter(transaction_type=transaction_type)
+    if request.GET.get('symbol'):
+        transactions = transactions.filter(stock__symbol=request.GET['symbol'])
+    since, until = date_param(request, 'since'), date_param(request, 'until')
+    if since:
+        transactions = transactions.filter(transaction_date__gte=since)
+    if until:
+        transactions = transactions.filter(transaction_date__lte=until)
+
+    rows, next_cursor, prev_cursor = keyset_page(transactions.values(
+        'id', 'transaction_date', 'transaction_type', 'quantity', 'price', 'notes', 'created_at',
+        symbol=F('stock__symbol'),
+    ), request)
+    return Response({
+        'portfolio_id': portfolio.id, 'results': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor,
+    })